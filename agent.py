@@ -0,0 +1,26 @@
+from dotenv import load_dotenv
+import asyncio
+import os
+import pathlib
+from app.internal.settings import Settings
+from app.utils.workeragent import WorkerAgent
+
+BASEDIR = pathlib.Path().resolve()
+os.environ["APP_INSTALLDIR"] = os.path.dirname(os.path.abspath(__file__))
+load_dotenv(
+    pathlib.Path(os.getenv("APP_INSTALLDIR")).joinpath(".env"),
+    override=True,
+)
+Settings.read_environments()
+
+
+if __name__ == "__main__":
+    agent = WorkerAgent(
+        Settings.agent_listen,
+        Settings.agent_slots,
+        Settings.agent_memory,
+        Settings.cpu_affinity,
+        Settings.agent_token,
+        Settings.sampling_interval,
+    )
+    asyncio.run(agent.serve_forever())
@@ -1,11 +1,80 @@
 from abc import ABC, abstractmethod
+import asyncio
+import functools
 import os
+import stat
 from pathlib import Path
-from typing import Dict, List, Union, Type
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from typing import Union, Type
 
 from app.internal.httpresponse import HTTPResponse
 from app.internal.settings import Settings
 from app.models.program import Program
+from app.utils.programrules import ProgramRule, compile_rules
+
+RULES_DIRECTORY = Path(__file__).resolve().parents[2].joinpath("rules")
+
+
+def scan(
+    path: Path, entry: Optional[str] = None
+) -> List[Tuple[str, bool, bool]]:
+    """
+    Lists the entries of a directory, with whether each one is a
+    directory or a file. The type comes from the directory listing
+    itself on most filesystems, so entries are not stat'ed one by one,
+    which is costly on NFS. Runs in a thread, outside the event loop.
+
+    :param path: The directory
+    :param entry: The only entry of interest, which is stat'ed
+        instead of listing the whole directory
+    :return: The name of each entry and if it is a directory or a file
+    :rtype: List[Tuple[str, bool, bool]]
+    """
+    if entry is not None:
+        if os.sep in entry or entry in [os.curdir, os.pardir]:
+            return []
+        try:
+            mode = os.stat(path.joinpath(entry)).st_mode
+        except FileNotFoundError:
+            # Raises if the directory itself does not exist
+            os.stat(path)
+            return []
+        return [(entry, stat.S_ISDIR(mode), stat.S_ISREG(mode))]
+    with os.scandir(path) as entries:
+        return [(e.name, e.is_dir(), e.is_file()) for e in entries]
+
+
+def program_id(idPrefix: str, version: str) -> str:
+    """
+    The id of a program version, which is the same in every listing
+    as long as the version is installed.
+    """
+    return f"{idPrefix}-{version}"
+
+
+async def gather_programs(
+    listers: Dict[str, Callable[..., Awaitable]],
+    name: Optional[str] = None,
+    version: Optional[str] = None,
+) -> Union[List[Program], HTTPResponse]:
+    """
+    Lists the versions of all the programs concurrently, skipping
+    the programs that do not have the given name.
+
+    :param listers: The function that lists each program, given
+        an optional version
+    :return: The programs, in the order of the listers
+    :rtype: Union[List[Program], HTTPResponse]
+    """
+    results = await asyncio.gather(
+        *[f(version) for n, f in listers.items() if name in [None, n]]
+    )
+    programs: List[Program] = []
+    for r in results:
+        if isinstance(r, HTTPResponse):
+            return r
+        programs += r
+    return programs
 
 
 class AbstractProgramPathRepository(ABC):
@@ -13,216 +82,160 @@ class AbstractProgramPathRepository(ABC):
 
     @classmethod
     @abstractmethod
-    async def list_programs(cls) -> Union[List[Program], HTTPResponse]:
+    async def list_programs(
+        cls, name: Optional[str] = None, version: Optional[str] = None
+    ) -> Union[List[Program], HTTPResponse]:
+        """
+        Lists the programs, only looking for the ones with the given
+        name and version when these are informed.
+        """
         pass
 
+    @classmethod
+    def roots(cls) -> List[Path]:
+        """
+        The directories where the programs are installed, each one
+        with a file or subdirectory for each version.
+        """
+        return []
+
 
-class PEMAWSProgramPathRepository(AbstractProgramPathRepository):
+class RulesProgramPathRepository(AbstractProgramPathRepository):
     """
-    Implements the installation patter for managed programs
-    in the PEM AWS setup.
-
-    The main premises are:
-        - A root path for all the managed programs
-        - A subfolder with each program name
-        - A second level of subfolders with the versions
-        - Each version containing an mpi_program*.job file
+    Implements the installation patterns declared in the rules file
+    given by PROGRAM_RULES, so that new programs and layouts do not
+    need changes in the code.
+
+    The rules are compiled once, and each program root is listed
+    with only the entries matching its rule being looked into.
     """
 
-    ROOT_PROGRAM_PATH = Path("/home/pem/versoes")
-    NEWAVE_PATH = ROOT_PROGRAM_PATH.joinpath("NEWAVE")
-    DECOMP_PATH = ROOT_PROGRAM_PATH.joinpath("DECOMP")
+    RULES: Optional[List[ProgramRule]] = None
+    RULES_FILE: Optional[Path] = None
 
     @classmethod
-    async def __list_program(
-        cls,
-        idPrefix: str,
-        programPath: Path,
-        name: str,
-        args: List[str],
-        execPattern: str,
-    ) -> Union[List[Program], HTTPResponse]:
-        programs: List[Program] = []
-        if not os.path.isdir(programPath):
-            return HTTPResponse(
-                code=500,
-                detail=f"program path not found: {cls.ROOT_PROGRAM_PATH}",
-            )
-        versions = os.listdir(programPath)
-        for i, v in enumerate(versions):
-            versionPath = programPath.joinpath(v)
-            if not os.path.isdir(versionPath):
-                continue
-            execFiles = [
-                f for f in os.listdir(versionPath) if execPattern in f
-            ]
-            if len(execFiles) != 1:
-                continue
-            programs.append(
-                Program(
-                    programId=f"{idPrefix}{i}",
-                    name=name,
-                    clusterId=Settings.clusterId,
-                    version=v,
-                    installationDirectory=str(versionPath),
-                    isManaged=True,
-                    args=args,
-                    executablePath=str(versionPath.joinpath(execFiles[0])),
-                )
-            )
-        return programs
+    def load(cls, path: str):
+        cls.RULES = compile_rules(path)
 
     @classmethod
-    async def __list_newave(cls) -> Union[List[Program], HTTPResponse]:
-        return await PEMAWSProgramPathRepository.__list_program(
-            "NW", cls.NEWAVE_PATH, "NEWAVE", ["N_PROC"], "mpi_newave"
-        )
+    def rules(cls) -> List[ProgramRule]:
+        if cls.RULES is None:
+            if cls.RULES_FILE is not None:
+                cls.load(str(cls.RULES_FILE))
+            else:
+                cls.load(Settings.program_rules)
+        return cls.RULES or []
 
     @classmethod
-    async def __list_decomp(cls) -> Union[List[Program], HTTPResponse]:
-        return await PEMAWSProgramPathRepository.__list_program(
-            "DC", cls.DECOMP_PATH, "DECOMP", ["N_PROC"], "mpi_decomp"
-        )
+    def roots(cls) -> List[Path]:
+        return [r.root for r in cls.rules()]
 
     @classmethod
-    async def list_programs(cls) -> Union[List[Program], HTTPResponse]:
-        newave = await cls.__list_newave()
-        if isinstance(newave, HTTPResponse):
-            return newave
-        decomp = await cls.__list_decomp()
-        if isinstance(decomp, HTTPResponse):
-            return decomp
-        return newave + decomp
-
-
-class TuberProgramPathRepository(AbstractProgramPathRepository):
-    """
-    Implements the installation patter for managed programs
-    in the PEM AWS setup using the 'tuber' CLI tool.
-
-    The main premises are:
-        - A root path for all the managed programs
-        - A subfolder with each program name
-        - A second level of subfolders with the versions
-        - Each version containing an mpi_program*.job file
-    """
-
-    ROOT_PROGRAM_PATH = Path("/home/pem/versoes")
-    NEWAVE_PATH = ROOT_PROGRAM_PATH.joinpath("NEWAVE")
-    DECOMP_PATH = ROOT_PROGRAM_PATH.joinpath("DECOMP")
-    DESSEM_PATH = Path("/home/SW/dessem")
-    NEWAVE_TUBER_JOB = "/home/pem/rotinas/hpc-model-utils/jobs/mpi_newave.job"
-    DECOMP_TUBER_JOB = "/home/pem/rotinas/hpc-model-utils/jobs/mpi_decomp.job"
-    DESSEM_TUBER_JOB = "/home/ESTUDO/PEM/git/hpc-model-utils/jobs/dessem.sh"
+    async def __list_rule(
+        cls, rule: ProgramRule, version: Optional[str] = None
+    ) -> Union[List[Program], HTTPResponse]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, cls.__scan_rule, rule, version)
 
     @classmethod
-    async def __list_program(
-        cls,
-        idPrefix: str,
-        programPath: Path,
-        name: str,
-        args: List[str],
-        execPattern: str,
+    def __scan_rule(
+        cls, rule: ProgramRule, version: Optional[str] = None
     ) -> Union[List[Program], HTTPResponse]:
         programs: List[Program] = []
-        if not os.path.isdir(programPath):
+        entry = None
+        if version is not None:
+            entry = rule.entry_of(version)
+            if entry is None:
+                return []
+        try:
+            entries = scan(rule.root, entry)
+        except OSError:
+            if rule.required:
+                return HTTPResponse(
+                    code=500, detail=f"program path not found: {rule.root}"
+                )
             return []
-        versions = os.listdir(programPath)
-        for i, v in enumerate(versions):
-            versionPath = programPath.joinpath(v)
-            if not os.path.isdir(str(versionPath)):
+        for e, isDir, isFile in entries:
+            groups = rule.match(e)
+            if groups is None:
                 continue
-            execTuber = execPattern + " " + v[1:]
+            if not (isDir if rule.kind == "directory" else isFile):
+                continue
+            versionPath = rule.root.joinpath(e)
+            executable = None
+            if rule.executable is not None:
+                try:
+                    files = scan(versionPath)
+                except OSError:
+                    continue
+                execFiles = [
+                    f
+                    for f, _, isF in files
+                    if isF and rule.executable.search(f)
+                ]
+                if len(execFiles) != 1:
+                    continue
+                executable = str(versionPath.joinpath(execFiles[0]))
+            v = groups["version"]
             programs.append(
                 Program(
-                    programId=f"{idPrefix}{i}",
-                    name=name,
+                    programId=program_id(rule.idPrefix, v),
+                    name=rule.name,
                     clusterId=Settings.clusterId,
                     version=v,
                     installationDirectory=str(versionPath),
                     isManaged=True,
-                    args=args,
-                    executablePath=str(execTuber),
+                    args=rule.args,
+                    executablePath=rule.command_of(
+                        str(versionPath), groups, executable
+                    ),
                 )
             )
         return programs
 
     @classmethod
-    async def __list_executables(
-        cls,
-        idPrefix: str,
-        programPath: Path,
-        name: str,
-        args: List[str],
-        execPattern: str,
+    async def list_programs(
+        cls, name: Optional[str] = None, version: Optional[str] = None
     ) -> Union[List[Program], HTTPResponse]:
-        programs: List[Program] = []
-        if not os.path.isdir(programPath):
-            return []
-        versions = os.listdir(programPath)
-        for i, v in enumerate(versions):
-            versionPath = programPath.joinpath(v)
-            if not os.path.isfile(str(versionPath)):
-                continue
-            namePattern = name.lower() + "_"
-            if namePattern not in v:
-                continue
-            versionName = v.split(namePattern)[1]
-            execTuber = execPattern + " " + versionName
-            programs.append(
-                Program(
-                    programId=f"{idPrefix}{i}",
-                    name=name,
-                    clusterId=Settings.clusterId,
-                    version=versionName,
-                    installationDirectory=str(versionPath),
-                    isManaged=True,
-                    args=args,
-                    executablePath=execTuber,
-                )
-            )
-        return programs
+        listers = {
+            r.name: functools.partial(cls.__list_rule, r) for r in cls.rules()
+        }
+        return await gather_programs(listers, name, version)
 
-    @classmethod
-    async def __list_newave(cls) -> Union[List[Program], HTTPResponse]:
-        return await TuberProgramPathRepository.__list_program(
-            "NW", cls.NEWAVE_PATH, "NEWAVE", ["N_PROC"], cls.NEWAVE_TUBER_JOB
-        )
 
-    @classmethod
-    async def __list_decomp(cls) -> Union[List[Program], HTTPResponse]:
-        return await TuberProgramPathRepository.__list_program(
-            "DC", cls.DECOMP_PATH, "DECOMP", ["N_PROC"], cls.DECOMP_TUBER_JOB
-        )
+class PEMAWSProgramPathRepository(RulesProgramPathRepository):
+    """
+    Implements the installation pattern for managed programs
+    in the PEM AWS setup, declared in the bundled rules/pemaws.json:
+    a subfolder with each version, containing a single
+    mpi_program*.job file.
+    """
 
-    @classmethod
-    async def __list_dessem(cls) -> Union[List[Program], HTTPResponse]:
-        return await TuberProgramPathRepository.__list_executables(
-            "DS", cls.DESSEM_PATH, "DESSEM", [], cls.DESSEM_TUBER_JOB
-        )
+    RULES = None
+    RULES_FILE = RULES_DIRECTORY.joinpath("pemaws.json")
 
-    @classmethod
-    async def list_programs(cls) -> Union[List[Program], HTTPResponse]:
-        newave = await cls.__list_newave()
-        if isinstance(newave, HTTPResponse):
-            return newave
-        decomp = await cls.__list_decomp()
-        if isinstance(decomp, HTTPResponse):
-            return decomp
-        dessem = await cls.__list_dessem()
-        if isinstance(dessem, HTTPResponse):
-            return dessem
-        return newave + decomp + dessem
+
+class TuberProgramPathRepository(RulesProgramPathRepository):
+    """
+    Implements the installation pattern for managed programs
+    in the PEM AWS setup using the 'tuber' CLI tool, declared in
+    the bundled rules/tuber.json.
+    """
+
+    RULES = None
+    RULES_FILE = RULES_DIRECTORY.joinpath("tuber.json")
 
 
 class TestProgramPathRepository(AbstractProgramPathRepository):
     """ """
 
     @classmethod
-    async def list_programs(cls) -> Union[List[Program], HTTPResponse]:
-        return [
+    async def list_programs(
+        cls, name: Optional[str] = None, version: Optional[str] = None
+    ) -> Union[List[Program], HTTPResponse]:
+        programs = [
             Program(
-                programId="NW1",
+                programId="NW-29",
                 name="NEWAVE",
                 clusterId="0",
                 version="29",
@@ -232,7 +245,7 @@ class TestProgramPathRepository(AbstractProgramPathRepository):
                 args=["N_PROC"],
             ),
             Program(
-                programId="DC1",
+                programId="DC-29",
                 name="DECOMP",
                 clusterId="0",
                 version="29",
@@ -242,11 +255,17 @@ class TestProgramPathRepository(AbstractProgramPathRepository):
                 args=["N_PROC"],
             ),
         ]
+        return [
+            p
+            for p in programs
+            if name in [None, p.name] and version in [None, p.version]
+        ]
 
 
 SUPPORTED_PATHS: Dict[str, Type[AbstractProgramPathRepository]] = {
     "PEMAWS": PEMAWSProgramPathRepository,
     "TUBER": TuberProgramPathRepository,
+    "RULES": RulesProgramPathRepository,
     "TEST": TestProgramPathRepository,
 }
 DEFAULT = PEMAWSProgramPathRepository
@@ -1,17 +1,28 @@
+import asyncio
 from abc import ABC, abstractmethod
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Dict, List, Union, Type
-from os.path import isdir
+from typing import Any, Dict, List, Optional, Tuple, Union, Type
+from os.path import isdir, sep
 from app.internal.settings import Settings
 from app.internal.fs import set_directory
 from app.internal.httpresponse import HTTPResponse
 from app.models.job import Job, JobStatus
-from app.models.resourceusage import ResourceUsage
+from app.models.jobarray import JobArray, JobArrayStatus
+from app.models.joboutput import JobOutput
+from app.models.queue import Queue
+from app.models.workflow import Workflow, WorkflowStatus
 from app.internal.terminal import run_terminal_retry
+from app.internal.timing import span
 from app.utils.taskscheduler import TaskScheduler
+from app.utils.jobarray import array_size, write_array_script
+from app.utils.workflow import stage_order
 import xml.etree.ElementTree as ET
 
+# The fields of a job read from the scheduler output, turned into
+# a Job apart from the parsing, so that each is timed on its own
+JobRecord = Dict[str, Any]
+
 
 class AbstractSchedulerRepository(ABC):
     """ """
@@ -41,10 +52,184 @@ class AbstractSchedulerRepository(ABC):
     async def stop_job(jobId: str) -> Union[Job, HTTPResponse]:
         pass
 
+    @staticmethod
+    @abstractmethod
+    async def get_job_output(
+        jobId: str,
+        tail: Optional[int] = None,
+        offset: Optional[int] = None,
+        length: Optional[int] = None,
+    ) -> Union[JobOutput, HTTPResponse]:
+        pass
+
+    @staticmethod
+    @abstractmethod
+    async def list_queues() -> Union[List[Queue], HTTPResponse]:
+        pass
+
+    @staticmethod
+    @abstractmethod
+    async def submit_job_array(
+        array: JobArray,
+    ) -> Union[JobArrayStatus, HTTPResponse]:
+        pass
+
+    @staticmethod
+    @abstractmethod
+    async def get_job_array(
+        arrayId: str,
+    ) -> Union[JobArrayStatus, HTTPResponse]:
+        pass
+
+    @staticmethod
+    @abstractmethod
+    async def submit_workflow(
+        workflow: Workflow,
+    ) -> Union[WorkflowStatus, HTTPResponse]:
+        pass
+
+
+def invalid_priority(
+    job: Job, lowest: int, highest: int
+) -> Optional[HTTPResponse]:
+    """
+    Checks that the priority of a job is in the range accepted
+    by the scheduler.
+
+    :param job: The job
+    :param lowest: The lowest priority accepted
+    :param highest: The highest priority accepted
+    :return: The error response, or None if the priority is valid
+    :rtype: Optional[HTTPResponse]
+    """
+    if job.priority is None or lowest <= job.priority <= highest:
+        return None
+    return HTTPResponse(
+        code=400, detail=f"priority must be between {lowest} and {highest}"
+    )
+
+
+def invalid_submission(
+    job: Job, priorities: Tuple[int, int]
+) -> Optional[HTTPResponse]:
+    """
+    Checks the fields needed for submitting a job to SGE or Torque,
+    naming the job after its working directory if it has no name.
+    The dependencies are passed to qsub through the shell, so only
+    numeric job ids are accepted.
+
+    :param job: The job
+    :param priorities: The lowest and highest priorities accepted
+    :return: The error response, or None if the job is valid
+    :rtype: Optional[HTTPResponse]
+    """
+    if not job.workingDirectory:
+        return HTTPResponse(code=400, detail="workingDirectory is mandatory")
+    if not job.name:
+        job.name = Path(job.workingDirectory).parts[-1]
+    if not job.reservedSlots:
+        return HTTPResponse(code=400, detail="reservedSlots is mandatory")
+    if not job.scriptFile:
+        return HTTPResponse(code=400, detail="scriptFile is mandatory")
+    invalid = invalid_priority(job, *priorities)
+    if invalid is not None:
+        return invalid
+    for dependency in job.dependencies or []:
+        if not (dependency.isascii() and dependency.isdigit()):
+            return HTTPResponse(
+                code=400,
+                detail=f"dependency {dependency} is not a job id",
+            )
+    if not isdir(job.workingDirectory):
+        return HTTPResponse(
+            code=400,
+            detail=f"directory {job.workingDirectory} does not exist",
+        )
+    return None
+
+
+def invalid_array(array: JobArray) -> Optional[HTTPResponse]:
+    """
+    Checks that the tasks of an array are given consistently and
+    that their working directories exist. The command of each task
+    is written as a single line of the tasks file of SGE and Torque,
+    so line breaks are not accepted.
+
+    :param array: The job array
+    :return: The error response, or None if the array is valid
+    :rtype: Optional[HTTPResponse]
+    """
+    if not array_size(array):
+        return HTTPResponse(
+            code=400,
+            detail="workingDirectories or args are mandatory "
+            + "and must have the same size",
+        )
+    template = array.template
+    values = [
+        str(template.workingDirectory),
+        str(template.scriptFile),
+        *(template.args or []),
+        *(array.workingDirectories or []),
+        *[a for args in array.args or [] for a in args],
+    ]
+    if any(["\n" in v for v in values]):
+        return HTTPResponse(
+            code=400,
+            detail="workingDirectories and args cannot contain line breaks",
+        )
+    for directory in array.workingDirectories or []:
+        if not isdir(directory):
+            return HTTPResponse(
+                code=400, detail=f"directory {directory} does not exist"
+            )
+    return None
+
+
+async def submit_stages(
+    repository: Type[AbstractSchedulerRepository], workflow: Workflow
+) -> Union[WorkflowStatus, HTTPResponse]:
+    """
+    Submits the stages of a workflow in order, each one depending on
+    the jobs of the stages before it. If a submission fails, the jobs
+    already submitted are stopped.
+
+    :param repository: The repository the jobs are submitted to
+    :param workflow: The workflow
+    :return: The ids of the jobs, by stage name
+    :rtype: Union[WorkflowStatus, HTTPResponse]
+    """
+    stages = stage_order(workflow)
+    if stages is None:
+        return HTTPResponse(
+            code=400,
+            detail="stage names must be unique and stages must depend "
+            + "only on existing stages, without cycles",
+        )
+    jobIds: Dict[str, str] = {}
+    for stage in stages:
+        job = stage.job
+        job.dependencies = [
+            *(job.dependencies or []),
+            *[jobIds[a] for a in stage.after or []],
+        ]
+        ans = await repository.submit_job(job)
+        if isinstance(ans, HTTPResponse):
+            for jobId in reversed(list(jobIds.values())):
+                await repository.stop_job(jobId)
+            return HTTPResponse(
+                code=ans.code, detail=f"stage {stage.name}: {ans.detail}"
+            )
+        jobIds[stage.name] = str(ans.jobId)
+    return WorkflowStatus(jobs=jobIds)
+
 
 class SGESchedulerRepository(AbstractSchedulerRepository):
     """"""
 
+    # Only operators may give jobs priorities above 0
+    PRIORITIES = (-1023, 0)
+
     STATUS_MAPPING: Dict[str, JobStatus] = {
         "q": JobStatus.START_REQUESTED,
         "qw": JobStatus.START_REQUESTED,
@@ -58,9 +243,9 @@ class SGESchedulerRepository(AbstractSchedulerRepository):
 
     @staticmethod
     async def list_jobs() -> Union[List[Job], HTTPResponse]:
-        def __parse_list_jobs(content: str) -> List[Job]:
+        def __parse_list_jobs(content: str) -> List[JobRecord]:
             root = ET.fromstring(content)
-            jobs: List[Job] = []
+            jobs: List[JobRecord] = []
             for job_xml in root[0]:
                 state = job_xml.find("state")
                 jatStart = job_xml.find("JAT_start_time")
@@ -87,7 +272,7 @@ class SGESchedulerRepository(AbstractSchedulerRepository):
                 if jobId is None or name is None or reservedSlots is None:
                     continue
                 jobs.append(
-                    Job(
+                    dict(
                         jobId=str(jobId),
                         name=str(name),
                         status=status,
@@ -108,11 +293,14 @@ class SGESchedulerRepository(AbstractSchedulerRepository):
         if cod != 0:
             return HTTPResponse(code=500, detail=f"error running qstat: {ans}")
         else:
-            return __parse_list_jobs(ans)
+            with span("parse"):
+                records = __parse_list_jobs(ans)
+            with span("model"):
+                return [Job(**r) for r in records]
 
     @staticmethod
     async def get_job(jobId: str) -> Union[Job, HTTPResponse]:
-        def __parse_get_job(content: str) -> Union[Job, HTTPResponse]:
+        def __parse_get_job(content: str) -> Union[JobRecord, HTTPResponse]:
             try:
                 root = ET.fromstring(content)
             except Exception:
@@ -242,7 +430,7 @@ class SGESchedulerRepository(AbstractSchedulerRepository):
             # converts total memory from B to GB
             B_TO_GB = 1073741824
             usage = (
-                ResourceUsage(
+                dict(
                     cpuSeconds=sum([u.get("cpu", 0.0) for u in usages]),
                     memoryCpuSeconds=sum([u.get("mem", 0.0) for u in usages]),
                     instantTotalMemory=sum(
@@ -258,7 +446,7 @@ class SGESchedulerRepository(AbstractSchedulerRepository):
                 if len(usages) > 0
                 else None
             )
-            return Job(
+            return dict(
                 jobId=str(jobId),
                 status=status,
                 name=str(name),
@@ -279,17 +467,19 @@ class SGESchedulerRepository(AbstractSchedulerRepository):
                 code=500, detail=f"error running qstat command: {ans}"
             )
         else:
-            detailedJob = __parse_get_job(ans)
+            with span("parse"):
+                detailedJob = __parse_get_job(ans)
             if isinstance(detailedJob, HTTPResponse):
                 return HTTPResponse(
                     code=500, detail="error parsing qstat -j result"
                 )
             else:
-                return detailedJob
+                with span("model"):
+                    return Job(**detailedJob)
 
     @staticmethod
     async def get_finished_job(jobId: str) -> Union[Job, HTTPResponse]:
-        def __parse_get_job(content: str) -> Union[Job, HTTPResponse]:
+        def __parse_get_job(content: str) -> Union[JobRecord, HTTPResponse]:
             # Iterates for getting info in the nodes
             nameStr = "jobname  "
             startTimeStr = "start_time  "
@@ -353,7 +543,7 @@ class SGESchedulerRepository(AbstractSchedulerRepository):
                 )
 
             memUsage = float(mem / cpu * slots if cpu > 0.0 else 0.0)
-            usage = ResourceUsage(
+            usage = dict(
                 cpuSeconds=cpu,
                 memoryCpuSeconds=mem,
                 instantTotalMemory=memUsage,
@@ -363,7 +553,7 @@ class SGESchedulerRepository(AbstractSchedulerRepository):
                 timeInstant=endTime,
             )
 
-            return Job(
+            return dict(
                 jobId=jobId,
                 status=JobStatus.STOPPED,
                 name=str(name),
@@ -382,8 +572,27 @@ class SGESchedulerRepository(AbstractSchedulerRepository):
         if cod != 0:
             return HTTPResponse(code=404, detail=f"job {jobId} not found")
         else:
-            detailedJob = __parse_get_job(ans)
-            return detailedJob
+            with span("parse"):
+                detailedJob = __parse_get_job(ans)
+            if isinstance(detailedJob, HTTPResponse):
+                return detailedJob
+            with span("model"):
+                return Job(**detailedJob)
+
+    @staticmethod
+    def _limits(job: Job) -> List[str]:
+        """
+        The qsub options for the walltime, priority and
+        dependencies of a job.
+        """
+        limits = []
+        if job.walltime:
+            limits += ["-l", f"h_rt={job.walltime}"]
+        if job.priority is not None:
+            limits += ["-p", str(job.priority)]
+        if job.dependencies:
+            limits += ["-hold_jid", ",".join(job.dependencies)]
+        return limits
 
     @staticmethod
     async def submit_job(job: Job) -> Union[Job, HTTPResponse]:
@@ -391,17 +600,11 @@ class SGESchedulerRepository(AbstractSchedulerRepository):
             job.jobId = content.split("Your job")[1].split("(")[0].strip()
             job.name = content.split("(")[1].split(")")[0].strip('"')
 
-        if not job.workingDirectory:
-            return HTTPResponse(
-                code=400, detail="workingDirectory is mandatory"
-            )
-        if not job.name:
-            job.name = Path(job.workingDirectory).parts[-1]
-        if not job.reservedSlots:
-            return HTTPResponse(code=400, detail="reservedSlots is mandatory")
-        if not job.scriptFile:
-            return HTTPResponse(code=400, detail="scriptFile is mandatory")
+        invalid = invalid_submission(job, SGESchedulerRepository.PRIORITIES)
+        if invalid is not None:
+            return invalid
         args = job.args if job.args is not None else []
+        limits = SGESchedulerRepository._limits(job)
         command = [
             "qsub",
             "-cwd",
@@ -411,14 +614,10 @@ class SGESchedulerRepository(AbstractSchedulerRepository):
             "-pe",
             "orte",
             str(job.reservedSlots),
+            *limits,
             job.scriptFile,
             *args,
         ]
-        if not isdir(job.workingDirectory):
-            return HTTPResponse(
-                code=400,
-                detail=f"directory {job.workingDirectory} does not exist",
-            )
         with set_directory(job.workingDirectory):
             cod, ans = await run_terminal_retry(command)
         if cod != 0:
@@ -454,10 +653,81 @@ class SGESchedulerRepository(AbstractSchedulerRepository):
                 resourceUsage=None,
             )
 
+    @staticmethod
+    async def get_job_output(
+        jobId: str,
+        tail: Optional[int] = None,
+        offset: Optional[int] = None,
+        length: Optional[int] = None,
+    ) -> Union[JobOutput, HTTPResponse]:
+        return HTTPResponse(
+            code=501, detail="job output is not supported by SGE"
+        )
+
+    @staticmethod
+    async def list_queues() -> Union[List[Queue], HTTPResponse]:
+        return HTTPResponse(code=501, detail="queues are not supported by SGE")
+
+    @staticmethod
+    async def submit_job_array(
+        array: JobArray,
+    ) -> Union[JobArrayStatus, HTTPResponse]:
+        job = array.template
+        invalid = invalid_array(array)
+        if invalid is not None:
+            return invalid
+        size = array_size(array) or 0
+        invalid = invalid_submission(job, SGESchedulerRepository.PRIORITIES)
+        if invalid is not None:
+            return invalid
+        limits = SGESchedulerRepository._limits(job)
+        scriptFile = write_array_script(array, f"{job.name}.array")
+        command = [
+            "qsub",
+            "-cwd",
+            "-V",
+            "-N",
+            job.name,
+            "-pe",
+            "orte",
+            str(job.reservedSlots),
+            *limits,
+            "-t",
+            f"1-{size}",
+            scriptFile,
+        ]
+        with set_directory(job.workingDirectory):
+            cod, ans = await run_terminal_retry(command)
+        if cod != 0:
+            return HTTPResponse(
+                code=500, detail=f"error running qsub command: {ans}"
+            )
+        return JobArrayStatus(
+            arrayId=ans.split("Your job-array")[1].split(".")[0].strip(),
+            tasks=size,
+            status={JobStatus.START_REQUESTED.value: f"1-{size}"},
+        )
+
+    @staticmethod
+    async def get_job_array(
+        arrayId: str,
+    ) -> Union[JobArrayStatus, HTTPResponse]:
+        return HTTPResponse(
+            code=501, detail="job array status is not supported by SGE"
+        )
+
+    @staticmethod
+    async def submit_workflow(
+        workflow: Workflow,
+    ) -> Union[WorkflowStatus, HTTPResponse]:
+        return await submit_stages(SGESchedulerRepository, workflow)
+
 
 class TorqueSchedulerRepository(AbstractSchedulerRepository):
     """"""
 
+    PRIORITIES = (-1024, 1023)
+
     STATUS_MAPPING: Dict[str, JobStatus] = {
         "Q": JobStatus.START_REQUESTED,
         "W": JobStatus.START_REQUESTED,
@@ -482,9 +752,21 @@ class TorqueSchedulerRepository(AbstractSchedulerRepository):
     def __parse_to_datetime(time_str: str) -> datetime:
         return datetime.strptime(time_str, "%a %b %d %H:%M:%S %Y")
 
+    @staticmethod
+    def __continuation(lines: List[str], idx: int) -> str:
+        # Se atinge o tamanho máximo, o valor continua nas linhas
+        # seguintes, que começam com tab. Nem sempre o próximo dado é
+        # o mesmo: jobs na fila, por exemplo, ainda não têm start_time.
+        continuacao = ""
+        for prox_linha in lines[idx + 1 :]:
+            if not prox_linha.startswith("\t"):
+                break
+            continuacao += prox_linha.strip()
+        return continuacao
+
     @staticmethod
     async def list_jobs() -> Union[List[Job], HTTPResponse]:
-        def __parse_list_jobs(content: str) -> Union[List[Job], HTTPResponse]:
+        def __parse_list_jobs(content: str) -> List[JobRecord]:
             NEW_JOB_PATTERN = "Job Id:"
             JOB_NAME_PATTERN = "Job_Name ="
             JOB_STATUS_PATTERN = "job_state ="
@@ -494,7 +776,7 @@ class TorqueSchedulerRepository(AbstractSchedulerRepository):
             JOB_ARGS_PATTERN = "submit_args ="
             JOB_RESOURCE_PATTERN = "resources_used."
             lines = content.split("\n")
-            jobs: List[Job] = []
+            jobs: List[JobRecord] = []
             if len(lines) < 3:
                 return jobs
             jobId = None
@@ -513,10 +795,10 @@ class TorqueSchedulerRepository(AbstractSchedulerRepository):
             for idx, line in enumerate(lines):
                 if len(line) == 0:
                     if jobId is not None and not any(
-                        [j.jobId == jobId for j in jobs]
+                        [j["jobId"] == jobId for j in jobs]
                     ):
                         jobs.append(
-                            Job(
+                            dict(
                                 jobId=str(jobId),
                                 name=str(name),
                                 status=status,
@@ -528,7 +810,7 @@ class TorqueSchedulerRepository(AbstractSchedulerRepository):
                                 reservedSlots=int(reservedSlots),
                                 scriptFile=scriptFile,
                                 args=jobArgs,
-                                resourceUsage=ResourceUsage(
+                                resourceUsage=dict(
                                     cpuSeconds=resources["cput"],
                                     memoryCpuSeconds=resources["cput"]
                                     * resources["mem"],
@@ -561,15 +843,9 @@ class TorqueSchedulerRepository(AbstractSchedulerRepository):
                     )
                     reservedSlots = int(slotData[0]) * int(slotData[1])
                 elif JOB_WORKING_DIR_PATTERN in line:
-                    # Se atinge o tamanho máximo, pode continuar na linha
-                    # seguinte. Continua até achar o padrão do próximo dado.
-                    num_linhas = 1
-                    continuacao = ""
-                    prox_linha = lines[idx + num_linhas].strip()
-                    while "Priority =" not in prox_linha:
-                        continuacao += prox_linha
-                        num_linhas += 1
-                        prox_linha = lines[idx + num_linhas].strip()
+                    continuacao = TorqueSchedulerRepository.__continuation(
+                        lines, idx
+                    )
                     outputPath = Path(
                         (
                             line.split(JOB_WORKING_DIR_PATTERN)[1].strip()
@@ -578,15 +854,9 @@ class TorqueSchedulerRepository(AbstractSchedulerRepository):
                     )
                     workingDirectory = str(outputPath.parent)
                 elif JOB_ARGS_PATTERN in line:
-                    # Se atinge o tamanho máximo, pode continuar na linha
-                    # seguinte. Continua até achar o padrão do próximo dado.
-                    num_linhas = 1
-                    continuacao = ""
-                    prox_linha = lines[idx + num_linhas].strip()
-                    while "start_time =" not in prox_linha:
-                        continuacao += prox_linha
-                        num_linhas += 1
-                        prox_linha = lines[idx + num_linhas].strip()
+                    continuacao = TorqueSchedulerRepository.__continuation(
+                        lines, idx
+                    )
                     args = (
                         line.split(JOB_ARGS_PATTERN)[1].strip() + continuacao
                     ).split(" ")
@@ -621,11 +891,14 @@ class TorqueSchedulerRepository(AbstractSchedulerRepository):
         if cod != 0:
             return HTTPResponse(code=500, detail=f"error running qstat: {ans}")
         else:
-            return __parse_list_jobs(ans)
+            with span("parse"):
+                records = __parse_list_jobs(ans)
+            with span("model"):
+                return [Job(**r) for r in records]
 
     @staticmethod
     async def get_job(jobId: str) -> Union[Job, HTTPResponse]:
-        def __parse_get_job(content: str) -> Union[Job, HTTPResponse]:
+        def __parse_get_job(content: str) -> Union[JobRecord, HTTPResponse]:
             NEW_JOB_PATTERN = "Job Id:"
             JOB_NAME_PATTERN = "Job_Name ="
             JOB_STATUS_PATTERN = "job_state ="
@@ -635,7 +908,7 @@ class TorqueSchedulerRepository(AbstractSchedulerRepository):
             JOB_ARGS_PATTERN = "submit_args ="
             JOB_RESOURCE_PATTERN = "resources_used."
             lines = content.split("\n")
-            jobs: List[Job] = []
+            jobs: List[JobRecord] = []
             if len(lines) < 3:
                 return HTTPResponse(code=404, detail="no jobs found")
             jobId = None
@@ -654,10 +927,10 @@ class TorqueSchedulerRepository(AbstractSchedulerRepository):
             for idx, line in enumerate(lines):
                 if len(line) == 0:
                     if jobId is not None and not any(
-                        [j.jobId == jobId for j in jobs]
+                        [j["jobId"] == jobId for j in jobs]
                     ):
                         jobs.append(
-                            Job(
+                            dict(
                                 jobId=str(jobId),
                                 name=str(name),
                                 status=status,
@@ -669,7 +942,7 @@ class TorqueSchedulerRepository(AbstractSchedulerRepository):
                                 reservedSlots=int(reservedSlots),
                                 scriptFile=scriptFile,
                                 args=jobArgs,
-                                resourceUsage=ResourceUsage(
+                                resourceUsage=dict(
                                     cpuSeconds=resources["cput"],
                                     memoryCpuSeconds=resources["cput"]
                                     * resources["mem"],
@@ -703,15 +976,9 @@ class TorqueSchedulerRepository(AbstractSchedulerRepository):
                     )
                     reservedSlots = int(slotData[0]) * int(slotData[1])
                 elif JOB_WORKING_DIR_PATTERN in line:
-                    # Se atinge o tamanho máximo, pode continuar na linha
-                    # seguinte. Continua até achar o padrão do próximo dado.
-                    num_linhas = 1
-                    continuacao = ""
-                    prox_linha = lines[idx + num_linhas].strip()
-                    while "Priority =" not in prox_linha:
-                        continuacao += prox_linha
-                        num_linhas += 1
-                        prox_linha = lines[idx + num_linhas].strip()
+                    continuacao = TorqueSchedulerRepository.__continuation(
+                        lines, idx
+                    )
                     outputPath = Path(
                         (
                             line.split(JOB_WORKING_DIR_PATTERN)[1].strip()
@@ -720,15 +987,9 @@ class TorqueSchedulerRepository(AbstractSchedulerRepository):
                     )
                     workingDirectory = str(outputPath.parent)
                 elif JOB_ARGS_PATTERN in line:
-                    # Se atinge o tamanho máximo, pode continuar na linha
-                    # seguinte. Continua até achar o padrão do próximo dado.
-                    num_linhas = 1
-                    continuacao = ""
-                    prox_linha = lines[idx + num_linhas].strip()
-                    while "start_time =" not in prox_linha:
-                        continuacao += prox_linha
-                        num_linhas += 1
-                        prox_linha = lines[idx + num_linhas].strip()
+                    continuacao = TorqueSchedulerRepository.__continuation(
+                        lines, idx
+                    )
                     args = (
                         line.split(JOB_ARGS_PATTERN)[1].strip() + continuacao
                     ).split(" ")
@@ -768,17 +1029,19 @@ class TorqueSchedulerRepository(AbstractSchedulerRepository):
                 code=500, detail=f"error running qstat command: {ans}"
             )
         else:
-            detailedJob = __parse_get_job(ans)
+            with span("parse"):
+                detailedJob = __parse_get_job(ans)
             if isinstance(detailedJob, HTTPResponse):
                 return HTTPResponse(
                     code=500, detail="error parsing qstat -j result"
                 )
             else:
-                return detailedJob
+                with span("model"):
+                    return Job(**detailedJob)
 
     @staticmethod
     async def get_finished_job(jobId: str) -> Union[Job, HTTPResponse]:
-        def __parse_get_job(content: str) -> Union[Job, HTTPResponse]:
+        def __parse_get_job(content: str) -> Union[JobRecord, HTTPResponse]:
             # Iterates for getting info in the nodes
             startTimeStr = "Job Run"
             endTimeStr = "dequeuing from"
@@ -824,7 +1087,7 @@ class TorqueSchedulerRepository(AbstractSchedulerRepository):
                     detail=f"error parsing tracejob response: {content}",
                 )
 
-            usage = ResourceUsage(
+            usage = dict(
                 cpuSeconds=cpu,
                 memoryCpuSeconds=mem * cpu,
                 instantTotalMemory=mem,
@@ -834,7 +1097,7 @@ class TorqueSchedulerRepository(AbstractSchedulerRepository):
                 timeInstant=endTime,
             )
 
-            return Job(
+            return dict(
                 jobId=jobId,
                 status=JobStatus.STOPPED,
                 name=str(name),
@@ -853,27 +1116,41 @@ class TorqueSchedulerRepository(AbstractSchedulerRepository):
         if cod != 0:
             return HTTPResponse(code=404, detail=f"job {jobId} not found")
         else:
-            detailedJob = __parse_get_job(ans)
-            return detailedJob
+            with span("parse"):
+                detailedJob = __parse_get_job(ans)
+            if isinstance(detailedJob, HTTPResponse):
+                return detailedJob
+            with span("model"):
+                return Job(**detailedJob)
+
+    @staticmethod
+    def _limits(job: Job) -> List[str]:
+        """
+        The qsub options for the walltime, priority and
+        dependencies of a job.
+        """
+        limits = []
+        if job.walltime:
+            limits += ["-l", f"walltime={job.walltime}"]
+        if job.priority is not None:
+            limits += ["-p", str(job.priority)]
+        if job.dependencies:
+            limits += ["-W", "depend=afterok:" + ":".join(job.dependencies)]
+        return limits
 
     @staticmethod
     async def submit_job(job: Job) -> Union[Job, HTTPResponse]:
         def __parse_submit_ans(content: str):
             job.jobId = content.split(".")[0].strip()
 
-        if not job.workingDirectory:
-            return HTTPResponse(
-                code=400, detail="workingDirectory is mandatory"
-            )
-        if not job.name:
-            job.name = Path(job.workingDirectory).parts[-1]
-        if not job.reservedSlots:
-            return HTTPResponse(code=400, detail="reservedSlots is mandatory")
-        if not job.scriptFile:
-            return HTTPResponse(code=400, detail="scriptFile is mandatory")
+        invalid = invalid_submission(job, TorqueSchedulerRepository.PRIORITIES)
+        if invalid is not None:
+            return invalid
         args = job.args if job.args is not None else []
+        limits = TorqueSchedulerRepository._limits(job)
         command = [
             "qsub",
+            *limits,
             job.scriptFile,
             "-N",
             job.name,
@@ -881,11 +1158,6 @@ class TorqueSchedulerRepository(AbstractSchedulerRepository):
             f"nodes={job.reservedSlots}",
             *args,
         ]
-        if not isdir(job.workingDirectory):
-            return HTTPResponse(
-                code=400,
-                detail=f"directory {job.workingDirectory} does not exist",
-            )
         with set_directory(job.workingDirectory):
             cod, ans = await run_terminal_retry(command)
         if cod != 0:
@@ -921,6 +1193,75 @@ class TorqueSchedulerRepository(AbstractSchedulerRepository):
                 resourceUsage=None,
             )
 
+    @staticmethod
+    async def get_job_output(
+        jobId: str,
+        tail: Optional[int] = None,
+        offset: Optional[int] = None,
+        length: Optional[int] = None,
+    ) -> Union[JobOutput, HTTPResponse]:
+        return HTTPResponse(
+            code=501, detail="job output is not supported by Torque"
+        )
+
+    @staticmethod
+    async def list_queues() -> Union[List[Queue], HTTPResponse]:
+        return HTTPResponse(
+            code=501, detail="queues are not supported by Torque"
+        )
+
+    @staticmethod
+    async def submit_job_array(
+        array: JobArray,
+    ) -> Union[JobArrayStatus, HTTPResponse]:
+        job = array.template
+        invalid = invalid_array(array)
+        if invalid is not None:
+            return invalid
+        size = array_size(array) or 0
+        invalid = invalid_submission(job, TorqueSchedulerRepository.PRIORITIES)
+        if invalid is not None:
+            return invalid
+        limits = TorqueSchedulerRepository._limits(job)
+        scriptFile = write_array_script(array, f"{job.name}.array")
+        command = [
+            "qsub",
+            *limits,
+            "-t",
+            f"1-{size}",
+            scriptFile,
+            "-N",
+            job.name,
+            "-l",
+            f"nodes={job.reservedSlots}",
+        ]
+        with set_directory(job.workingDirectory):
+            cod, ans = await run_terminal_retry(command)
+        if cod != 0:
+            return HTTPResponse(
+                code=500, detail=f"error running qsub command: {ans}"
+            )
+        return JobArrayStatus(
+            # Torque names arrays like 123[]
+            arrayId=ans.split(".")[0].strip().replace("[]", ""),
+            tasks=size,
+            status={JobStatus.START_REQUESTED.value: f"1-{size}"},
+        )
+
+    @staticmethod
+    async def get_job_array(
+        arrayId: str,
+    ) -> Union[JobArrayStatus, HTTPResponse]:
+        return HTTPResponse(
+            code=501, detail="job array status is not supported by Torque"
+        )
+
+    @staticmethod
+    async def submit_workflow(
+        workflow: Workflow,
+    ) -> Union[WorkflowStatus, HTTPResponse]:
+        return await submit_stages(TorqueSchedulerRepository, workflow)
+
 
 class InternalSchedulerRepository(AbstractSchedulerRepository):
     """ """
@@ -965,12 +1306,114 @@ class InternalSchedulerRepository(AbstractSchedulerRepository):
     @staticmethod
     async def submit_job(job: Job) -> Union[Job, HTTPResponse]:
         internal_scheduler = TaskScheduler()
+        invalid = InternalSchedulerRepository._validate(job)
+        if invalid is not None:
+            return invalid
         internal_scheduler.schedule_task(job)
         return job
 
+    @staticmethod
+    def _validate(job: Job) -> Optional[HTTPResponse]:
+        internal_scheduler = TaskScheduler()
+        if job.walltime is not None and job.walltime <= 0:
+            return HTTPResponse(code=400, detail="walltime must be positive")
+        if job.name is not None and (sep in job.name or ".." in job.name):
+            return HTTPResponse(
+                code=400, detail=f"invalid job name {job.name}"
+            )
+        for jobId in job.dependencies or []:
+            if jobId not in internal_scheduler.jobs():
+                return HTTPResponse(
+                    code=400, detail=f"dependency {jobId} not found"
+                )
+        if internal_scheduler.route(job) is None:
+            return HTTPResponse(
+                code=400, detail=f"queue {job.queue} does not exist"
+            )
+        if not internal_scheduler.fits(job):
+            internal_scheduler.reject(job)
+            return HTTPResponse(
+                code=400,
+                detail="reservedSlots or reservedMemory exceed the "
+                + "capacity of the scheduler or of the queue",
+            )
+        return None
+
     @staticmethod
     async def stop_job(jobId: str) -> Union[Job, HTTPResponse]:
-        raise NotImplementedError("stop_job not implemented")
+        internal_scheduler = TaskScheduler()
+        job = internal_scheduler.stop_task(jobId)
+        if job is None:
+            return HTTPResponse(code=404, detail=f"job {jobId} not found")
+        return job
+
+    @staticmethod
+    async def get_job_output(
+        jobId: str,
+        tail: Optional[int] = None,
+        offset: Optional[int] = None,
+        length: Optional[int] = None,
+    ) -> Union[JobOutput, HTTPResponse]:
+        internal_scheduler = TaskScheduler()
+        output = internal_scheduler.output(jobId)
+        if output is None:
+            return HTTPResponse(code=404, detail=f"job {jobId} not found")
+        # Up to MAX_READ bytes may be read, so the file is not read on
+        # the event loop
+        loop = asyncio.get_running_loop()
+        if offset is not None:
+            read = loop.run_in_executor(
+                None,
+                output.read_range,
+                offset,
+                output.MAX_READ if length is None else length,
+            )
+        else:
+            read = loop.run_in_executor(
+                None, output.tail, tail if tail is not None else 100
+            )
+        start, size, content = await read
+        return JobOutput(jobId=jobId, offset=start, size=size, content=content)
+
+    @staticmethod
+    async def list_queues() -> Union[List[Queue], HTTPResponse]:
+        internal_scheduler = TaskScheduler()
+        return internal_scheduler.queue_status()
+
+    @staticmethod
+    async def submit_job_array(
+        array: JobArray,
+    ) -> Union[JobArrayStatus, HTTPResponse]:
+        internal_scheduler = TaskScheduler()
+        invalid = invalid_array(array)
+        if invalid is not None:
+            return invalid
+        invalid = InternalSchedulerRepository._validate(array.template)
+        if invalid is not None:
+            return invalid
+        arrayId = internal_scheduler.schedule_array(array)
+        status = internal_scheduler.array_status(arrayId)
+        if status is None:
+            return HTTPResponse(code=500, detail="error scheduling job array")
+        return status
+
+    @staticmethod
+    async def get_job_array(
+        arrayId: str,
+    ) -> Union[JobArrayStatus, HTTPResponse]:
+        internal_scheduler = TaskScheduler()
+        status = internal_scheduler.array_status(arrayId)
+        if status is None:
+            return HTTPResponse(
+                code=404, detail=f"job array {arrayId} not found"
+            )
+        return status
+
+    @staticmethod
+    async def submit_workflow(
+        workflow: Workflow,
+    ) -> Union[WorkflowStatus, HTTPResponse]:
+        return await submit_stages(InternalSchedulerRepository, workflow)
 
 
 class TestSchedulerRepository(AbstractSchedulerRepository):
@@ -1055,6 +1498,72 @@ class TestSchedulerRepository(AbstractSchedulerRepository):
             resourceUsage=None,
         )
 
+    @staticmethod
+    async def get_job_output(
+        jobId: str,
+        tail: Optional[int] = None,
+        offset: Optional[int] = None,
+        length: Optional[int] = None,
+    ) -> Union[JobOutput, HTTPResponse]:
+        if jobId != "1":
+            return HTTPResponse(code=404, detail=f"job {jobId} not found")
+        return JobOutput(jobId=jobId, offset=0, size=6, content="teste\n")
+
+    @staticmethod
+    async def list_queues() -> Union[List[Queue], HTTPResponse]:
+        return [
+            Queue(
+                name="default",
+                slots=64,
+                usedSlots=64,
+                borrowing=True,
+                queuedJobs=1,
+                runningJobs=1,
+                maxWaitSeconds=60.0,
+                averageWaitSeconds=30.0,
+            )
+        ]
+
+    @staticmethod
+    async def submit_job_array(
+        array: JobArray,
+    ) -> Union[JobArrayStatus, HTTPResponse]:
+        size = array_size(array)
+        if not size:
+            return HTTPResponse(
+                code=400,
+                detail="workingDirectories or args are mandatory "
+                + "and must have the same size",
+            )
+        return JobArrayStatus(
+            arrayId="4",
+            tasks=size,
+            status={JobStatus.START_REQUESTED.value: f"1-{size}"},
+        )
+
+    @staticmethod
+    async def get_job_array(
+        arrayId: str,
+    ) -> Union[JobArrayStatus, HTTPResponse]:
+        if arrayId != "4":
+            return HTTPResponse(
+                code=404, detail=f"job array {arrayId} not found"
+            )
+        return JobArrayStatus(
+            arrayId=arrayId,
+            tasks=10,
+            status={
+                JobStatus.RUNNING.value: "1-3,5",
+                JobStatus.START_REQUESTED.value: "4,6-10",
+            },
+        )
+
+    @staticmethod
+    async def submit_workflow(
+        workflow: Workflow,
+    ) -> Union[WorkflowStatus, HTTPResponse]:
+        return await submit_stages(TestSchedulerRepository, workflow)
+
 
 SUPPORTED_SCHEDULERS: Dict[str, Type[AbstractSchedulerRepository]] = {
     "SGE": SGESchedulerRepository,
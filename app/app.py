@@ -1,9 +1,57 @@
 from fastapi import FastAPI
-from app.routers import jobs, programs
+from app.internal.settings import Settings
+from app.internal.metrics import MetricsMiddleware
+from app.internal.timing import TimingMiddleware
+from app.routers import jobs, metrics, programs, queues
+from app.adapters.programpathrepository import factory as programs_factory
+from app.adapters.programpathrepository import RulesProgramPathRepository
+from app.utils.taskscheduler import TaskScheduler
+from app.utils.programcatalog import ProgramCatalog
+from app.utils.catalogwatcher import CatalogWatcher
+
+
+async def startup():
+    if Settings.scheduler == "INTERNAL":
+        if Settings.agents and Settings.queues:
+            # The budgets of the queues are only kept by the dispatch
+            # of the jobs run in the API host
+            raise ValueError(
+                "INTERNAL_SCHEDULER_QUEUES is not supported with "
+                + "INTERNAL_SCHEDULER_AGENTS"
+            )
+        # Errors in the queues are seen when the API starts, and not
+        # on the first request that uses them
+        TaskScheduler.queues()
+        await TaskScheduler.restore()
+    if Settings.programPathRule == "RULES":
+        # Errors in the rules file are seen when the API starts
+        RulesProgramPathRepository.load(Settings.program_rules)
+    if Settings.catalog_watch in CatalogWatcher.MODES:
+        catalog = ProgramCatalog.of(programs_factory(Settings.programPathRule))
+        watcher = CatalogWatcher(
+            catalog,
+            Settings.catalog_watch,
+            Settings.catalog_poll_interval,
+            Settings.catalog_debounce,
+        )
+        await watcher.start()
+
+
+async def shutdown():
+    TaskScheduler.close()
+    for catalog in ProgramCatalog.CATALOGS.values():
+        if catalog.watcher is not None:
+            await catalog.watcher.close()
 
 
 def make_app(root_path: str = "/") -> FastAPI:
     app = FastAPI(root_path=root_path)
     app.include_router(jobs.router)
     app.include_router(programs.router)
+    app.include_router(queues.router)
+    app.include_router(metrics.router)
+    app.add_middleware(MetricsMiddleware)
+    app.add_middleware(TimingMiddleware)
+    app.add_event_handler("startup", startup)
+    app.add_event_handler("shutdown", shutdown)
     return app
@@ -0,0 +1,247 @@
+import bisect
+import math
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Seconds, from a cached response up to a slow qacct on a busy cluster
+LATENCY_BUCKETS = [
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+]
+
+Labels = Tuple[str, ...]
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names: Tuple[str, ...], values: Labels) -> str:
+    if len(names) == 0:
+        return ""
+    pairs = [f'{n}="{escape(v)}"' for n, v in zip(names, values)]
+    return "{" + ",".join(pairs) + "}"
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+class Metric:
+    """
+    A metric in the Prometheus text format, with one series for
+    each combination of label values. Updates are plain dict
+    operations, made from the event loop, so they can be left on
+    in production.
+    """
+
+    TYPE = ""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+
+    def samples(self) -> List[str]:
+        return []
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} {self.TYPE}",
+            *self.samples(),
+        ]
+
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{format_labels(self.labels, k)} {format_value(v)}"
+            for k, v in self.values.items()
+        ]
+
+
+class Gauge(Counter):
+    TYPE = "gauge"
+
+    def set(self, value: float, *labels: str):
+        self.values[labels] = value
+
+    def dec(self, *labels: str, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+    def clear(self):
+        self.values = {}
+
+
+class Histogram(Metric):
+    TYPE = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Tuple[str, ...] = (),
+        buckets: List[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = sorted(buckets)
+        self.counts: Dict[Labels, List[int]] = {}
+        self.sums: Dict[Labels, float] = {}
+
+    def observe(self, value: float, *labels: str):
+        if labels not in self.counts:
+            self.counts[labels] = [0] * (len(self.buckets) + 1)
+            self.sums[labels] = 0.0
+        # Only the first bucket that fits is counted, the cumulative
+        # counts are summed when the metrics are read
+        self.counts[labels][bisect.bisect_left(self.buckets, value)] += 1
+        self.sums[labels] += value
+
+    def count(self, *labels: str) -> int:
+        return sum(self.counts.get(labels, []))
+
+    def samples(self) -> List[str]:
+        lines: List[str] = []
+        names = (*self.labels, "le")
+        for k, counts in self.counts.items():
+            total = 0
+            for bound, c in zip([*self.buckets, math.inf], counts):
+                total += c
+                le = format_labels(names, (*k, format_value(bound)))
+                lines.append(f"{self.name}_bucket{le} {total}")
+            labels = format_labels(self.labels, k)
+            lines.append(
+                f"{self.name}_sum{labels} {format_value(self.sums[k])}"
+            )
+            lines.append(f"{self.name}_count{labels} {total}")
+        return lines
+
+
+class Registry:
+    """
+    The metrics exposed by the API. Values that are cheaper to read
+    when requested than to keep updated, such as the slots used by
+    the internal scheduler, are set by collectors called on each read.
+    """
+
+    def __init__(self):
+        self.metrics: List[Metric] = []
+        self.collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def counter(
+        self, name: str, help: str, labels: Tuple[str, ...] = ()
+    ) -> Counter:
+        return self.register(Counter(name, help, labels))  # type: ignore
+
+    def gauge(
+        self, name: str, help: str, labels: Tuple[str, ...] = ()
+    ) -> Gauge:
+        return self.register(Gauge(name, help, labels))  # type: ignore
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: Tuple[str, ...] = (),
+        buckets: List[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self.register(
+            Histogram(name, help, labels, buckets)
+        )  # type: ignore
+
+    def collector(self, function: Callable[[], None]):
+        self.collectors.append(function)
+
+    def render(self) -> str:
+        for collect in self.collectors:
+            collect()
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds",
+    "Latency of the requests, by route",
+    ("method", "route", "status"),
+)
+COMMAND_DURATION = REGISTRY.histogram(
+    "scheduler_command_duration_seconds",
+    "Latency of the commands of the scheduler, by outcome",
+    ("command", "outcome"),
+)
+SUBPROCESSES = REGISTRY.gauge(
+    "scheduler_command_subprocesses",
+    "Commands of the scheduler running at the moment",
+)
+CATALOG_REQUESTS = REGISTRY.counter(
+    "program_catalog_requests_total",
+    "Reads of the program catalog, by whether the programs were listed",
+    ("result",),
+)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that measures the latency of each request,
+    labeled by the path template of the route instead of the path,
+    so that job ids do not create new series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = [500]
+
+        async def send_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            route: Optional[object] = scope.get("route")
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - start,
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status[0]),
+            )
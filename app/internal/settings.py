@@ -5,7 +5,52 @@ class Settings:
     clusterId = os.getenv("CLUSTER_ID", "0")
     scheduler = os.getenv("SCHEDULER", "SGE")
     max_slots = int(os.getenv("INTERNAL_SCHEDULER_MAX_SLOTS", 16))
+    max_memory = float(os.getenv("INTERNAL_SCHEDULER_MAX_MEMORY", 0))
+    cpu_affinity = bool(int(os.getenv("INTERNAL_SCHEDULER_CPU_AFFINITY", 0)))
+    default_walltime = float(
+        os.getenv("INTERNAL_SCHEDULER_DEFAULT_WALLTIME", 604800)
+    )
+    preemption = bool(int(os.getenv("INTERNAL_SCHEDULER_PREEMPTION", 0)))
+    priority_aging = float(
+        os.getenv("INTERNAL_SCHEDULER_PRIORITY_AGING", 3600)
+    )
+    queues = os.getenv("INTERNAL_SCHEDULER_QUEUES", "")
+    queue_routes = os.getenv("INTERNAL_SCHEDULER_QUEUE_ROUTES", "")
+    stop_grace_period = float(
+        os.getenv("INTERNAL_SCHEDULER_STOP_GRACE_PERIOD", 30)
+    )
+    agents = os.getenv("INTERNAL_SCHEDULER_AGENTS", "")
+    heartbeat_interval = float(
+        os.getenv("INTERNAL_SCHEDULER_HEARTBEAT_INTERVAL", 5)
+    )
+    heartbeat_timeout = float(
+        os.getenv("INTERNAL_SCHEDULER_HEARTBEAT_TIMEOUT", 15)
+    )
+    sampling_interval = float(
+        os.getenv("INTERNAL_SCHEDULER_SAMPLING_INTERVAL", 10)
+    )
+    journal = os.getenv("INTERNAL_SCHEDULER_JOURNAL", "")
+    journal_flush_interval = float(
+        os.getenv("INTERNAL_SCHEDULER_JOURNAL_FLUSH_INTERVAL", 1)
+    )
+    journal_retention = float(
+        os.getenv("INTERNAL_SCHEDULER_JOURNAL_RETENTION", 604800)
+    )
+    output_directory = os.getenv("INTERNAL_SCHEDULER_OUTPUT_DIRECTORY", "")
+    output_buffer_lines = int(
+        os.getenv("INTERNAL_SCHEDULER_OUTPUT_BUFFER_LINES", 1000)
+    )
+    agent_listen = os.getenv("AGENT_LISTEN", "127.0.0.1:5050")
+    agent_token = os.getenv("AGENT_TOKEN", "")
+    agent_slots = int(os.getenv("AGENT_SLOTS", 16))
+    agent_memory = float(os.getenv("AGENT_MEMORY", 0))
     programPathRule = os.getenv("PROGRAM_PATH_RULE", "PEMAWS")
+    program_rules = os.getenv("PROGRAM_RULES", "")
+    catalog_watch = os.getenv("PROGRAM_CATALOG_WATCH", "")
+    catalog_poll_interval = float(
+        os.getenv("PROGRAM_CATALOG_POLL_INTERVAL", 30)
+    )
+    catalog_debounce = float(os.getenv("PROGRAM_CATALOG_DEBOUNCE", 2))
     host = os.getenv("HOST", "localhost")
     port = int(os.getenv("PORT", "80"))
     root_path = os.getenv("ROOT_PATH", "/")
@@ -15,7 +60,58 @@ class Settings:
         cls.clusterId = os.getenv("CLUSTER_ID", "0")
         cls.scheduler = os.getenv("SCHEDULER", "SGE")
         cls.max_slots = int(os.getenv("INTERNAL_SCHEDULER_MAX_SLOTS", 16))
+        cls.max_memory = float(os.getenv("INTERNAL_SCHEDULER_MAX_MEMORY", 0))
+        cls.cpu_affinity = bool(
+            int(os.getenv("INTERNAL_SCHEDULER_CPU_AFFINITY", 0))
+        )
+        cls.default_walltime = float(
+            os.getenv("INTERNAL_SCHEDULER_DEFAULT_WALLTIME", 604800)
+        )
+        cls.preemption = bool(
+            int(os.getenv("INTERNAL_SCHEDULER_PREEMPTION", 0))
+        )
+        cls.priority_aging = float(
+            os.getenv("INTERNAL_SCHEDULER_PRIORITY_AGING", 3600)
+        )
+        cls.queues = os.getenv("INTERNAL_SCHEDULER_QUEUES", "")
+        cls.queue_routes = os.getenv("INTERNAL_SCHEDULER_QUEUE_ROUTES", "")
+        cls.stop_grace_period = float(
+            os.getenv("INTERNAL_SCHEDULER_STOP_GRACE_PERIOD", 30)
+        )
+        cls.agents = os.getenv("INTERNAL_SCHEDULER_AGENTS", "")
+        cls.heartbeat_interval = float(
+            os.getenv("INTERNAL_SCHEDULER_HEARTBEAT_INTERVAL", 5)
+        )
+        cls.heartbeat_timeout = float(
+            os.getenv("INTERNAL_SCHEDULER_HEARTBEAT_TIMEOUT", 15)
+        )
+        cls.sampling_interval = float(
+            os.getenv("INTERNAL_SCHEDULER_SAMPLING_INTERVAL", 10)
+        )
+        cls.journal = os.getenv("INTERNAL_SCHEDULER_JOURNAL", "")
+        cls.journal_flush_interval = float(
+            os.getenv("INTERNAL_SCHEDULER_JOURNAL_FLUSH_INTERVAL", 1)
+        )
+        cls.journal_retention = float(
+            os.getenv("INTERNAL_SCHEDULER_JOURNAL_RETENTION", 604800)
+        )
+        cls.output_directory = os.getenv(
+            "INTERNAL_SCHEDULER_OUTPUT_DIRECTORY", ""
+        )
+        cls.output_buffer_lines = int(
+            os.getenv("INTERNAL_SCHEDULER_OUTPUT_BUFFER_LINES", 1000)
+        )
+        cls.agent_listen = os.getenv("AGENT_LISTEN", "127.0.0.1:5050")
+        cls.agent_token = os.getenv("AGENT_TOKEN", "")
+        cls.agent_slots = int(os.getenv("AGENT_SLOTS", 16))
+        cls.agent_memory = float(os.getenv("AGENT_MEMORY", 0))
         cls.programPathRule = os.getenv("PROGRAM_PATH_RULE", "PEMAWS")
+        cls.program_rules = os.getenv("PROGRAM_RULES", "")
+        cls.catalog_watch = os.getenv("PROGRAM_CATALOG_WATCH", "")
+        cls.catalog_poll_interval = float(
+            os.getenv("PROGRAM_CATALOG_POLL_INTERVAL", 30)
+        )
+        cls.catalog_debounce = float(os.getenv("PROGRAM_CATALOG_DEBOUNCE", 2))
         cls.host = os.getenv("HOST", "localhost")
         cls.port = int(os.getenv("PORT", "80"))
         cls.root_path = os.getenv("ROOT_PATH", "/")
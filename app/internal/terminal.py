@@ -1,9 +1,21 @@
 import asyncio
-from typing import List, Tuple, Optional
-
+import os
+import signal
+import time
+from typing import Any, Dict, List, Tuple, Optional
+from app.internal.metrics import COMMAND_DURATION, SUBPROCESSES
+from app.internal.timing import span
 
 RETRY_DEFAULT = 3
 TIMEOUT_DEFAULT = 10
+# Commands measured on their own, the others share a single series
+SCHEDULER_COMMANDS = ["qstat", "qsub", "qdel", "qacct", "tracejob"]
+
+
+def command_name(cmds: List[str]) -> str:
+    words = " ".join(cmds).split()
+    name = os.path.basename(words[0]) if len(words) > 0 else ""
+    return name if name in SCHEDULER_COMMANDS else "other"
 
 
 async def run_terminal_retry(
@@ -39,14 +51,217 @@ async def run_terminal(
     :rtype: Tuple[int, List[str]]
     """
     cmd = " ".join(cmds)
-    proc = await asyncio.create_subprocess_shell(
-        cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-    )
-    stdout, stderr = await asyncio.wait_for(
-        proc.communicate(), timeout=timeout
+    name = command_name(cmds)
+    outcome = "error"
+    SUBPROCESSES.inc()
+    start = time.perf_counter()
+    with span(name):
+        try:
+            proc = await asyncio.create_subprocess_shell(
+                cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            try:
+                stdout, stderr = await asyncio.wait_for(
+                    proc.communicate(), timeout=timeout
+                )
+            except asyncio.TimeoutError:
+                outcome = "timeout"
+                raise
+            if proc.returncode == 0:
+                outcome = "ok"
+            if stdout:
+                return proc.returncode, stdout.decode("utf-8")
+            if stderr:
+                return proc.returncode, stderr.decode("utf-8")
+            # Commands such as the qdel of Torque succeed silently
+            return proc.returncode if proc.returncode == 0 else -1, ""
+        finally:
+            SUBPROCESSES.dec()
+            COMMAND_DURATION.observe(
+                time.perf_counter() - start, name, outcome
+            )
+
+
+async def start_terminal(
+    cmds: List[str],
+    cwd: Optional[str] = None,
+    stdout: Any = asyncio.subprocess.PIPE,
+    stderr: Any = asyncio.subprocess.PIPE,
+    env: Optional[Dict[str, str]] = None,
+    cpus: Optional[List[int]] = None,
+) -> asyncio.subprocess.Process:
+    """
+    Starts a command on the terminal in a new process group and
+    returns without waiting for it to finish.
+
+    :param cmds: Commands and args to be executed
+    :param cwd: Working directory of the child process
+    :param stdout: Where the standard output is sent to
+    :param stderr: Where the standard error is sent to
+    :param env: Environment of the child process, instead of the
+        environment of the API
+    :param cpus: Cores the child process and its descendants are
+        pinned to
+    :return: The process handle, whose pid is also the process group id
+    :rtype: asyncio.subprocess.Process
+    """
+    cmd = " ".join(cmds)
+    if cpus is None:
+        return await asyncio.create_subprocess_shell(
+            cmd,
+            stdout=stdout,
+            stderr=stderr,
+            start_new_session=True,
+            cwd=cwd,
+            env=env,
+        )
+    # The shell is pinned by taskset before it is executed, so none of
+    # the processes of the job ever run on other cores. preexec_fn is
+    # not safe when the API runs threads.
+    return await asyncio.create_subprocess_exec(
+        "taskset",
+        "-c",
+        ",".join([str(c) for c in cpus]),
+        "/bin/sh",
+        "-c",
+        cmd,
+        stdout=stdout,
+        stderr=stderr,
+        start_new_session=True,
+        cwd=cwd,
+        env=env,
     )
-    if stdout:
-        return proc.returncode, stdout.decode("utf-8")
-    if stderr:
-        return proc.returncode, stderr.decode("utf-8")
-    return -1, ""
+
+
+def process_start_ticks(pid: int) -> Optional[int]:
+    """
+    Reads the start time of a process, in clock ticks since boot,
+    which tells apart different processes that reused the same pid.
+
+    :param pid: The process id
+    :return: The start time, or None if the process already exited
+    :rtype: Optional[int]
+    """
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            content = f.read()
+    except OSError:
+        return None
+    fields = content[content.rfind(b")") + 2 :].split()
+    if fields[0] == b"Z":
+        return None
+    return int(fields[19])
+
+
+def process_affinity(pid: int) -> Optional[List[int]]:
+    """
+    Reads the cores a process is pinned to.
+
+    :param pid: The process id
+    :return: The cores, or None if the process is not pinned
+        to a subset of the cores the API runs on
+    :rtype: Optional[List[int]]
+    """
+    try:
+        cpus = os.sched_getaffinity(pid)
+    except OSError:
+        return None
+    if cpus >= os.sched_getaffinity(0):
+        return None
+    return sorted(cpus)
+
+
+class AdoptedProcess:
+    """
+    Handle for a process started by a previous run of the API, which
+    is not a child of the current one and therefore can only be
+    polled for its end.
+    """
+
+    POLL_INTERVAL = 1.0
+
+    def __init__(self, pid: int, start_ticks: int):
+        self.pid = pid
+        self.start_ticks = start_ticks
+        self.returncode: Optional[int] = None
+
+    def alive(self) -> bool:
+        return process_start_ticks(self.pid) == self.start_ticks
+
+    async def wait(self) -> Optional[int]:
+        while self.alive():
+            await asyncio.sleep(self.POLL_INTERVAL)
+        return self.returncode
+
+
+def signal_process_group(proc: Any, sig: int):
+    """
+    Sends a signal to the process group led by a process started
+    with `start_terminal`, ignoring groups that already exited.
+
+    :param proc: The process leading the group
+    :param sig: The signal to be sent
+    """
+    try:
+        os.killpg(proc.pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def process_group_alive(pgid: int) -> bool:
+    """
+    Checks if any process of a process group is still alive.
+
+    :param pgid: The process group id
+    :rtype: bool
+    """
+    try:
+        os.killpg(pgid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    # Zombies still belong to the group until they are reaped, which
+    # may never happen if the init process of a container does not
+    # reap orphans
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "rb") as f:
+                content = f.read()
+        except OSError:
+            continue
+        fields = content[content.rfind(b")") + 2 :].split()
+        if int(fields[2]) == pgid and fields[0] != b"Z":
+            return True
+    return False
+
+
+async def terminate_process_group(
+    proc: Any, grace_period: float, poll_interval: float = 0.05
+):
+    """
+    Terminates the process group led by a process started with
+    `start_terminal`, sending SIGTERM and then SIGKILL if any process
+    of the group is still alive after the grace period.
+
+    :param proc: The process leading the group
+    :param grace_period: Seconds to wait before sending SIGKILL
+    :param poll_interval: Seconds between checks of the group
+    """
+    signal_process_group(proc, signal.SIGTERM)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + grace_period
+
+    async def alive() -> bool:
+        # Checking for zombies reads the whole process table
+        return await loop.run_in_executor(None, process_group_alive, proc.pid)
+
+    while await alive() and loop.time() < deadline:
+        await asyncio.sleep(poll_interval)
+    if await alive():
+        signal_process_group(proc, signal.SIGKILL)
+    await proc.wait()
@@ -0,0 +1,122 @@
+import contextlib
+import contextvars
+import json
+import logging
+import time
+from typing import Dict, Iterator, List, Optional
+
+# Child of the logger configured by uvicorn, so that the lines are
+# written without any logging setup in the API
+logger = logging.getLogger("uvicorn.timing")
+
+SPANS: contextvars.ContextVar[Optional[Dict[str, List[float]]]] = (
+    contextvars.ContextVar("spans", default=None)
+)
+# Time measured by the phases inside the current one
+NESTED: contextvars.ContextVar[Optional[List[float]]] = contextvars.ContextVar(
+    "nested", default=None
+)
+
+
+@contextlib.contextmanager
+def span(name: str) -> Iterator[None]:
+    """
+    Measures a phase of the current request, such as a command or the
+    parsing of its output. Phases with the same name are summed, with
+    the number of times they happened. The time of the phases inside
+    another one is not counted again in it, so that the phases never
+    add up to more than the request. Outside of a request, nothing
+    is measured.
+
+    :param name: The name of the phase, a token without spaces
+    """
+    spans = SPANS.get()
+    if spans is None:
+        yield
+        return
+    outer = NESTED.get()
+    nested = [0.0]
+    token = NESTED.set(nested)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        NESTED.reset(token)
+        duration = time.perf_counter() - start
+        if outer is not None:
+            outer[0] += duration
+        entry = spans.setdefault(name, [0.0, 0])
+        # Nested phases run concurrently may overlap
+        entry[0] += max(duration - nested[0], 0.0)
+        entry[1] += 1
+
+
+def server_timing(spans: Dict[str, List[float]], total: float) -> str:
+    """
+    Formats the phases of a request as a Server-Timing header,
+    with the durations in milliseconds.
+    """
+    metrics = []
+    for name, (duration, count) in spans.items():
+        metric = f"{name};dur={duration * 1000:.1f}"
+        if count > 1:
+            metric += f';desc="{int(count)}x"'
+        metrics.append(metric)
+    metrics.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(metrics)
+
+
+class TimingMiddleware:
+    """
+    ASGI middleware that collects the phases of each request,
+    returning them in the Server-Timing header and writing them
+    as a JSON log line.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        spans: Dict[str, List[float]] = {}
+        token = SPANS.set(spans)
+        status = [500]
+        start = time.perf_counter()
+
+        async def send_timing(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                header = server_timing(spans, time.perf_counter() - start)
+                message = {
+                    **message,
+                    "headers": [
+                        *message.get("headers", []),
+                        (b"server-timing", header.encode("latin-1")),
+                    ],
+                }
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timing)
+        finally:
+            SPANS.reset(token)
+            route = getattr(scope.get("route"), "path", None)
+            logger.info(
+                json.dumps(
+                    {
+                        "method": scope["method"],
+                        "path": scope["path"],
+                        "route": route,
+                        "status": status[0],
+                        "durationMs": round(
+                            (time.perf_counter() - start) * 1000, 1
+                        ),
+                        "spans": {
+                            n: {"durationMs": round(d * 1000, 1), "count": c}
+                            for n, (d, c) in spans.items()
+                        },
+                    }
+                )
+            )
@@ -21,6 +21,14 @@ class Job(BaseModel):
     clusterId: str
     workingDirectory: Optional[str]
     reservedSlots: Optional[int]
+    reservedMemory: Optional[float]
+    walltime: Optional[int]
+    priority: Optional[int]
+    queue: Optional[str]
+    dependencies: Optional[List[str]]
+    exitCode: Optional[int]
+    programId: Optional[str]
+    programVersion: Optional[str]
     scriptFile: Optional[str]
     args: Optional[List[str]]
     resourceUsage: Optional[ResourceUsage]
@@ -0,0 +1,27 @@
+from pydantic import BaseModel
+from typing import Dict, List, Optional
+
+from app.models.job import Job
+
+
+class JobArray(BaseModel):
+    """
+    Class for submitting many near-identical jobs at once, which
+    differ only in working directory or args, also known as a
+    job array in an HPC queue.
+    """
+
+    template: Job
+    workingDirectories: Optional[List[str]]
+    args: Optional[List[List[str]]]
+
+
+class JobArrayStatus(BaseModel):
+    """
+    Class for the status of the tasks of a job array, given as ranges
+    of task indexes (starting at 1) for each status, like `1-3,7`.
+    """
+
+    arrayId: str
+    tasks: int
+    status: Dict[str, str]
@@ -0,0 +1,12 @@
+from pydantic import BaseModel
+
+
+class JobOutput(BaseModel):
+    """
+    Class for a slice of the output of a job, read from its log file.
+    """
+
+    jobId: str
+    offset: int
+    size: int
+    content: str
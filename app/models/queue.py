@@ -0,0 +1,17 @@
+from pydantic import BaseModel
+
+
+class Queue(BaseModel):
+    """
+    Class for a queue of the internal scheduler, with its own
+    budget of slots, and how long jobs are waiting in it.
+    """
+
+    name: str
+    slots: int
+    usedSlots: int
+    borrowing: bool
+    queuedJobs: int
+    runningJobs: int
+    maxWaitSeconds: float
+    averageWaitSeconds: float
@@ -0,0 +1,19 @@
+from pydantic import BaseModel
+
+
+class SchedulerMetrics(BaseModel):
+    """
+    Class for the capacity usage of the internal scheduler, showing
+    how well jobs are packed into the available cores and memory.
+    """
+
+    totalSlots: int
+    usedSlots: int
+    totalMemory: float
+    usedMemory: float
+    slotUtilization: float
+    memoryUtilization: float
+    averageSlotUtilization: float
+    averageMemoryUtilization: float
+    queuedJobs: int
+    rejectedJobs: int
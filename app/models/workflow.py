@@ -0,0 +1,33 @@
+from pydantic import BaseModel
+from typing import Dict, List, Optional
+
+from app.models.job import Job
+
+
+class WorkflowStage(BaseModel):
+    """
+    Class for a job of a workflow, which is started only after the
+    stages it depends on finish successfully.
+    """
+
+    name: str
+    job: Job
+    after: Optional[List[str]]
+
+
+class Workflow(BaseModel):
+    """
+    Class for submitting a chain of jobs at once, given as a directed
+    acyclic graph of stages.
+    """
+
+    stages: List[WorkflowStage]
+
+
+class WorkflowStatus(BaseModel):
+    """
+    Class for the jobs submitted for a workflow, given by the
+    name of their stages.
+    """
+
+    jobs: Dict[str, str]
@@ -1,11 +1,17 @@
 from fastapi import APIRouter, HTTPException, Depends
 from fastapi.responses import JSONResponse
-from typing import List, Dict, Union
+from typing import List, Dict, Optional, Union
 from app.internal.httpresponse import HTTPResponse
 from app.models.job import Job
+from app.models.jobarray import JobArray, JobArrayStatus
+from app.models.joboutput import JobOutput
+from app.models.workflow import Workflow
 
 from app.adapters.schedulerrepository import AbstractSchedulerRepository
-from app.internal.dependencies import scheduler
+from app.adapters.programpathrepository import AbstractProgramPathRepository
+from app.internal.dependencies import scheduler, programPath
+from app.internal.timing import span
+from app.utils.programcatalog import ProgramCatalog
 
 router = APIRouter(
     prefix="/jobs",
@@ -16,12 +22,24 @@ router = APIRouter(
 responses: Dict[Union[int, str], Dict[str, str]] = {
     201: {"detail": ""},
     202: {"detail": ""},
+    400: {"detail": ""},
     404: {"detail": ""},
     500: {"detail": ""},
+    501: {"detail": ""},
     503: {"detail": ""},
 }
 
 
+async def resolve_programs(
+    jobs: List[Job], programPath: AbstractProgramPathRepository
+):
+    catalog = ProgramCatalog.of(programPath)
+    for job in jobs:
+        ans = await catalog.resolve(job)
+        if isinstance(ans, HTTPResponse):
+            raise HTTPException(status_code=ans.code, detail=ans.detail)
+
+
 @router.get("/", response_model=List[Job], responses=responses)
 async def read_jobs(
     scheduler: AbstractSchedulerRepository = Depends(scheduler),
@@ -36,25 +54,75 @@ async def read_jobs(
 async def create_job(
     job: Job,
     scheduler: AbstractSchedulerRepository = Depends(scheduler),
+    programPath: AbstractProgramPathRepository = Depends(programPath),
 ):
+    await resolve_programs([job], programPath)
     ans = await scheduler.submit_job(job)
     if isinstance(ans, HTTPResponse):
         raise HTTPException(status_code=ans.code, detail=ans.detail)
     return JSONResponse(status_code=201, content={"jobId": ans.jobId})
 
 
+@router.post("/arrays", responses=responses)
+async def create_job_array(
+    array: JobArray,
+    scheduler: AbstractSchedulerRepository = Depends(scheduler),
+    programPath: AbstractProgramPathRepository = Depends(programPath),
+):
+    await resolve_programs([array.template], programPath)
+    ans = await scheduler.submit_job_array(array)
+    if isinstance(ans, HTTPResponse):
+        raise HTTPException(status_code=ans.code, detail=ans.detail)
+    return JSONResponse(
+        status_code=201, content={"arrayId": ans.arrayId, "tasks": ans.tasks}
+    )
+
+
+@router.post("/workflows", responses=responses)
+async def create_workflow(
+    workflow: Workflow,
+    scheduler: AbstractSchedulerRepository = Depends(scheduler),
+    programPath: AbstractProgramPathRepository = Depends(programPath),
+):
+    await resolve_programs([s.job for s in workflow.stages], programPath)
+    ans = await scheduler.submit_workflow(workflow)
+    if isinstance(ans, HTTPResponse):
+        raise HTTPException(status_code=ans.code, detail=ans.detail)
+    return JSONResponse(status_code=201, content={"jobs": ans.jobs})
+
+
+@router.get(
+    "/arrays/{arrayId}", response_model=JobArrayStatus, responses=responses
+)
+async def read_job_array(
+    arrayId: str,
+    scheduler: AbstractSchedulerRepository = Depends(scheduler),
+):
+    ans = await scheduler.get_job_array(arrayId)
+    if isinstance(ans, HTTPResponse):
+        raise HTTPException(status_code=ans.code, detail=ans.detail)
+    return ans
+
+
 @router.get("/{jobId}", response_model=Job, responses=responses)
 async def read_job(
     jobId: str,
     scheduler: AbstractSchedulerRepository = Depends(scheduler),
 ):
-    allJobs = await scheduler.list_jobs()
+    with span("list_jobs"):
+        allJobs = await scheduler.list_jobs()
     if isinstance(allJobs, HTTPResponse):
         raise HTTPException(status_code=allJobs.code, detail=allJobs.detail)
     generalJobData = [j for j in allJobs if j.jobId == jobId]
     if len(generalJobData) == 1:
-        detailedJob = await scheduler.get_job(jobId)
+        with span("get_job"):
+            detailedJob = await scheduler.get_job(jobId)
         if isinstance(detailedJob, HTTPResponse):
+            # The job may have finished since it was listed
+            with span("get_finished_job"):
+                finishedJob = await scheduler.get_finished_job(jobId)
+            if not isinstance(finishedJob, HTTPResponse):
+                return finishedJob
             raise HTTPException(
                 status_code=detailedJob.code, detail=detailedJob.detail
             )
@@ -62,7 +130,8 @@ async def read_job(
             detailedJob.status = generalJobData[0].status
             return detailedJob
     elif len(generalJobData) == 0:
-        detailedJob = await scheduler.get_finished_job(jobId)
+        with span("get_finished_job"):
+            detailedJob = await scheduler.get_finished_job(jobId)
         if isinstance(detailedJob, HTTPResponse):
             raise HTTPException(
                 status_code=detailedJob.code, detail=detailedJob.detail
@@ -80,3 +149,17 @@ async def delete_job(
     if isinstance(ans, HTTPResponse):
         raise HTTPException(status_code=ans.code, detail=ans.detail)
     return JSONResponse(status_code=202, content={"detail": f"jobId: {jobId}"})
+
+
+@router.get("/{jobId}/output", response_model=JobOutput, responses=responses)
+async def read_job_output(
+    jobId: str,
+    tail: Optional[int] = None,
+    offset: Optional[int] = None,
+    length: Optional[int] = None,
+    scheduler: AbstractSchedulerRepository = Depends(scheduler),
+):
+    ans = await scheduler.get_job_output(jobId, tail, offset, length)
+    if isinstance(ans, HTTPResponse):
+        raise HTTPException(status_code=ans.code, detail=ans.detail)
+    return ans
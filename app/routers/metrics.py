@@ -0,0 +1,84 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.internal.metrics import REGISTRY
+from app.internal.settings import Settings
+from app.utils.taskscheduler import TaskScheduler
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=["metrics"],
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+SCHEDULER_SLOTS = REGISTRY.gauge(
+    "internal_scheduler_slots",
+    "Slots of the internal scheduler, by state",
+    ("state",),
+)
+SCHEDULER_MEMORY = REGISTRY.gauge(
+    "internal_scheduler_memory",
+    "Memory of the internal scheduler, by state",
+    ("state",),
+)
+SCHEDULER_UTILIZATION = REGISTRY.gauge(
+    "internal_scheduler_utilization",
+    "Fraction of the capacity of the internal scheduler in use, "
+    + "now and averaged since it started",
+    ("resource", "window"),
+)
+SCHEDULER_QUEUED = REGISTRY.gauge(
+    "internal_scheduler_queued_jobs",
+    "Jobs waiting in the internal scheduler",
+)
+SCHEDULER_REJECTED = REGISTRY.gauge(
+    "internal_scheduler_rejected_jobs",
+    "Jobs rejected by the internal scheduler since it started",
+)
+QUEUE_SLOTS = REGISTRY.gauge(
+    "internal_queue_slots",
+    "Slots of each queue of the internal scheduler, by state",
+    ("queue", "state"),
+)
+QUEUE_JOBS = REGISTRY.gauge(
+    "internal_queue_jobs",
+    "Jobs in each queue of the internal scheduler, by state",
+    ("queue", "state"),
+)
+
+
+def collect_scheduler():
+    if Settings.scheduler != "INTERNAL":
+        return
+    metrics = TaskScheduler.metrics()
+    SCHEDULER_SLOTS.set(metrics.totalSlots, "total")
+    SCHEDULER_SLOTS.set(metrics.usedSlots, "used")
+    SCHEDULER_MEMORY.set(metrics.totalMemory, "total")
+    SCHEDULER_MEMORY.set(metrics.usedMemory, "used")
+    SCHEDULER_UTILIZATION.set(metrics.slotUtilization, "slots", "current")
+    SCHEDULER_UTILIZATION.set(
+        metrics.averageSlotUtilization, "slots", "average"
+    )
+    SCHEDULER_UTILIZATION.set(metrics.memoryUtilization, "memory", "current")
+    SCHEDULER_UTILIZATION.set(
+        metrics.averageMemoryUtilization, "memory", "average"
+    )
+    SCHEDULER_QUEUED.set(metrics.queuedJobs)
+    SCHEDULER_REJECTED.set(metrics.rejectedJobs)
+    # Queues may be removed from the configuration between restarts
+    QUEUE_SLOTS.clear()
+    QUEUE_JOBS.clear()
+    for queue in TaskScheduler.queue_status():
+        QUEUE_SLOTS.set(queue.slots, queue.name, "total")
+        QUEUE_SLOTS.set(queue.usedSlots, queue.name, "used")
+        QUEUE_JOBS.set(queue.queuedJobs, queue.name, "queued")
+        QUEUE_JOBS.set(queue.runningJobs, queue.name, "running")
+
+
+REGISTRY.collector(collect_scheduler)
+
+
+@router.get("/", response_class=PlainTextResponse)
+async def read_metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
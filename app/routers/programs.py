@@ -1,10 +1,12 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header, Response
+from fastapi.responses import JSONResponse
 from typing import List, Optional
 from app.internal.httpresponse import HTTPResponse
 from app.models.program import Program
 
 from app.adapters.programpathrepository import AbstractProgramPathRepository
 from app.internal.dependencies import programPath
+from app.utils.programcatalog import ProgramCatalog, programs_version
 
 router = APIRouter(
     prefix="/programs",
@@ -12,22 +14,56 @@ router = APIRouter(
 )
 
 responses = {
+    304: {"detail": ""},
     404: {"detail": ""},
     500: {"detail": ""},
 }
 
 
-@router.get("/", response_model=List[Program])
+@router.get("/", response_model=List[Program], responses=responses)
 async def read_programs(
+    response: Response,
     name: Optional[str] = None,
     version: Optional[str] = None,
+    minVersion: Optional[str] = None,
+    belowVersion: Optional[str] = None,
+    ifNoneMatch: Optional[str] = Header(None, alias="If-None-Match"),
     programPath: AbstractProgramPathRepository = Depends(programPath),
-) -> List[Program]:
-    programs = await programPath.list_programs()
+):
+    catalog = ProgramCatalog.of(programPath)
+    programs = await catalog.query(
+        name or None, version or None, minVersion or None, belowVersion or None
+    )
     if isinstance(programs, HTTPResponse):
         raise HTTPException(status_code=programs.code, detail=programs.detail)
-    if name:
-        programs = [p for p in programs if p.name == name]
-    if version:
-        programs = [p for p in programs if p.version == version]
+    etag = f'"{programs_version(programs)}"'
+    if ifNoneMatch == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
     return programs
+
+
+@router.get("/{programId}", response_model=Program, responses=responses)
+async def read_program(
+    programId: str,
+    programPath: AbstractProgramPathRepository = Depends(programPath),
+):
+    catalog = ProgramCatalog.of(programPath)
+    program = await catalog.get(programId)
+    if isinstance(program, HTTPResponse):
+        raise HTTPException(status_code=program.code, detail=program.detail)
+    return program
+
+
+@router.post("/rescan", responses=responses)
+async def rescan_programs(
+    programPath: AbstractProgramPathRepository = Depends(programPath),
+):
+    catalog = ProgramCatalog.of(programPath)
+    programs = await catalog.list_programs(refresh=True)
+    if isinstance(programs, HTTPResponse):
+        raise HTTPException(status_code=programs.code, detail=programs.detail)
+    return JSONResponse(
+        status_code=200,
+        content={"version": catalog.version, "programs": len(programs)},
+    )
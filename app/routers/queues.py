@@ -0,0 +1,43 @@
+from fastapi import APIRouter, HTTPException, Depends
+from typing import List, Dict, Union
+from app.internal.httpresponse import HTTPResponse
+from app.models.queue import Queue
+
+from app.adapters.schedulerrepository import AbstractSchedulerRepository
+from app.internal.dependencies import scheduler
+
+router = APIRouter(
+    prefix="/queues",
+    tags=["queues"],
+)
+
+
+responses: Dict[Union[int, str], Dict[str, str]] = {
+    404: {"detail": ""},
+    500: {"detail": ""},
+    501: {"detail": ""},
+}
+
+
+@router.get("/", response_model=List[Queue], responses=responses)
+async def read_queues(
+    scheduler: AbstractSchedulerRepository = Depends(scheduler),
+):
+    ans = await scheduler.list_queues()
+    if isinstance(ans, HTTPResponse):
+        raise HTTPException(status_code=ans.code, detail=ans.detail)
+    return ans
+
+
+@router.get("/{name}", response_model=Queue, responses=responses)
+async def read_queue(
+    name: str,
+    scheduler: AbstractSchedulerRepository = Depends(scheduler),
+):
+    ans = await scheduler.list_queues()
+    if isinstance(ans, HTTPResponse):
+        raise HTTPException(status_code=ans.code, detail=ans.detail)
+    queues = [q for q in ans if q.name == name]
+    if len(queues) == 0:
+        raise HTTPException(status_code=404, detail=f"queue {name} not found")
+    return queues[0]
@@ -0,0 +1,196 @@
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Set
+from app.utils.workeragent import call
+
+
+def leftover(
+    freeSlots: float, slots: float, freeMemory: float, memory: float
+) -> float:
+    """
+    Fraction of the capacity of a node left free, summed over cores
+    and memory, used for best-fit packing.
+    """
+    value = 0.0
+    if slots > 0:
+        value += freeSlots / slots
+    if memory > 0:
+        value += freeMemory / memory
+    return value
+
+
+class AgentNode:
+    """
+    Scheduler side view of a worker agent, with the slots it advertises
+    and the jobs the scheduler has placed on it.
+    """
+
+    def __init__(self, address: str):
+        self.address = address
+        self.slots = 0
+        self.usedSlots = 0
+        self.memory = 0.0
+        self.usedMemory = 0.0
+        self.alive = False
+        self.lastSeen: Optional[float] = None
+        self.jobs: Set[str] = set()
+        self.usage: Dict[str, Dict[str, Any]] = {}
+        self.lost = asyncio.Event()
+
+    def free_slots(self) -> int:
+        if not self.alive:
+            return 0
+        return self.slots - self.usedSlots
+
+    def free_memory(self) -> float:
+        if not self.alive:
+            return 0.0
+        return self.memory - self.usedMemory
+
+    def fits(self, slots: int, memory: float) -> bool:
+        return self.free_slots() >= slots and self.free_memory() >= memory
+
+
+class AgentPool:
+    """
+    Pool of worker agents that the internal scheduler places jobs on.
+    Agents are pinged every heartbeat interval and considered lost
+    when they do not answer for longer than the heartbeat timeout.
+    """
+
+    def __init__(
+        self,
+        addresses: List[str],
+        interval: float,
+        timeout: float,
+        token: str = "",
+    ):
+        self.nodes = [AgentNode(a) for a in addresses]
+        self.interval = interval
+        self.timeout = timeout
+        self.token = token
+        self.started: Optional[float] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._heartbeat is None or self._heartbeat.done():
+            self.started = time.monotonic()
+            self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+            await self.heartbeat()
+
+    async def close(self):
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.heartbeat()
+
+    async def heartbeat(self):
+        await asyncio.gather(*[self._ping(n) for n in self.nodes])
+
+    async def _ping(self, node: AgentNode):
+        try:
+            info = await self.call(node, "info", timeout=self.interval)
+        except (OSError, RuntimeError, asyncio.TimeoutError):
+            # Agents never seen, as those of jobs adopted after a
+            # restart, are lost when they do not answer since the start
+            seen = node.lastSeen if node.lastSeen is not None else self.started
+            if seen is None:
+                return
+            if time.monotonic() - seen > self.timeout:
+                self.mark_lost(node)
+            return
+        if not node.alive:
+            node.lost = asyncio.Event()
+        node.alive = True
+        node.lastSeen = time.monotonic()
+        node.slots = int(info["slots"])
+        node.memory = float(info.get("memory", 0.0))
+        node.usage = info.get("usage", {})
+        await self._stop_orphans(node, info["jobs"])
+
+    async def _stop_orphans(self, node: AgentNode, jobs: List[str]):
+        # Jobs left running on an agent that was considered lost
+        # have already been rescheduled elsewhere
+        for jobId in set(jobs) - node.jobs:
+            try:
+                await self.call(
+                    node, "stop", {"jobId": jobId, "gracePeriod": 0}
+                )
+            except (OSError, RuntimeError, asyncio.TimeoutError):
+                pass
+
+    def mark_lost(self, node: AgentNode):
+        node.alive = False
+        node.lost.set()
+
+    def total_slots(self) -> int:
+        return sum([n.slots for n in self.nodes if n.alive])
+
+    def free_slots(self) -> int:
+        return sum([n.free_slots() for n in self.nodes])
+
+    def total_memory(self) -> float:
+        return sum([n.memory for n in self.nodes if n.alive])
+
+    def free_memory(self) -> float:
+        return sum([n.free_memory() for n in self.nodes])
+
+    def fits(self, slots: int, memory: float) -> bool:
+        """
+        Checks if any alive agent would fit the job when empty.
+        """
+        alive = [n for n in self.nodes if n.alive]
+        if len(alive) == 0:
+            return True
+        return any([n.slots >= slots and n.memory >= memory for n in alive])
+
+    def place(
+        self, jobId: str, slots: int, memory: float = 0.0
+    ) -> Optional[AgentNode]:
+        """
+        Reserves slots and memory for a job in the alive agent that
+        fits it best, that is, the one left with the least free
+        capacity, returning None if no agent fits the job.
+        """
+        candidates = [n for n in self.nodes if n.fits(slots, memory)]
+        if len(candidates) == 0:
+            return None
+        node = min(
+            candidates,
+            key=lambda n: leftover(
+                n.free_slots() - slots,
+                n.slots,
+                n.free_memory() - memory,
+                n.memory,
+            ),
+        )
+        self.reserve(node, jobId, slots, memory)
+        return node
+
+    def reserve(
+        self, node: AgentNode, jobId: str, slots: int, memory: float = 0.0
+    ):
+        node.usedSlots += slots
+        node.usedMemory += memory
+        node.jobs.add(jobId)
+
+    def release(
+        self, node: AgentNode, jobId: str, slots: int, memory: float = 0.0
+    ):
+        if jobId in node.jobs:
+            node.jobs.discard(jobId)
+            node.usedSlots -= slots
+            node.usedMemory -= memory
+
+    async def call(
+        self,
+        node: AgentNode,
+        method: str,
+        params: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        return await call(node.address, method, params, timeout, self.token)
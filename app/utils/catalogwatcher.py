@@ -0,0 +1,235 @@
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import struct
+from typing import Dict, List, Optional, Tuple
+from app.utils.programcatalog import ProgramCatalog
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def version_directories(roots: List[str]) -> List[Tuple[str, List[str]]]:
+    """
+    Lists the directories in each root, with the entry types given
+    by scandir, so that only symlinks need a stat.
+
+    :param roots: The program roots
+    :return: Each root with the directories in it
+    :rtype: List[Tuple[str, List[str]]]
+    """
+    directories: List[Tuple[str, List[str]]] = []
+    for root in roots:
+        with os.scandir(root) as entries:
+            directories.append((root, [e.path for e in entries if e.is_dir()]))
+    return directories
+
+
+class Inotify:
+    """
+    Minimal binding of the Linux inotify API through the C library,
+    for watching directories without any extra dependency.
+    """
+
+    def __init__(self):
+        name = ctypes.util.find_library("c") or "libc.so.6"
+        self._libc = ctypes.CDLL(name, use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError("inotify is not available")
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches: Dict[int, str] = {}
+
+    def add(self, path: str) -> int:
+        wd = self._libc.inotify_add_watch(
+            self.fd, os.fsencode(path), WATCH_MASK
+        )
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"cannot watch {path}")
+        self.watches[wd] = path
+        return wd
+
+    def read(self) -> List[Tuple[str, int, str]]:
+        """
+        Reads the pending events, as the watched path, the event
+        mask and the name of the entry that changed. Watches of
+        removed directories are forgotten, so that they are added
+        again if the directories are created again.
+        """
+        try:
+            content = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return []
+        events: List[Tuple[str, int, str]] = []
+        offset = 0
+        while offset < len(content):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(content, offset)
+            offset += EVENT_HEADER.size
+            name = content[offset : offset + length].rstrip(b"\0")
+            offset += length
+            events.append((self.watches.get(wd, ""), mask, os.fsdecode(name)))
+            if mask & (IN_IGNORED | IN_DELETE_SELF):
+                self.watches.pop(wd, None)
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class CatalogWatcher:
+    """
+    Keeps a program catalog updated as versions are installed or
+    removed, so listing the programs is a memory read. Changes are
+    seen with inotify on the program roots and version directories,
+    or by polling their mtimes, since inotify does not see changes
+    made by other NFS clients. Bursts of changes, as in a bulk
+    install, are listed again once, after the debounce interval,
+    but never later than a few intervals after the first change.
+    """
+
+    MODES = ["inotify", "poll"]
+    MAX_DEBOUNCES = 5
+
+    def __init__(
+        self,
+        catalog: ProgramCatalog,
+        mode: str = "inotify",
+        pollInterval: float = 30.0,
+        debounce: float = 2.0,
+    ):
+        self.catalog = catalog
+        self.mode = mode
+        self.pollInterval = pollInterval
+        self.debounce = debounce
+        self._inotify: Optional[Inotify] = None
+        self._poller: Optional[asyncio.Task] = None
+        self._pending: Optional[asyncio.TimerHandle] = None
+        self._first: Optional[float] = None
+        self._rescan: Optional[asyncio.Task] = None
+
+    async def start(self):
+        await self.catalog.list_programs(refresh=True)
+        self.catalog.watcher = self
+        if self.mode == "inotify":
+            try:
+                self._inotify = Inotify()
+                await self._watch()
+            except OSError:
+                if self._inotify is not None:
+                    self._inotify.close()
+                self._inotify = None
+        if self._inotify is not None:
+            loop = asyncio.get_running_loop()
+            loop.add_reader(self._inotify.fd, self._on_events)
+        else:
+            self._poller = asyncio.create_task(self._poll_loop())
+
+    async def close(self):
+        self.catalog.watcher = None
+        if self._pending is not None:
+            self._pending.cancel()
+        for task in [self._poller, self._rescan]:
+            if task is not None:
+                task.cancel()
+        self._stop_inotify()
+
+    def _stop_inotify(self):
+        if self._inotify is not None:
+            asyncio.get_running_loop().remove_reader(self._inotify.fd)
+            self._inotify.close()
+            self._inotify = None
+
+    async def _watch(self):
+        """
+        Watches the roots and the version directories in them. Roots
+        that do not exist make the watcher fall back to polling. The
+        roots are listed in an executor, and only the watches are
+        added in the event loop.
+        """
+        if self._inotify is None:
+            return
+        roots = [str(r) for r in self.catalog.repository.roots()]
+        loop = asyncio.get_running_loop()
+        directories = await loop.run_in_executor(
+            None, version_directories, roots
+        )
+        if self._inotify is None:
+            # Closed while the roots were listed
+            return
+        watched = set(self._inotify.watches.values())
+        for root, paths in directories:
+            if root not in watched:
+                self._inotify.add(root)
+            for path in paths:
+                if path not in watched:
+                    try:
+                        self._inotify.add(path)
+                    except OSError:
+                        # Removed right after being listed
+                        pass
+
+    def _on_events(self):
+        if self._inotify is None:
+            return
+        if len(self._inotify.read()) > 0:
+            self.changed()
+
+    async def _poll_loop(self):
+        while True:
+            await asyncio.sleep(self.pollInterval)
+            if not await self.catalog.is_valid():
+                self.changed()
+
+    def changed(self):
+        """
+        Schedules the programs to be listed again after the debounce
+        interval, which is restarted by each new change.
+        """
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if self._first is None:
+            self._first = now
+        if self._pending is not None:
+            self._pending.cancel()
+        deadline = self._first + self.MAX_DEBOUNCES * self.debounce
+        delay = max(min(self.debounce, deadline - now), 0.0)
+        self._pending = loop.call_later(delay, self._start_rescan)
+
+    def _start_rescan(self):
+        self._pending = None
+        self._first = None
+        self._rescan = asyncio.create_task(self.rescan())
+
+    async def rescan(self):
+        await self.catalog.list_programs(refresh=True)
+        try:
+            await self._watch()
+        except OSError:
+            # A removed root is only seen again by polling
+            self._stop_inotify()
+            if self._poller is None:
+                self._poller = asyncio.create_task(self._poll_loop())
@@ -0,0 +1,144 @@
+import os
+from typing import Dict, List, Optional
+
+
+def parse_cpulist(content: str) -> List[int]:
+    """
+    Parses a list of cpus in the format of /sys, like `0-3,8-11`.
+
+    :param content: The list of cpus
+    :return: The cpus in the list
+    :rtype: List[int]
+    """
+    cpus: List[int] = []
+    for part in content.strip().split(","):
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-")
+            cpus += list(range(int(first), int(last) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+class CoreMap:
+    """
+    Bitmap of the free cores of the host, grouped by NUMA node. Jobs
+    are given a contiguous set of cores inside a single node when
+    possible, so that their memory stays local to the socket.
+    """
+
+    def __init__(self, nodes: List[List[int]]):
+        self.nodes = [sorted(n) for n in nodes if len(n) > 0]
+        self.free = 0
+        for node in self.nodes:
+            for cpu in node:
+                self.free |= 1 << cpu
+        self.allocations: Dict[str, List[int]] = {}
+
+    @classmethod
+    def from_sys(cls, root: str = "/sys/devices/system/node") -> "CoreMap":
+        """
+        Reads the NUMA topology of the host, restricted to the cpus
+        the API is allowed to run on.
+        """
+        allowed = os.sched_getaffinity(0)
+        nodes: List[List[int]] = []
+        try:
+            entries = sorted(
+                [
+                    e
+                    for e in os.listdir(root)
+                    if e.startswith("node") and e[4:].isdigit()
+                ],
+                key=lambda e: int(e[4:]),
+            )
+        except OSError:
+            entries = []
+        for entry in entries:
+            try:
+                with open(os.path.join(root, entry, "cpulist")) as f:
+                    cpus = parse_cpulist(f.read())
+            except OSError:
+                continue
+            nodes.append([c for c in cpus if c in allowed])
+        if len(nodes) == 0:
+            nodes = [sorted(allowed)]
+        return cls(nodes)
+
+    def _is_free(self, cpu: int) -> bool:
+        return bool(self.free & (1 << cpu))
+
+    def free_cores(self, node: Optional[List[int]] = None) -> List[int]:
+        if node is not None:
+            return [c for c in node if self._is_free(c)]
+        return [c for n in self.nodes for c in n if self._is_free(c)]
+
+    def _contiguous(self, node: List[int], count: int) -> Optional[List[int]]:
+        run: List[int] = []
+        for cpu in node:
+            if not self._is_free(cpu):
+                run = []
+                continue
+            if len(run) > 0 and cpu != run[-1] + 1:
+                run = []
+            run.append(cpu)
+            if len(run) == count:
+                return run
+        return None
+
+    def _choose(self, count: int) -> Optional[List[int]]:
+        if count <= 0 or len(self.free_cores()) < count:
+            return None
+        # Nodes with less free cores are filled first, keeping whole
+        # nodes free for larger jobs
+        fitting = sorted(
+            [n for n in self.nodes if len(self.free_cores(n)) >= count],
+            key=lambda n: len(self.free_cores(n)),
+        )
+        for node in fitting:
+            cores = self._contiguous(node, count)
+            if cores is not None:
+                return cores
+        if len(fitting) > 0:
+            return self.free_cores(fitting[0])[:count]
+        # The job does not fit in a single node, so it is spread
+        # over as few nodes as possible
+        cores = []
+        for node in sorted(
+            self.nodes, key=lambda n: len(self.free_cores(n)), reverse=True
+        ):
+            cores += self.free_cores(node)[: count - len(cores)]
+            if len(cores) == count:
+                break
+        return cores
+
+    def allocate(self, jobId: str, count: int) -> Optional[List[int]]:
+        """
+        Reserves cores for a job, returning None if there are
+        not enough free cores.
+
+        :param jobId: The job the cores are reserved for
+        :param count: The number of cores
+        :return: The reserved cores
+        :rtype: Optional[List[int]]
+        """
+        cores = self._choose(count)
+        if cores is not None:
+            self.claim(jobId, cores)
+        return cores
+
+    def claim(self, jobId: str, cores: List[int]):
+        """
+        Marks a known set of cores as used by a job, as for jobs
+        adopted after a restart.
+        """
+        self.release(jobId)
+        for cpu in cores:
+            self.free &= ~(1 << cpu)
+        self.allocations[jobId] = list(cores)
+
+    def release(self, jobId: str):
+        for cpu in self.allocations.pop(jobId, []):
+            self.free |= 1 << cpu
@@ -0,0 +1,99 @@
+from typing import Dict, List, Optional
+
+DEFAULT_QUEUE = "default"
+
+
+class InternalQueue:
+    """
+    A named queue of the internal scheduler, with a budget of slots
+    that its jobs are guaranteed. A queue that borrows may also run
+    jobs in the idle slots of the other queues.
+    """
+
+    def __init__(self, name: str, slots: int, borrowing: bool = False):
+        self.name = name
+        self.slots = slots
+        self.borrowing = borrowing
+        self.startedJobs = 0
+        self.waitSeconds = 0.0
+
+    def started(self, waitSeconds: float):
+        self.startedJobs += 1
+        self.waitSeconds += waitSeconds
+
+    def average_wait(self) -> float:
+        if self.startedJobs == 0:
+            return 0.0
+        return self.waitSeconds / self.startedJobs
+
+
+def parse_queues(content: str, maxSlots: int) -> Dict[str, InternalQueue]:
+    """
+    Parses the queues in the format `name:slots[:borrow]`, separated
+    by commas. Unless given, the default queue gets the slots not
+    assigned to any other queue.
+
+    :param content: The queues, like `dessem:8:borrow,newave:24`
+    :param maxSlots: The total slots of the scheduler
+    :return: The queues, by name
+    :rtype: Dict[str, InternalQueue]
+    :raises ValueError: If a queue has no name or invalid slots
+    """
+    queues: Dict[str, InternalQueue] = {}
+    for item in content.split(","):
+        if not item.strip():
+            continue
+        fields = [f.strip() for f in item.split(":")]
+        if len(fields) < 2 or not fields[0]:
+            raise ValueError(f"queue {item.strip()} must be name:slots")
+        try:
+            slots = int(fields[1])
+        except ValueError:
+            slots = -1
+        if slots < 0:
+            raise ValueError(
+                f"queue {fields[0]} must have a non-negative number of "
+                + f"slots, not {fields[1]}"
+            )
+        borrowing = len(fields) > 2 and fields[2].lower() == "borrow"
+        queues[fields[0]] = InternalQueue(fields[0], slots, borrowing)
+    if DEFAULT_QUEUE not in queues:
+        assigned = sum([q.slots for q in queues.values()])
+        queues[DEFAULT_QUEUE] = InternalQueue(
+            DEFAULT_QUEUE,
+            max(maxSlots - assigned, 0),
+            borrowing=True,
+        )
+    return queues
+
+
+def parse_routes(content: str) -> Dict[str, str]:
+    """
+    Parses the routing of programs to queues in the format
+    `program:queue`, separated by commas.
+    """
+    routes: Dict[str, str] = {}
+    for item in content.split(","):
+        fields = [f.strip() for f in item.split(":")]
+        if len(fields) == 2 and fields[0] and fields[1]:
+            routes[fields[0].upper()] = fields[1]
+    return routes
+
+
+def route(
+    name: Optional[str], scriptFile: Optional[str], routes: Dict[str, str]
+) -> Optional[str]:
+    """
+    Finds the queue of a job by the program it runs, matched against
+    the beginning of the job name or a directory of its script.
+    """
+    candidates: List[str] = []
+    if name:
+        candidates.append(name.upper())
+    if scriptFile:
+        candidates += [p.upper() for p in scriptFile.split("/") if p]
+    for program, queue in routes.items():
+        for c in candidates:
+            if c.startswith(program):
+                return queue
+    return None
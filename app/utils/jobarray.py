@@ -0,0 +1,92 @@
+import os
+import shlex
+import tempfile
+from typing import List, Optional
+from app.models.job import Job
+from app.models.jobarray import JobArray
+
+
+def array_size(array: JobArray) -> Optional[int]:
+    """
+    The number of tasks of an array, or None if the lists of
+    working directories and args have different sizes.
+    """
+    sizes = [
+        len(values)
+        for values in [array.workingDirectories, array.args]
+        if values is not None
+    ]
+    if len(sizes) == 0 or len(set(sizes)) > 1:
+        return None
+    return sizes[0]
+
+
+def expand(array: JobArray) -> List[Job]:
+    """
+    Builds a job for each task of an array from its template.
+    """
+    size = array_size(array) or 0
+    jobs: List[Job] = []
+    for i in range(size):
+        job = array.template.copy(deep=True)
+        if array.workingDirectories is not None:
+            job.workingDirectory = array.workingDirectories[i]
+        if array.args is not None:
+            job.args = list(array.args[i])
+        jobs.append(job)
+    return jobs
+
+
+def write_array_script(array: JobArray, name: str) -> str:
+    """
+    Writes a script for submitting an array as a single job to
+    SGE or Torque. Each line of a tasks file holds the command of
+    a task, which the script runs according to the task index given
+    by the scheduler.
+
+    :param array: The job array
+    :param name: The prefix of the script and tasks files, created
+        in the working directory of the template with a unique
+        suffix, so that arrays with the same name do not overwrite
+        the tasks of each other
+    :return: The path of the script
+    :rtype: str
+    """
+    directory = str(array.template.workingDirectory)
+    fd, tasksFile = tempfile.mkstemp(
+        prefix=f"{name}.", suffix=".tasks", dir=directory
+    )
+    scriptFile = tasksFile[: -len(".tasks")] + ".sh"
+    with os.fdopen(fd, "w") as f:
+        for job in expand(array):
+            args = job.args if job.args is not None else []
+            command = " ".join(
+                [shlex.quote(a) for a in [str(job.scriptFile), *args]]
+            )
+            f.write(f"cd {shlex.quote(str(job.workingDirectory))}")
+            f.write(f" && {command}\n")
+    with open(scriptFile, "w") as f:
+        f.write("#!/bin/bash\n")
+        f.write('TASK_ID="${SGE_TASK_ID:-${PBS_ARRAYID}}"\n')
+        f.write(f'eval "$(sed -n "${{TASK_ID}}p" {shlex.quote(tasksFile)})"\n')
+    os.chmod(scriptFile, 0o755)
+    return scriptFile
+
+
+def compact_ranges(indexes: List[int]) -> str:
+    """
+    Writes a list of indexes as ranges, like `1-3,7`.
+    """
+    ranges: List[str] = []
+    start: Optional[int] = None
+    last: Optional[int] = None
+    for i in sorted(indexes):
+        if last is not None and i == last + 1:
+            last = i
+            continue
+        if start is not None:
+            ranges.append(str(start) if start == last else f"{start}-{last}")
+        start = last = i
+    if start is not None:
+        ranges.append(str(start) if start == last else f"{start}-{last}")
+    return ",".join(ranges)
@@ -0,0 +1,214 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from app.models.job import Job
+from app.models.jobstatus import JobStatus
+
+
+class JournalEntry:
+    """
+    The last recorded state of a job, with what is needed for
+    finding its process again after a restart.
+    """
+
+    def __init__(
+        self,
+        job: Job,
+        pid: Optional[int] = None,
+        startTicks: Optional[int] = None,
+        agent: Optional[str] = None,
+        preempted: bool = False,
+        ended: Optional[float] = None,
+    ):
+        self.job = job
+        self.pid = pid
+        self.startTicks = startTicks
+        self.agent = agent
+        self.preempted = preempted
+        self.ended = ended
+
+
+class JobJournal:
+    """
+    Write-ahead journal of the internal scheduler, stored in a SQLite
+    database in WAL mode. Records are buffered in memory and written
+    in a single transaction every flush interval, so the cost of the
+    fsync is shared by all the transitions in the interval.
+
+    Submissions are acknowledged before they are durable: a crash
+    loses up to one flush interval of records. Transitions, and jobs
+    stopped, older than the retention are pruned when flushing, except
+    for the last job, so that job ids are not reused.
+    """
+
+    SCHEMA = [
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            jobId INTEGER PRIMARY KEY,
+            job TEXT NOT NULL,
+            pid INTEGER,
+            startTicks INTEGER,
+            agent TEXT,
+            preempted INTEGER NOT NULL DEFAULT 0,
+            ended REAL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS transitions (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            jobId INTEGER NOT NULL,
+            status TEXT,
+            time REAL NOT NULL
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS transitions_time ON transitions (time)
+        """,
+    ]
+    # Columns missing in the journals of previous versions
+    COLUMNS = {
+        "preempted": "INTEGER NOT NULL DEFAULT 0",
+        "ended": "REAL",
+    }
+
+    def __init__(
+        self, path: str, flushInterval: float = 1.0, retention: float = 0.0
+    ):
+        self.path = path
+        self.flushInterval = flushInterval
+        self.retention = retention
+        # Guards the buffers, which are filled in the event loop and
+        # taken by flushes running in executor threads
+        self._lock = threading.Lock()
+        # Guards the connection and keeps the flushes in order
+        self._connectionLock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=FULL")
+        for statement in self.SCHEMA:
+            self._connection.execute(statement)
+        columns = [
+            row[1]
+            for row in self._connection.execute("PRAGMA table_info(jobs)")
+        ]
+        for name, definition in self.COLUMNS.items():
+            if name not in columns:
+                self._connection.execute(
+                    f"ALTER TABLE jobs ADD COLUMN {name} {definition}"
+                )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_ended ON jobs (ended)"
+        )
+        self._connection.commit()
+        self._pending: Dict[str, JournalEntry] = {}
+        self._transitions: List[Tuple[str, Optional[str], float]] = []
+        self._flusher: Optional[asyncio.Task] = None
+
+    def record(
+        self,
+        job: Job,
+        pid: Optional[int] = None,
+        startTicks: Optional[int] = None,
+        agent: Optional[str] = None,
+        preempted: bool = False,
+    ):
+        """
+        Buffers the current state of a job, to be written
+        in the next flush.
+        """
+        jobId = str(job.jobId)
+        status = job.status.value if job.status else None
+        now = time.time()
+        entry = JournalEntry(
+            job.copy(deep=True),
+            pid,
+            startTicks,
+            agent,
+            preempted,
+            now if job.status == JobStatus.STOPPED else None,
+        )
+        with self._lock:
+            self._pending[jobId] = entry
+            self._transitions.append((jobId, status, now))
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self._flusher is None or self._flusher.done():
+            self._flusher = loop.create_task(self._flush_later(loop))
+
+    async def _flush_later(self, loop: asyncio.AbstractEventLoop):
+        while len(self._transitions) > 0:
+            await asyncio.sleep(self.flushInterval)
+            await loop.run_in_executor(None, self.flush)
+
+    def flush(self):
+        """
+        Writes all the buffered records in a single transaction.
+        """
+        with self._connectionLock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                transitions, self._transitions = self._transitions, []
+            if len(pending) == 0 and len(transitions) == 0:
+                return
+            with self._connection:
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO jobs (jobId, job, pid, "
+                    + "startTicks, agent, preempted, ended) "
+                    + "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (
+                            int(k),
+                            e.job.json(),
+                            e.pid,
+                            e.startTicks,
+                            e.agent,
+                            int(e.preempted),
+                            e.ended,
+                        )
+                        for k, e in pending.items()
+                    ],
+                )
+                self._connection.executemany(
+                    "INSERT INTO transitions (jobId, status, time) "
+                    + "VALUES (?, ?, ?)",
+                    [(int(j), s, t) for j, s, t in transitions],
+                )
+                if self.retention > 0:
+                    cutoff = time.time() - self.retention
+                    self._connection.execute(
+                        "DELETE FROM transitions WHERE time < ?", (cutoff,)
+                    )
+                    self._connection.execute(
+                        "DELETE FROM jobs WHERE ended < ? "
+                        + "AND jobId < (SELECT MAX(jobId) FROM jobs)",
+                        (cutoff,),
+                    )
+
+    def load(self) -> List[JournalEntry]:
+        """
+        Reads the last recorded state of all the jobs,
+        ordered by jobId.
+        """
+        with self._connectionLock:
+            rows = self._connection.execute(
+                "SELECT job, pid, startTicks, agent, preempted, ended "
+                + "FROM jobs ORDER BY jobId"
+            ).fetchall()
+        return [
+            JournalEntry(
+                Job.parse_raw(job), pid, startTicks, agent, bool(p), ended
+            )
+            for job, pid, startTicks, agent, p, ended in rows
+        ]
+
+    def close(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        self.flush()
+        with self._connectionLock:
+            self._connection.close()
@@ -0,0 +1,160 @@
+import os
+import threading
+from collections import deque
+from typing import Deque, List, Tuple
+
+KB = 1024
+
+
+class OutputLog:
+    """
+    Reader of the output file of a job, which is written directly by
+    the job process. The latest lines are kept in a bounded buffer
+    that is updated only with the bytes appended since the last read,
+    so following a long job never loads its whole output.
+    """
+
+    MAX_READ = 1024 * KB
+    BLOCK_SIZE = 64 * KB
+
+    def __init__(self, path: str, maxLines: int = 1000):
+        self.path = path
+        # Each line is kept with the offset where it starts
+        self.lines: Deque[Tuple[int, str]] = deque(maxlen=maxLines)
+        self.offset = 0
+        self.partial = b""
+        self.skipped = False
+        # Reads run in executor threads, and a following request may
+        # read the same log while a previous one is still running
+        self.lock = threading.Lock()
+
+    def size(self) -> int:
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def _read(self, start: int, length: int) -> bytes:
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(start)
+                return f.read(length)
+        except OSError:
+            return b""
+
+    def refresh(self) -> int:
+        """
+        Reads the bytes appended to the file since the last refresh,
+        up to MAX_READ, into the buffer of latest lines.
+
+        :return: The current size of the file
+        :rtype: int
+        """
+        size = self.size()
+        if size < self.offset:
+            self.lines.clear()
+            self.offset = 0
+            self.partial = b""
+            self.skipped = False
+        if size == self.offset:
+            return size
+        start = max(self.offset, size - self.MAX_READ)
+        data = self._read(start, size - start)
+        if start > self.offset:
+            # The lines in between were not read, so the ones in the
+            # buffer are no longer the latest
+            self.lines.clear()
+            self.partial = b""
+            self.skipped = True
+            skip = data.find(b"\n") + 1
+            data = data[skip:]
+            start += skip
+        lineStart = start - len(self.partial)
+        data = self.partial + data
+        parts = data.split(b"\n")
+        self.partial = parts.pop()
+        for p in parts:
+            self.lines.append((lineStart, p.decode("utf-8", "replace")))
+            lineStart += len(p) + 1
+        self.offset = size
+        return size
+
+    def _buffered(self) -> List[Tuple[int, str]]:
+        lines = list(self.lines)
+        if len(self.partial) > 0:
+            lines.append(
+                (
+                    self.offset - len(self.partial),
+                    self.partial.decode("utf-8", "replace"),
+                )
+            )
+        return lines
+
+    def _whole_file_buffered(self) -> bool:
+        if self.skipped or self.lines.maxlen is None:
+            return False
+        return len(self.lines) < self.lines.maxlen and (
+            len(self.lines) == 0 or self.lines[0][0] == 0
+        )
+
+    def tail(self, n: int) -> Tuple[int, int, str]:
+        """
+        Reads the last lines of the file, from the buffer when it
+        holds enough lines, or else reading the file backwards.
+
+        :param n: The number of lines
+        :return: The offset of the first line, the size of the file
+            and the content read
+        :rtype: Tuple[int, int, str]
+        """
+        with self.lock:
+            return self._tail(n)
+
+    def _tail(self, n: int) -> Tuple[int, int, str]:
+        size = self.refresh()
+        lines = self._buffered()
+        if n <= 0:
+            return size, size, ""
+        if len(lines) >= n or self._whole_file_buffered():
+            lines = lines[-n:]
+            if len(lines) == 0:
+                return size, size, ""
+            content = "\n".join([line for _, line in lines])
+            if len(self.partial) == 0:
+                content += "\n"
+            return lines[0][0], size, content
+        return self._tail_from_file(n, size)
+
+    def _tail_from_file(self, n: int, size: int) -> Tuple[int, int, str]:
+        start = size
+        data = b""
+        # A trailing newline does not start a new line
+        wanted = n + 1 if self._read(size - 1, 1) == b"\n" else n
+        while start > 0 and size - start < self.MAX_READ:
+            length = min(self.BLOCK_SIZE, start)
+            start -= length
+            data = self._read(start, length) + data
+            if data.count(b"\n") >= wanted:
+                break
+        parts = data.split(b"\n")
+        if len(parts) > wanted:
+            skip = len(b"\n".join(parts[: len(parts) - wanted])) + 1
+            data = data[skip:]
+            start += skip
+        return start, size, data.decode("utf-8", "replace")
+
+    def read_range(self, offset: int, length: int) -> Tuple[int, int, str]:
+        """
+        Reads a range of bytes of the file, up to MAX_READ.
+
+        :param offset: The first byte to read
+        :param length: The number of bytes to read
+        :return: The offset read, the size of the file and the
+            content read
+        :rtype: Tuple[int, int, str]
+        """
+        size = self.size()
+        offset = min(max(offset, 0), size)
+        length = min(max(length, 0), self.MAX_READ)
+        data = self._read(offset, length)
+        return offset, size, data.decode("utf-8", "replace")
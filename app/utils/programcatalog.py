@@ -0,0 +1,312 @@
+import asyncio
+import bisect
+import hashlib
+import json
+import os
+import re
+import shlex
+import time
+from typing import Any, Dict, List, Optional, Tuple, Type, Union
+from app.adapters.programpathrepository import AbstractProgramPathRepository
+from app.internal.httpresponse import HTTPResponse
+from app.internal.metrics import CATALOG_REQUESTS
+from app.models.job import Job
+from app.models.program import Program
+
+SLOTS_PLACEHOLDER = "N_PROC"
+LATEST = "latest"
+# Coarsest mtime resolution among the filesystems the programs are
+# installed in, which is one second on some NFS servers
+MTIME_RESOLUTION = 2.0
+
+
+def mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def snapshot(roots: List[str]) -> Dict[str, Optional[int]]:
+    """
+    Reads the mtimes of the program roots and of the entries in
+    them, one for each version. A version installed or removed
+    changes the mtime of its root, while the files of a version
+    changed in place change the mtime of the version directory.
+    """
+    mtimes: Dict[str, Optional[int]] = {}
+    for root in roots:
+        mtimes[root] = mtime(root)
+        try:
+            entries = os.listdir(root)
+        except OSError:
+            continue
+        for entry in entries:
+            path = os.path.join(root, entry)
+            mtimes[path] = mtime(path)
+    return mtimes
+
+
+def unchanged(mtimes: Dict[str, Optional[int]]) -> bool:
+    return all([mtime(p) == m for p, m in mtimes.items()])
+
+
+def version_key(version: str) -> Tuple[Tuple[int, Any], ...]:
+    """
+    Sorting key of a version, such as v28.16.4 or 19.0.24, with the
+    numbers in it compared as numbers, so that v28.16.4 comes after
+    v28.6.2 and v29 after both. The leading v is ignored.
+    """
+    parts = re.findall(r"\d+|[^\W\d_]+", version.lstrip("vV"))
+    return tuple(
+        [(1, int(p)) if p.isdigit() else (0, p.lower()) for p in parts]
+    )
+
+
+def sort_programs(programs: List[Program]) -> List[Program]:
+    """
+    Orders the programs by version, keeping the versions of
+    each program together, in the order the programs are found.
+    """
+    names: Dict[str, int] = {}
+    for p in programs:
+        names.setdefault(p.name, len(names))
+    return sorted(
+        programs, key=lambda p: (names[p.name], version_key(p.version))
+    )
+
+
+def programs_version(programs: List[Program]) -> str:
+    """
+    A hash of a list of programs, which changes whenever a program
+    in the list changes, used as its ETag.
+    """
+    return hashlib.sha1(
+        json.dumps([p.dict() for p in programs]).encode("utf-8")
+    ).hexdigest()[:16]
+
+
+class ProgramCatalog:
+    """
+    In-memory catalog of the programs found by a program path
+    repository. The programs are listed again only when the mtime
+    of a program root or of a version directory changes, so a
+    request costs a stat for each version instead of a listdir.
+    While a watcher keeps the catalog updated, the programs are
+    read from memory without any check.
+    """
+
+    CATALOGS: Dict[type, "ProgramCatalog"] = {}
+
+    def __init__(self, repository: Type[AbstractProgramPathRepository]):
+        self.repository = repository
+        self.programs: Optional[List[Program]] = None
+        self.byId: Dict[str, Program] = {}
+        self.byVersion: Dict[Tuple[str, str], Program] = {}
+        self.byName: Dict[str, List[Program]] = {}
+        self.keys: Dict[str, List[Tuple[Tuple[int, Any], ...]]] = {}
+        self.version = ""
+        self.scans = 0
+        self._mtimes: Optional[Dict[str, Optional[int]]] = None
+        self._lock = asyncio.Lock()
+        self.watcher: Optional[Any] = None
+
+    @classmethod
+    def of(
+        cls, repository: Type[AbstractProgramPathRepository]
+    ) -> "ProgramCatalog":
+        if repository not in cls.CATALOGS:
+            cls.CATALOGS[repository] = ProgramCatalog(repository)
+        return cls.CATALOGS[repository]
+
+    async def is_valid(self) -> bool:
+        if self.programs is None or self._mtimes is None:
+            return False
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, unchanged, self._mtimes)
+
+    async def _scan(self) -> Union[List[Program], HTTPResponse]:
+        loop = asyncio.get_running_loop()
+        roots = [str(r) for r in self.repository.roots()]
+        start = time.time_ns()
+        # The mtimes are read before listing, so changes made during
+        # the listing are seen in the next validation
+        mtimes = await loop.run_in_executor(None, snapshot, roots)
+        programs = await self.repository.list_programs()
+        if isinstance(programs, HTTPResponse):
+            return programs
+        self.scans += 1
+        programs = sort_programs(programs)
+        self.programs = programs
+        self.byId = {p.programId: p for p in programs}
+        self.byVersion = {(p.name, p.version): p for p in programs}
+        self.byName = {}
+        for p in programs:
+            self.byName.setdefault(p.name, []).append(p)
+        self.keys = {
+            n: [version_key(p.version) for p in ps]
+            for n, ps in self.byName.items()
+        }
+        self.version = programs_version(programs)
+        # Directories changed in the last instants may change again
+        # without a new mtime, so they are not trusted
+        racy = start - int(MTIME_RESOLUTION * 1e9)
+        if any([m is not None and m >= racy for m in mtimes.values()]):
+            self._mtimes = None
+        else:
+            self._mtimes = mtimes
+        return programs
+
+    async def list_programs(
+        self, refresh: bool = False
+    ) -> Union[List[Program], HTTPResponse]:
+        watched = self.watcher is not None and self.programs is not None
+        if watched and not refresh:
+            CATALOG_REQUESTS.inc("hit")
+            return self.programs or []
+        async with self._lock:
+            if refresh or not await self.is_valid():
+                CATALOG_REQUESTS.inc("miss")
+                return await self._scan()
+            CATALOG_REQUESTS.inc("hit")
+            return self.programs or []
+
+    def latest(self, name: str) -> Optional[Program]:
+        versions = self.byName.get(name, [])
+        return versions[-1] if len(versions) > 0 else None
+
+    def versions(
+        self,
+        name: str,
+        minVersion: Optional[str] = None,
+        belowVersion: Optional[str] = None,
+    ) -> List[Program]:
+        """
+        The versions of a program from minVersion, inclusive, up to
+        belowVersion, exclusive, in order, found by bisection in the
+        index of the program.
+        """
+        keys = self.keys.get(name, [])
+        lo = bisect.bisect_left(keys, version_key(minVersion or ""))
+        hi = len(keys)
+        if belowVersion is not None:
+            hi = bisect.bisect_left(keys, version_key(belowVersion))
+        return self.byName.get(name, [])[lo:hi]
+
+    async def query(
+        self,
+        name: Optional[str] = None,
+        version: Optional[str] = None,
+        minVersion: Optional[str] = None,
+        belowVersion: Optional[str] = None,
+    ) -> Union[List[Program], HTTPResponse]:
+        """
+        Lists the programs with the given name and version, or in the
+        given range of versions, in version order. The version may be
+        `latest`. Unless a watcher keeps the catalog updated, the name
+        and exact version filters are passed to the repository, which
+        only looks at the matching directories, at a fraction of the
+        cost of validating the whole catalog.
+        """
+        ranged = minVersion is not None or belowVersion is not None
+        if ranged or version == LATEST:
+            programs = await self.list_programs()
+            if isinstance(programs, HTTPResponse):
+                return programs
+            matches: List[Program] = []
+            for n in [name] if name is not None else list(self.byName):
+                versions = self.versions(n, minVersion, belowVersion)
+                if version == LATEST:
+                    versions = versions[-1:]
+                elif version is not None:
+                    versions = [p for p in versions if p.version == version]
+                matches += versions
+            return matches
+        if name is None and version is None:
+            return await self.list_programs()
+        if self.watcher is None or self.programs is None:
+            programs = await self.repository.list_programs(name, version)
+            if isinstance(programs, HTTPResponse):
+                return programs
+            return sort_programs(programs)
+        if name is not None and version is not None:
+            program = self.byVersion.get((name, version))
+            return [program] if program is not None else []
+        if name is not None:
+            return list(self.byName.get(name, []))
+        return [p for p in self.programs if p.version == version]
+
+    async def find(
+        self, programId: str, version: Optional[str] = None
+    ) -> Union[Program, HTTPResponse]:
+        """
+        Finds a program by its programId or by its name, with the
+        given version, which may be `latest`.
+        """
+        programs = await self.list_programs()
+        if isinstance(programs, HTTPResponse):
+            return programs
+        if programId in self.byId:
+            matches = [self.byId[programId]]
+            if version not in [None, LATEST, matches[0].version]:
+                matches = []
+        elif version == LATEST:
+            program = self.latest(programId)
+            matches = [program] if program is not None else []
+        elif version is not None:
+            program = self.byVersion.get((programId, version))
+            matches = [program] if program is not None else []
+        else:
+            matches = self.byName.get(programId, [])
+        if len(matches) == 1:
+            return matches[0]
+        if len(matches) > 1:
+            return HTTPResponse(
+                code=400,
+                detail=f"program {programId} has many versions, "
+                + "programVersion is mandatory",
+            )
+        return HTTPResponse(
+            code=404,
+            detail=f"program {programId} not found"
+            + (f" with version {version}" if version else ""),
+        )
+
+    async def get(self, programId: str) -> Union[Program, HTTPResponse]:
+        programs = await self.list_programs()
+        if isinstance(programs, HTTPResponse):
+            return programs
+        program = self.byId.get(programId)
+        if program is None:
+            return HTTPResponse(
+                code=404, detail=f"program {programId} not found"
+            )
+        return program
+
+    async def resolve(self, job: Job) -> Optional[HTTPResponse]:
+        """
+        Fills the scriptFile and args of a job submitted by programId
+        from the program found. The number of processes given to the
+        program is the number of reserved slots of the job, and the
+        args of the job are given after the ones of the program.
+        """
+        if not job.programId:
+            return None
+        program = await self.find(job.programId, job.programVersion)
+        if isinstance(program, HTTPResponse):
+            return program
+        if not job.reservedSlots:
+            return HTTPResponse(code=400, detail="reservedSlots is mandatory")
+        # Some rules give the version as an arg of a shared script
+        executable = shlex.split(program.executablePath)
+        args = [
+            str(job.reservedSlots) if a == SLOTS_PLACEHOLDER else a
+            for a in program.args or []
+        ]
+        job.scriptFile = executable[0]
+        job.args = [*executable[1:], *args, *(job.args or [])]
+        job.programId = program.programId
+        job.programVersion = program.version
+        if not job.name:
+            job.name = f"{program.name}-{program.version}"
+        return None
@@ -0,0 +1,126 @@
+import json
+import re
+import string
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+VERSION_FIELD = "version"
+KINDS = ["directory", "file"]
+
+
+def entry_pattern(entry: str, version: str) -> str:
+    """
+    Builds the regular expression of the names of the version entries,
+    with the literal parts of the entry template escaped and the
+    version placeholder replaced by the version expression.
+
+    :param entry: Template of the entry names, such as `dessem_{version}`
+    :param version: Regular expression of the versions
+    :return: The regular expression, with a `version` group
+    :rtype: str
+    """
+    parts = entry.split("{" + VERSION_FIELD + "}")
+    if len(parts) != 2:
+        raise ValueError(f"entry {entry} must contain {{version}} once")
+    return (
+        re.escape(parts[0])
+        + f"(?P<{VERSION_FIELD}>{version})"
+        + re.escape(parts[1])
+    )
+
+
+class ProgramRule:
+    """
+    Rule for finding the versions of a program, declared in a rules
+    file instead of in code. Each version is an entry of the root
+    whose name matches the entry template, either a directory or a
+    file. The expressions are compiled once, when the rule is built,
+    so entries that do not match are skipped before any other access
+    to the filesystem.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        idPrefix: str,
+        root: str,
+        entry: str = "{version}",
+        version: str = ".+",
+        kind: str = "directory",
+        executable: Optional[str] = None,
+        command: Optional[str] = None,
+        args: Optional[List[str]] = None,
+        required: bool = False,
+    ):
+        if kind not in KINDS:
+            raise ValueError(f"kind must be one of {KINDS}")
+        if executable is not None and kind != "directory":
+            raise ValueError("executable requires kind directory")
+        self.name = name
+        self.idPrefix = idPrefix
+        self.root = Path(root)
+        self.entry = entry
+        self.kind = kind
+        self.pattern = re.compile(entry_pattern(entry, version))
+        self.executable = re.compile(executable) if executable else None
+        if command is None:
+            command = "{executable}" if executable else "{path}"
+        fields = {"path", "executable", *self.pattern.groupindex.keys()}
+        for _, field, _, _ in string.Formatter().parse(command):
+            if field is not None and field not in fields:
+                raise ValueError(f"unknown field {field} in {command}")
+            if field == "executable" and executable is None:
+                raise ValueError("{executable} requires executable")
+        self.command = command
+        self.args = args or []
+        self.required = required
+
+    def match(self, entry: str) -> Optional[Dict[str, str]]:
+        """
+        Matches the name of an entry of the root, returning the
+        version and the other named groups of the version expression,
+        or None if the entry is not a version.
+        """
+        m = self.pattern.fullmatch(entry)
+        if m is None:
+            return None
+        return {k: v for k, v in m.groupdict().items() if v is not None}
+
+    def entry_of(self, version: str) -> Optional[str]:
+        """
+        The name of the entry of a version, or None if the rule
+        does not accept it.
+        """
+        entry = self.entry.replace("{" + VERSION_FIELD + "}", version)
+        if self.match(entry) is None:
+            return None
+        return entry
+
+    def command_of(
+        self, path: str, groups: Dict[str, str], executable: Optional[str]
+    ) -> str:
+        return self.command.format(path=path, executable=executable, **groups)
+
+
+def compile_rules(path: str) -> List[ProgramRule]:
+    """
+    Reads and compiles a rules file, which is a JSON object with a
+    `programs` list, one element with the arguments of a ProgramRule
+    for each program.
+
+    :param path: The rules file
+    :return: The rules, in the order of the file
+    :rtype: List[ProgramRule]
+    """
+    with open(path, "r") as f:
+        content: Dict[str, Any] = json.load(f)
+    rules: List[ProgramRule] = []
+    for i, spec in enumerate(content.get("programs", [])):
+        try:
+            rule = ProgramRule(**spec)
+        except (TypeError, ValueError, re.error) as e:
+            raise ValueError(f"{path}: program {i}: {e}") from e
+        if rule.name in [r.name for r in rules]:
+            raise ValueError(f"{path}: program {rule.name} is repeated")
+        rules.append(rule)
+    return rules
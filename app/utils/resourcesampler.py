@@ -0,0 +1,168 @@
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+from app.models.resourceusage import ResourceUsage
+
+B_TO_GB = 1073741824
+
+
+def host_memory() -> float:
+    """
+    The physical memory of the host, in GB.
+    """
+    return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / B_TO_GB
+
+
+class _ProcessStat:
+    """
+    The fields of /proc/[pid]/stat used for sampling.
+    """
+
+    __slots__ = ["ppid", "cpuTicks", "rssPages", "ioWaitTicks"]
+
+    def __init__(
+        self, ppid: int, cpuTicks: int, rssPages: int, ioWaitTicks: int
+    ):
+        self.ppid = ppid
+        self.cpuTicks = cpuTicks
+        self.rssPages = rssPages
+        self.ioWaitTicks = ioWaitTicks
+
+
+class _JobState:
+    """
+    Values accumulated between samples of the same job.
+    """
+
+    __slots__ = [
+        "cpuSeconds",
+        "memoryCpuSeconds",
+        "maxTotalMemory",
+        "processIO",
+    ]
+
+    def __init__(self):
+        self.cpuSeconds = 0.0
+        self.memoryCpuSeconds = 0.0
+        self.maxTotalMemory = 0.0
+        self.processIO = 0.0
+
+
+class ResourceSampler:
+    """
+    Samples the resource usage of process trees from /proc. All the
+    trees are sampled in a single pass over the process table, so the
+    cost of a sample grows with the number of processes in the host
+    and not with the number of sampled jobs.
+
+    The values follow the units reported by SGE: CPU in seconds,
+    memory in GB, memory usage in GB * CPU seconds and IO in GB.
+    """
+
+    def __init__(self, procRoot: str = "/proc"):
+        self.procRoot = procRoot
+        self.clockTicks = os.sysconf("SC_CLK_TCK")
+        self.pageSize = os.sysconf("SC_PAGE_SIZE")
+        self.states: Dict[str, _JobState] = {}
+
+    def _read_stat(self, pid: int) -> Optional[_ProcessStat]:
+        try:
+            with open(f"{self.procRoot}/{pid}/stat", "rb") as f:
+                content = f.read()
+        except OSError:
+            return None
+        # The process name may contain spaces and parenthesis
+        fields = content[content.rfind(b")") + 2 :].split()
+        if len(fields) < 40:
+            return None
+        return _ProcessStat(
+            ppid=int(fields[1]),
+            cpuTicks=sum([int(f) for f in fields[11:15]]),
+            rssPages=int(fields[21]),
+            ioWaitTicks=int(fields[39]),
+        )
+
+    def _read_io(self, pid: int) -> int:
+        try:
+            with open(f"{self.procRoot}/{pid}/io", "rb") as f:
+                content = f.read()
+        except OSError:
+            return 0
+        transferred = 0
+        for line in content.split(b"\n"):
+            if line.startswith(b"rchar:") or line.startswith(b"wchar:"):
+                transferred += int(line.split(b":")[1])
+        return transferred
+
+    def _process_table(self) -> Dict[int, _ProcessStat]:
+        table: Dict[int, _ProcessStat] = {}
+        for entry in os.listdir(self.procRoot):
+            if not entry.isdigit():
+                continue
+            stat = self._read_stat(int(entry))
+            if stat is not None:
+                table[int(entry)] = stat
+        return table
+
+    @staticmethod
+    def _tree(root: int, children: Dict[int, List[int]]) -> List[int]:
+        pids = [root]
+        idx = 0
+        while idx < len(pids):
+            pids += children.get(pids[idx], [])
+            idx += 1
+        return pids
+
+    def _usage(
+        self, jobId: str, pids: List[int], table: Dict[int, _ProcessStat]
+    ) -> ResourceUsage:
+        state = self.states.setdefault(jobId, _JobState())
+        # Children reaped by a process in the tree are accounted
+        # in its cutime and cstime fields
+        cpuSeconds = sum([table[p].cpuTicks for p in pids]) / self.clockTicks
+        memory = (
+            sum([table[p].rssPages for p in pids]) * self.pageSize / B_TO_GB
+        )
+        io = sum([self._read_io(p) for p in pids]) / B_TO_GB
+        ioWait = sum([table[p].ioWaitTicks for p in pids]) / self.clockTicks
+        state.memoryCpuSeconds += memory * max(
+            cpuSeconds - state.cpuSeconds, 0.0
+        )
+        state.cpuSeconds = max(cpuSeconds, state.cpuSeconds)
+        state.maxTotalMemory = max(memory, state.maxTotalMemory)
+        # IO counters of exited processes are lost with them
+        state.processIO = max(io, state.processIO)
+        return ResourceUsage(
+            cpuSeconds=state.cpuSeconds,
+            memoryCpuSeconds=state.memoryCpuSeconds,
+            instantTotalMemory=memory,
+            maxTotalMemory=state.maxTotalMemory,
+            processIO=state.processIO,
+            processIOWaiting=ioWait,
+            timeInstant=datetime.now(),
+        )
+
+    def sample(self, roots: Dict[str, int]) -> Dict[str, ResourceUsage]:
+        """
+        Samples the process trees of a set of jobs.
+
+        :param roots: The pid of the root process of each job
+        :return: The resource usage of each job still alive
+        :rtype: Dict[str, ResourceUsage]
+        """
+        for jobId in list(self.states.keys()):
+            if jobId not in roots:
+                self.states.pop(jobId)
+        if len(roots) == 0:
+            return {}
+        table = self._process_table()
+        children: Dict[int, List[int]] = {}
+        for pid, stat in table.items():
+            children.setdefault(stat.ppid, []).append(pid)
+        usages: Dict[str, ResourceUsage] = {}
+        for jobId, root in roots.items():
+            if root not in table:
+                continue
+            pids = self._tree(root, children)
+            usages[jobId] = self._usage(jobId, pids, table)
+        return usages
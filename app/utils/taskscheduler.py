@@ -1,18 +1,73 @@
 import asyncio
-from typing import Dict, Any
-from os import chdir
+import logging
+import os
+import shlex
+import time
+from typing import Dict, Any, List, Optional, Set, Tuple, Union
 from datetime import datetime
 from app.models.job import Job
 from app.models.jobstatus import JobStatus
+from app.models.resourceusage import ResourceUsage
+from app.models.schedulermetrics import SchedulerMetrics
+from app.models.queue import Queue
+from app.models.jobarray import JobArray, JobArrayStatus
 from app.utils.singleton import Singleton
-from app.internal.terminal import run_terminal_retry
+from app.utils.agentpool import AgentNode, AgentPool, leftover
+from app.utils.resourcesampler import ResourceSampler, host_memory
+from app.utils.jobjournal import JobJournal
+from app.utils.outputlog import OutputLog
+from app.utils.coremap import CoreMap
+from app.utils.jobarray import compact_ranges, expand
+from app.utils.internalqueue import (
+    DEFAULT_QUEUE,
+    InternalQueue,
+    parse_queues,
+    parse_routes,
+    route,
+)
+from app.internal.terminal import (
+    AdoptedProcess,
+    process_affinity,
+    process_start_ticks,
+    start_terminal,
+    terminate_process_group,
+)
 from app.internal.settings import Settings
 
+# Child of the logger configured by uvicorn, as the timing lines
+logger = logging.getLogger("uvicorn.scheduler")
+
+AGENT_ERRORS = (OSError, RuntimeError, asyncio.TimeoutError)
+CONNECTION_ERRORS = (OSError, asyncio.TimeoutError)
+Process = Union[asyncio.subprocess.Process, AdoptedProcess]
+
 
 class TaskScheduler(metaclass=Singleton):
     TASKS: Dict[str, asyncio.Task] = dict()
     JOBS: Dict[str, Job] = dict()
+    PROCESSES: Dict[str, Process] = dict()
+    PLACEMENTS: Dict[str, AgentNode] = dict()
+    TERMINATIONS: Dict[str, asyncio.Task] = dict()
+    STOP_LATENCIES: Dict[str, float] = dict()
+    AGENTS: Optional[AgentPool] = None
+    SAMPLER: Optional[asyncio.Task] = None
+    JOURNAL: Optional[JobJournal] = None
+    OUTPUTS: Dict[str, OutputLog] = dict()
+    WAITING: Dict[str, asyncio.Future] = dict()
+    PREEMPTED: Set[str] = set()
+    QUEUES: Optional[Dict[str, InternalQueue]] = None
+    SUBMISSIONS: Dict[str, datetime] = dict()
+    ARRAYS: Dict[str, List[str]] = dict()
+    CORES: Optional[CoreMap] = None
     MAX_SLOTS = Settings.max_slots
+    MAX_MEMORY = Settings.max_memory or host_memory()
+    POLL_INTERVAL = 5.0
+    # Launches refused by agents in a row before the job is given up
+    LAUNCH_ATTEMPTS = 3
+    REJECTED = 0
+    # Integrals of the used capacity over time, for the metrics
+    USAGE_INTEGRALS = [0.0, 0.0, 0.0]
+    LAST_ACCOUNTED: Optional[float] = None
 
     @classmethod
     def tasks(cls) -> Dict[str, asyncio.Task]:
@@ -22,56 +77,1075 @@ class TaskScheduler(metaclass=Singleton):
     def jobs(cls) -> Dict[str, Job]:
         return cls.JOBS
 
+    @classmethod
+    def processes(cls) -> Dict[str, Process]:
+        return cls.PROCESSES
+
+    @classmethod
+    def journal(cls) -> Optional[JobJournal]:
+        """
+        The journal where submissions and state transitions are
+        recorded, when INTERNAL_SCHEDULER_JOURNAL is set.
+        """
+        if cls.JOURNAL is None and Settings.journal:
+            cls.JOURNAL = JobJournal(
+                Settings.journal,
+                Settings.journal_flush_interval,
+                Settings.journal_retention,
+            )
+        return cls.JOURNAL
+
+    @classmethod
+    def _record(cls, job: Job) -> None:
+        journal = cls.journal()
+        if journal is None:
+            return
+        jobId = str(job.jobId)
+        proc = cls.processes().get(jobId)
+        node = cls.PLACEMENTS.get(jobId)
+        journal.record(
+            job,
+            pid=proc.pid if proc is not None else None,
+            startTicks=(
+                process_start_ticks(proc.pid) if proc is not None else None
+            ),
+            agent=node.address if node is not None else None,
+            preempted=jobId in cls.PREEMPTED,
+        )
+
+    @classmethod
+    def cores(cls) -> Optional[CoreMap]:
+        """
+        The map of the cores local jobs are pinned to, when
+        INTERNAL_SCHEDULER_CPU_AFFINITY is set.
+        """
+        if cls.CORES is None and Settings.cpu_affinity:
+            cls.CORES = CoreMap.from_sys()
+        return cls.CORES
+
+    @classmethod
+    def queues(cls) -> Dict[str, InternalQueue]:
+        """
+        The queues of the internal scheduler, given by
+        INTERNAL_SCHEDULER_QUEUES, with the default queue.
+        """
+        if cls.QUEUES is None:
+            try:
+                cls.QUEUES = parse_queues(Settings.queues, cls.MAX_SLOTS)
+            except ValueError as e:
+                raise ValueError(f"INTERNAL_SCHEDULER_QUEUES: {e}") from e
+        return cls.QUEUES
+
+    @classmethod
+    def route(cls, job: Job) -> Optional[str]:
+        """
+        The queue a job is placed in: the one it asks for, or else
+        the one of its program, or else the default queue. Returns
+        None if the job asks for a queue that does not exist.
+        """
+        if job.queue:
+            return job.queue if job.queue in cls.queues() else None
+        name = route(
+            job.name, job.scriptFile, parse_routes(Settings.queue_routes)
+        )
+        if name is not None and name in cls.queues():
+            return name
+        return DEFAULT_QUEUE
+
+    @classmethod
+    def _queue_usage(cls) -> Dict[str, int]:
+        usage = {name: 0 for name in cls.queues().keys()}
+        for job in cls._running_jobs():
+            name = job.queue or DEFAULT_QUEUE
+            usage[name] = usage.get(name, 0) + int(job.reservedSlots or 0)
+        return usage
+
+    @classmethod
+    def _queue_fits(
+        cls, job: Job, usage: Dict[str, int], waiting: List[Job]
+    ) -> bool:
+        """
+        Checks if a job fits in the budget of its queue. Beyond the
+        budget, a queue that borrows may use the idle slots of the
+        other queues, while none of them has jobs waiting that fit
+        in its own budget.
+        """
+        name = job.queue or DEFAULT_QUEUE
+        queue = cls.queues().get(name)
+        if queue is None:
+            return False
+        slots = int(job.reservedSlots or 0)
+        if usage.get(name, 0) + slots <= queue.slots:
+            return True
+        if not queue.borrowing:
+            return False
+        for other in waiting:
+            otherName = other.queue or DEFAULT_QUEUE
+            if otherName == name or otherName not in cls.queues():
+                continue
+            otherSlots = usage.get(otherName, 0) + int(
+                other.reservedSlots or 0
+            )
+            if otherSlots <= cls.queues()[otherName].slots:
+                return False
+        return True
+
+    @classmethod
+    def queue_status(cls) -> List[Queue]:
+        usage = cls._queue_usage()
+        now = datetime.now()
+        status: List[Queue] = []
+        for name, queue in cls.queues().items():
+            jobs = [
+                cls.jobs()[k]
+                for k in cls.tasks().keys()
+                if (cls.jobs()[k].queue or DEFAULT_QUEUE) == name
+            ]
+            queued = [j for j in jobs if j.status == JobStatus.START_REQUESTED]
+            waits = [
+                (now - cls.SUBMISSIONS[str(j.jobId)]).total_seconds()
+                for j in queued
+                if str(j.jobId) in cls.SUBMISSIONS
+            ]
+            status.append(
+                Queue(
+                    name=name,
+                    slots=queue.slots,
+                    usedSlots=usage.get(name, 0),
+                    borrowing=queue.borrowing,
+                    queuedJobs=len(queued),
+                    runningJobs=len(
+                        [j for j in jobs if j.status == JobStatus.RUNNING]
+                    ),
+                    maxWaitSeconds=max(waits) if len(waits) > 0 else 0.0,
+                    averageWaitSeconds=queue.average_wait(),
+                )
+            )
+        return status
+
+    @classmethod
+    def agents(cls) -> Optional[AgentPool]:
+        """
+        The pool of worker agents the jobs are placed on, when
+        INTERNAL_SCHEDULER_AGENTS is set. Otherwise, jobs run in
+        the API host.
+        """
+        if cls.AGENTS is None and Settings.agents:
+            addresses = [
+                a.strip() for a in Settings.agents.split(",") if a.strip()
+            ]
+            cls.AGENTS = AgentPool(
+                addresses,
+                Settings.heartbeat_interval,
+                Settings.heartbeat_timeout,
+                Settings.agent_token,
+            )
+        return cls.AGENTS
+
+    @staticmethod
+    def output_file(job: Job) -> str:
+        """
+        The file where the output of a job is written, named as the
+        output files of SGE jobs. Only the last component of the job
+        name is used, so that the file stays in the directory.
+        """
+        directory = Settings.output_directory or str(job.workingDirectory)
+        name = os.path.basename(job.name or "") or "job"
+        return os.path.join(directory, f"{name}.o{job.jobId}")
+
+    @classmethod
+    def output(cls, jobId: str) -> Optional[OutputLog]:
+        """
+        The reader of the output of a job. Only the readers of jobs
+        still running are kept, since the ones of finished jobs
+        would never be released.
+        """
+        job = cls.jobs().get(jobId)
+        if job is None:
+            return None
+        if jobId not in cls.tasks():
+            return OutputLog(
+                cls.output_file(job), Settings.output_buffer_lines
+            )
+        if jobId not in cls.OUTPUTS:
+            cls.OUTPUTS[jobId] = OutputLog(
+                cls.output_file(job), Settings.output_buffer_lines
+            )
+        return cls.OUTPUTS[jobId]
+
+    @classmethod
+    def stop_latency(cls, jobId: str) -> Optional[float]:
+        """
+        Seconds elapsed between the stop request of a job and
+        the moment its process group was reaped, if available.
+        """
+        return cls.STOP_LATENCIES.get(jobId)
+
+    @classmethod
+    def _running_jobs(cls) -> List[Job]:
+        return [
+            cls.jobs()[k]
+            for k in cls.tasks().keys()
+            if cls.jobs()[k].status == JobStatus.RUNNING
+        ]
+
+    @classmethod
+    def _releasing_jobs(cls) -> List[Job]:
+        """
+        Preempted jobs whose processes are still being terminated,
+        which hold their slots and memory until they exit.
+        """
+        return [
+            cls.jobs()[k]
+            for k in cls.PREEMPTED
+            if k in cls.jobs() and cls.jobs()[k].status == JobStatus.STOPPING
+        ]
+
+    @classmethod
+    def total_slots(cls) -> int:
+        pool = cls.agents()
+        if pool is not None:
+            return pool.total_slots()
+        return cls.MAX_SLOTS
+
+    @classmethod
+    def total_memory(cls) -> float:
+        pool = cls.agents()
+        if pool is not None:
+            return pool.total_memory()
+        return cls.MAX_MEMORY
+
     @classmethod
     def free_slots(cls) -> int:
+        pool = cls.agents()
+        if pool is not None:
+            return pool.free_slots()
         used_slots = 0
-        for k, _ in cls.tasks().items():
-            job = cls.jobs()[k]
-            if job.status == JobStatus.RUNNING:
-                if isinstance(job.reservedSlots, int):
-                    used_slots += job.reservedSlots
+        for job in cls._running_jobs() + cls._releasing_jobs():
+            if isinstance(job.reservedSlots, int):
+                used_slots += job.reservedSlots
         return cls.MAX_SLOTS - used_slots
 
     @classmethod
-    def _remove_from_dict_by_value(cls, value: asyncio.Task[Any]) -> None:
+    def free_memory(cls) -> float:
+        pool = cls.agents()
+        if pool is not None:
+            return pool.free_memory()
+        used_memory = 0.0
+        for job in cls._running_jobs() + cls._releasing_jobs():
+            used_memory += job.reservedMemory or 0.0
+        return cls.MAX_MEMORY - used_memory
+
+    @classmethod
+    def fits(cls, job: Job) -> bool:
+        """
+        Checks if a job would ever fit in the capacity of the
+        scheduler, even with no other job running. A job bigger than
+        the budget of its queue only fits if the queue borrows.
+        """
+        slots = int(job.reservedSlots or 0)
+        memory = float(job.reservedMemory or 0.0)
+        queue = cls.queues().get(cls.route(job) or DEFAULT_QUEUE)
+        if queue is not None and not queue.borrowing and slots > queue.slots:
+            return False
+        pool = cls.agents()
+        if pool is not None:
+            return pool.fits(slots, memory)
+        return slots <= cls.MAX_SLOTS and memory <= cls.MAX_MEMORY
+
+    @classmethod
+    def reject(cls, job: Job) -> None:
+        cls.REJECTED += 1
+
+    @classmethod
+    def _account(cls) -> None:
+        """
+        Integrates the used capacity since the last change, must be
+        called before every change in the running jobs.
+        """
+        now = time.monotonic()
+        if cls.LAST_ACCOUNTED is not None:
+            elapsed = now - cls.LAST_ACCOUNTED
+            totalSlots = cls.total_slots()
+            totalMemory = cls.total_memory()
+            usedSlots = totalSlots - cls.free_slots()
+            usedMemory = totalMemory - cls.free_memory()
+            cls.USAGE_INTEGRALS[0] += elapsed
+            if totalSlots > 0:
+                cls.USAGE_INTEGRALS[1] += elapsed * usedSlots / totalSlots
+            if totalMemory > 0:
+                cls.USAGE_INTEGRALS[2] += elapsed * usedMemory / totalMemory
+        cls.LAST_ACCOUNTED = now
+
+    @classmethod
+    def metrics(cls) -> SchedulerMetrics:
+        cls._account()
+        totalSlots = cls.total_slots()
+        totalMemory = cls.total_memory()
+        usedSlots = totalSlots - cls.free_slots()
+        usedMemory = totalMemory - cls.free_memory()
+        elapsed, slotSeconds, memorySeconds = cls.USAGE_INTEGRALS
+        queued = [
+            k
+            for k in cls.tasks().keys()
+            if cls.jobs()[k].status == JobStatus.START_REQUESTED
+        ]
+        return SchedulerMetrics(
+            totalSlots=totalSlots,
+            usedSlots=usedSlots,
+            totalMemory=totalMemory,
+            usedMemory=usedMemory,
+            slotUtilization=usedSlots / totalSlots if totalSlots else 0.0,
+            memoryUtilization=(
+                usedMemory / totalMemory if totalMemory else 0.0
+            ),
+            averageSlotUtilization=slotSeconds / elapsed if elapsed else 0.0,
+            averageMemoryUtilization=(
+                memorySeconds / elapsed if elapsed else 0.0
+            ),
+            queuedJobs=len(queued),
+            rejectedJobs=cls.REJECTED,
+        )
 
+    @staticmethod
+    def walltime(job: Job) -> float:
+        """
+        The maximum time a job may run, in seconds.
+        """
+        if job.walltime:
+            return float(job.walltime)
+        return Settings.default_walltime
+
+    @classmethod
+    def _priority(cls, job: Job, now: datetime) -> int:
+        """
+        The priority a waiting job is scheduled with, raised by one
+        for every INTERNAL_SCHEDULER_PRIORITY_AGING seconds waited,
+        so that jobs passed over by best-fit are not starved.
+        """
+        priority = job.priority or 0
+        submitted = cls.SUBMISSIONS.get(str(job.jobId))
+        if Settings.priority_aging <= 0 or submitted is None:
+            return priority
+        waited = (now - submitted).total_seconds()
+        return priority + int(waited // Settings.priority_aging)
+
+    @classmethod
+    def _expected_end(cls, job: Job) -> float:
+        start = job.startTime if job.startTime else datetime.now()
+        return start.timestamp() + cls.walltime(job)
+
+    @classmethod
+    def _reservation(
+        cls, head: Job, freeSlots: int, freeMemory: float
+    ) -> Tuple[float, int, float]:
+        """
+        Finds when a blocked job is expected to fit, given the declared
+        walltimes of the running jobs, and the capacity left over for
+        other jobs at that time.
+        """
+        slots = int(head.reservedSlots or 0)
+        memory = float(head.reservedMemory or 0.0)
+        for job in sorted(cls._running_jobs(), key=cls._expected_end):
+            freeSlots += int(job.reservedSlots or 0)
+            freeMemory += float(job.reservedMemory or 0.0)
+            if freeSlots >= slots and freeMemory >= memory:
+                return (
+                    cls._expected_end(job),
+                    freeSlots - slots,
+                    freeMemory - memory,
+                )
+        return float("inf"), 0, 0.0
+
+    @classmethod
+    def _preempt(cls, head: Job, freeSlots: int, freeMemory: float) -> bool:
+        """
+        Stops running jobs with lower priority than a blocked job,
+        the most recently started first, if that makes it fit. The
+        stopped jobs go back to the queue. The blocked job is only
+        started once the stopped jobs have exited, so no more jobs
+        are preempted meanwhile.
+        """
+        if len(cls._releasing_jobs()) > 0:
+            return False
+        priority = head.priority or 0
+        victims = sorted(
+            [j for j in cls._running_jobs() if (j.priority or 0) < priority],
+            key=lambda j: (
+                j.priority or 0,
+                -(j.startTime.timestamp() if j.startTime else 0.0),
+            ),
+        )
+        chosen: List[Job] = []
+        for job in victims:
+            if freeSlots >= int(head.reservedSlots or 0) and freeMemory >= (
+                head.reservedMemory or 0.0
+            ):
+                break
+            chosen.append(job)
+            freeSlots += int(job.reservedSlots or 0)
+            freeMemory += float(job.reservedMemory or 0.0)
+        if freeSlots < int(head.reservedSlots or 0) or freeMemory < (
+            head.reservedMemory or 0.0
+        ):
+            return False
+        for job in chosen:
+            cls.PREEMPTED.add(str(job.jobId))
+            cls._stop(str(job.jobId))
+        return len(chosen) > 0
+
+    @classmethod
+    def _dispatch(cls) -> None:
+        """
+        Starts the waiting local jobs while they fit in the free
+        cores and memory. Jobs with higher priority are started
+        first and, among the ones with the same priority, the one
+        that leaves the least free capacity (best-fit). Waiting jobs
+        gain priority as they age.
+
+        The first job in the queue that does not fit gets a
+        reservation: jobs after it are only started (backfilled) if
+        their walltime ends before the reservation or if they fit in
+        the capacity left over by it. With preemption enabled, a
+        blocked job may also stop running jobs of lower priority.
+        """
+        cls._account()
+        while True:
+            freeSlots = cls.free_slots()
+            freeMemory = cls.free_memory()
+            waiting = [
+                cls.jobs()[k]
+                for k in cls.tasks().keys()
+                if cls.jobs()[k].status == JobStatus.START_REQUESTED
+                and cls._ready(cls.jobs()[k])
+            ]
+            # The sort is stable, so the submission order is kept
+            # among jobs with the same priority
+            started = datetime.now()
+            priorities = {
+                str(j.jobId): cls._priority(j, started) for j in waiting
+            }
+            waiting.sort(key=lambda j: -priorities[str(j.jobId)])
+            head: Optional[Job] = None
+            shadow, extraSlots, extraMemory = float("inf"), 0, 0.0
+            now = started.timestamp()
+            best: Optional[Job] = None
+            bestKey: Tuple[int, float] = (0, 0.0)
+            usage = cls._queue_usage()
+            for job in waiting:
+                # Jobs over the budget of their queue do not hold
+                # reservations on the whole capacity
+                if not cls._queue_fits(job, usage, waiting):
+                    continue
+                slots = int(job.reservedSlots or 0)
+                memory = float(job.reservedMemory or 0.0)
+                fits = slots <= freeSlots and memory <= freeMemory
+                if not fits:
+                    if head is None:
+                        head = job
+                        shadow, extraSlots, extraMemory = cls._reservation(
+                            job, freeSlots, freeMemory
+                        )
+                    continue
+                if head is not None:
+                    endsBefore = now + cls.walltime(job) <= shadow
+                    fitsExtra = slots <= extraSlots and memory <= extraMemory
+                    if not endsBefore and not fitsExtra:
+                        continue
+                key = (
+                    -priorities[str(job.jobId)],
+                    leftover(
+                        freeSlots - slots,
+                        cls.MAX_SLOTS,
+                        freeMemory - memory,
+                        cls.MAX_MEMORY,
+                    ),
+                )
+                if best is None or key < bestKey:
+                    best = job
+                    bestKey = key
+            if best is None:
+                if head is None or not Settings.preemption:
+                    return
+                if not cls._preempt(head, freeSlots, freeMemory):
+                    return
+                continue
+            best.status = JobStatus.RUNNING
+            best.startTime = datetime.now()
+            submitted = cls.SUBMISSIONS.get(str(best.jobId))
+            queue = cls.queues().get(best.queue or DEFAULT_QUEUE)
+            if submitted is not None and queue is not None:
+                queue.started((best.startTime - submitted).total_seconds())
+            cls._waiter(str(best.jobId)).set_result(None)
+
+    @classmethod
+    def _succeeded(cls, jobId: str) -> bool:
+        job = cls.jobs().get(jobId)
+        if job is None or jobId in cls.tasks():
+            return False
+        return job.status == JobStatus.STOPPED and job.exitCode == 0
+
+    @classmethod
+    def _ready(cls, job: Job) -> bool:
+        """
+        Checks if all the jobs a job depends on finished successfully.
+        """
+        return all([cls._succeeded(j) for j in job.dependencies or []])
+
+    @classmethod
+    async def _wait_dependencies(cls, job: Job) -> bool:
+        """
+        Waits for the jobs a job depends on, returning False if any
+        of them failed or was stopped, in which case the job is
+        not started.
+        """
+        for jobId in job.dependencies or []:
+            task = cls.tasks().get(jobId)
+            if task is not None:
+                # The job is marked as stopped by the done callback of
+                # its task, which runs before this wait returns
+                await asyncio.wait({task})
+            if not cls._succeeded(jobId):
+                return False
+        return True
+
+    @classmethod
+    def _waiter(cls, jobId: str) -> asyncio.Future:
+        if jobId not in cls.WAITING:
+            loop = asyncio.get_running_loop()
+            cls.WAITING[jobId] = loop.create_future()
+        return cls.WAITING[jobId]
+
+    @classmethod
+    def _start_sampler(cls) -> None:
+        if Settings.sampling_interval <= 0:
+            return
+        if cls.SAMPLER is None or cls.SAMPLER.done():
+            cls.SAMPLER = asyncio.create_task(cls._sample_loop())
+
+    @classmethod
+    async def _sample_loop(cls) -> None:
+        """
+        Updates the resource usage of all the running jobs once every
+        sampling interval, until there are no more jobs. Local jobs
+        are sampled from /proc in a single pass, while the usage of
+        jobs running on agents comes with their heartbeats.
+        """
+        sampler = ResourceSampler()
+        loop = asyncio.get_running_loop()
+        while len(cls.tasks()) > 0:
+            await asyncio.sleep(Settings.sampling_interval)
+            roots = {k: p.pid for k, p in cls.processes().items()}
+            usages = await loop.run_in_executor(None, sampler.sample, roots)
+            for jobId, node in cls.PLACEMENTS.items():
+                if jobId in node.usage:
+                    usages[jobId] = ResourceUsage(**node.usage[jobId])
+            for jobId, usage in usages.items():
+                if jobId in cls.jobs():
+                    cls.jobs()[jobId].resourceUsage = usage
+
+    @classmethod
+    def _remove_from_dict_by_value(cls, value: asyncio.Task[Any]) -> None:
+        cls._account()
         for k, v in cls.tasks().items():
             if v == value:
                 cls.jobs()[k].status = JobStatus.STOPPED
                 cls.jobs()[k].lastStatusUpdateTime = datetime.now()
                 cls.jobs()[k].endTime = datetime.now()
                 cls.tasks().pop(k)
+                cls.OUTPUTS.pop(k, None)
+                cls.WAITING.pop(k, None)
+                cls.PREEMPTED.discard(k)
+                cls.SUBMISSIONS.pop(k, None)
+                cls._record(cls.jobs()[k])
                 break
+        if cls.agents() is None:
+            cls._dispatch()
 
     @classmethod
-    def schedule_task(cls, job: Job):
-        async def task(job: Job) -> None:
-            if not job.workingDirectory:
-                raise ValueError("Working directory is not set.")
-            if not job.reservedSlots:
-                raise ValueError("Reserved slots is not set.")
-            if not job.jobId:
-                raise ValueError("Job ID is not set.")
-            if not job.scriptFile:
-                raise ValueError("Script file is not set.")
-            chdir(job.workingDirectory)
-            timeout = 60 * 60 * 24 * 7  # 7 days
-            cls.jobs()[job.jobId].status = JobStatus.START_REQUESTED
+    async def _terminate(
+        cls,
+        jobId: str,
+        proc: Process,
+        requested: float,
+    ) -> None:
+        try:
+            await terminate_process_group(proc, Settings.stop_grace_period)
+        finally:
+            cls.STOP_LATENCIES[jobId] = time.monotonic() - requested
+            cls.TERMINATIONS.pop(jobId, None)
+
+    @classmethod
+    async def _terminate_on_agent(
+        cls, jobId: str, node: AgentNode, requested: float
+    ) -> None:
+        pool = cls.agents()
+        try:
+            if pool is not None:
+                await pool.call(
+                    node,
+                    "stop",
+                    {
+                        "jobId": jobId,
+                        "gracePeriod": Settings.stop_grace_period,
+                    },
+                )
+        except AGENT_ERRORS:
+            pass
+        finally:
+            cls.STOP_LATENCIES[jobId] = time.monotonic() - requested
+            cls.TERMINATIONS.pop(jobId, None)
+
+    @classmethod
+    def stop_task(cls, jobId: str) -> Optional[Job]:
+        """
+        Stops a job, either queued or running. Queued jobs are
+        dequeued right away, while running jobs have their process
+        group terminated in background. In both cases the slots
+        are released immediately.
+        """
+        # A job stopped while being preempted is not queued again
+        cls.PREEMPTED.discard(jobId)
+        job = cls._stop(jobId)
+        if cls.agents() is None:
+            cls._dispatch()
+        return job
+
+    @classmethod
+    def _stop(cls, jobId: str) -> Optional[Job]:
+        job = cls.jobs().get(jobId)
+        if job is None or jobId not in cls.tasks():
+            return job
+        if jobId in cls.TERMINATIONS:
+            return job
+        requested = time.monotonic()
+        cls._account()
+        job.status = JobStatus.STOPPING
+        job.lastStatusUpdateTime = datetime.now()
+        cls._record(job)
+        proc = cls.processes().get(jobId)
+        node = cls.PLACEMENTS.get(jobId)
+        if proc is not None:
+            cls.TERMINATIONS[jobId] = asyncio.create_task(
+                cls._terminate(jobId, proc, requested)
+            )
+        elif node is not None:
+            cls.TERMINATIONS[jobId] = asyncio.create_task(
+                cls._terminate_on_agent(jobId, node, requested)
+            )
+        else:
+            cls.tasks()[jobId].cancel()
+            cls.STOP_LATENCIES[jobId] = time.monotonic() - requested
+        return job
+
+    @classmethod
+    def _requeue(cls, job: Job) -> bool:
+        """
+        Puts a preempted job back in the queue, once its processes
+        are terminated, returning False if it was not preempted.
+        """
+        jobId = str(job.jobId)
+        if jobId not in cls.PREEMPTED:
+            return False
+        cls.PREEMPTED.discard(jobId)
+        job.status = JobStatus.START_REQUESTED
+        job.startTime = None
+        job.exitCode = None
+        job.lastStatusUpdateTime = datetime.now()
+        cls._record(job)
+        return True
+
+    @staticmethod
+    def _command(job: Job) -> List[str]:
+        args = job.args if job.args is not None else []
+        return [shlex.quote(a) for a in [str(job.scriptFile), *args]]
+
+    @staticmethod
+    def _environment(job: Job) -> Dict[str, str]:
+        """
+        Variables set for each job, named as in SGE so that the
+        scripts work with both schedulers.
+        """
+        return {
+            "JOB_ID": str(job.jobId),
+            "JOB_NAME": str(job.name or ""),
+            "NSLOTS": str(job.reservedSlots),
+            "PWD": str(job.workingDirectory),
+        }
+
+    @classmethod
+    async def _run_local(cls, job: Job, timeout: float) -> None:
+        jobId = str(job.jobId)
+        while True:
+            # The job is started by _dispatch when it fits, possibly
+            # even before this task starts
+            try:
+                cls._dispatch()
+                await cls._waiter(jobId)
+            finally:
+                cls.WAITING.pop(jobId, None)
+            # The working directory and the environment are set only
+            # in the child, so jobs can be started concurrently. The
+            # output is written by the job itself, so it does not depend
+            # on pipes to the API for surviving a restart. When there
+            # are not enough free cores, the job is not pinned.
+            cores = cls.cores()
+            cpus = None
+            if cores is not None:
+                cpus = cores.allocate(jobId, int(job.reservedSlots or 0))
+            try:
+                with open(cls.output_file(job), "ab") as output:
+                    proc = await start_terminal(
+                        cls._command(job),
+                        cwd=str(job.workingDirectory),
+                        stdout=output,
+                        stderr=asyncio.subprocess.STDOUT,
+                        env={**os.environ, **cls._environment(job)},
+                        cpus=cpus,
+                    )
+            except Exception:
+                if cores is not None:
+                    cores.release(jobId)
+                raise
+            await cls._wait_local(job, proc, timeout)
+            await cls._released(jobId)
+            if not cls._requeue(job):
+                return
+
+    @classmethod
+    async def _released(cls, jobId: str) -> None:
+        # A preempted job holds its slots until all the processes
+        # of its group exit, which may outlive the group leader
+        termination = cls.TERMINATIONS.get(jobId)
+        if jobId in cls.PREEMPTED and termination is not None:
+            await asyncio.wait({termination})
+
+    @staticmethod
+    def _remaining(job: Job, timeout: float) -> float:
+        """
+        The time left before a job reaches its walltime, counted from
+        its start, which may be before a restart of the API.
+        """
+        if job.startTime is None:
+            return timeout
+        elapsed = (datetime.now() - job.startTime).total_seconds()
+        return max(timeout - elapsed, 0.0)
+
+    @classmethod
+    async def _wait_local(cls, job: Job, proc: Process, timeout: float):
+        jobId = str(job.jobId)
+        cls.processes()[jobId] = proc
+        cores = cls.cores()
+        if cores is not None and isinstance(proc, AdoptedProcess):
+            pinned = process_affinity(proc.pid)
+            if pinned is not None:
+                cores.claim(jobId, pinned)
+        cls._record(job)
+        cls._start_sampler()
+        try:
+            await asyncio.wait_for(
+                proc.wait(), timeout=cls._remaining(job, timeout)
+            )
+        except asyncio.TimeoutError:
+            cls.stop_task(jobId)
+            await proc.wait()
+        finally:
+            # Processes adopted after a restart have no known exit code
+            job.exitCode = proc.returncode
+            cls.processes().pop(jobId, None)
+            if cores is not None:
+                cores.release(jobId)
+
+    @classmethod
+    async def _wait_on_agent(
+        cls,
+        pool: AgentPool,
+        node: AgentNode,
+        lost: asyncio.Event,
+        jobId: str,
+        timeout: float,
+    ) -> bool:
+        """
+        Waits for a job running on an agent, returning False if
+        the agent was lost before the job finished. A dropped
+        connection does not mean the job is gone, so the wait is
+        retried on the same agent until it is marked as lost.
+        """
+        deadline = time.monotonic() + timeout
+        watcher = asyncio.ensure_future(lost.wait())
+        try:
             while True:
-                if cls.free_slots() >= job.reservedSlots:
-                    break
-                await asyncio.sleep(5)
-            cls.jobs()[job.jobId].status = JobStatus.RUNNING
-            cls.jobs()[job.jobId].startTime = datetime.now()
-            await run_terminal_retry([job.scriptFile], timeout=timeout)
+                waiter = asyncio.ensure_future(
+                    pool.call(node, "wait", {"jobId": jobId})
+                )
+                done, _ = await asyncio.wait(
+                    {waiter, watcher},
+                    timeout=max(deadline - time.monotonic(), 0.0),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if len(done) == 0:
+                    waiter.cancel()
+                    cls.stop_task(jobId)
+                    return True
+                if waiter not in done:
+                    waiter.cancel()
+                    return False
+                try:
+                    result = waiter.result()
+                except CONNECTION_ERRORS:
+                    if watcher in done:
+                        return False
+                    await asyncio.sleep(pool.interval)
+                    continue
+                cls.jobs()[jobId].exitCode = result.get("returncode")
+                return True
+        finally:
+            watcher.cancel()
+
+    @classmethod
+    def _refused(cls, job: Job, node: AgentNode, error: str) -> None:
+        """
+        Records why the agents refused to launch a job, in the log of
+        the API and, when possible, in the output of the job.
+        """
+        message = f"job {job.jobId} refused by agent {node.address}: {error}"
+        logger.warning(message)
+        try:
+            with open(cls.output_file(job), "a") as output:
+                output.write(message + "\n")
+        except OSError:
+            pass
+
+    @classmethod
+    async def _run_on_agents(
+        cls,
+        pool: AgentPool,
+        job: Job,
+        timeout: float,
+        adopted: Optional[AgentNode] = None,
+    ) -> None:
+        jobId = str(job.jobId)
+        slots = int(job.reservedSlots or 0)
+        memory = float(job.reservedMemory or 0.0)
+        await pool.start()
+        refusals = 0
+        while True:
+            if adopted is not None:
+                node = adopted
+            else:
+                cls.jobs()[jobId].status = JobStatus.START_REQUESTED
+                cls._account()
+                node = pool.place(jobId, slots, memory)
+            if node is None:
+                await asyncio.sleep(cls.POLL_INTERVAL)
+                continue
+            cls.PLACEMENTS[jobId] = node
+            lost = node.lost
+            finished = False
+            try:
+                if adopted is None:
+                    try:
+                        await pool.call(
+                            node,
+                            "launch",
+                            {
+                                "jobId": jobId,
+                                "command": cls._command(job),
+                                "workingDirectory": str(job.workingDirectory),
+                                "environment": cls._environment(job),
+                                "outputFile": cls.output_file(job),
+                                "reservedSlots": slots,
+                                "reservedMemory": memory,
+                            },
+                            timeout=pool.interval,
+                        )
+                    except RuntimeError as e:
+                        # A refusal may come from a stale view of the
+                        # agent, but one repeated is not retried forever
+                        refusals += 1
+                        if refusals >= cls.LAUNCH_ATTEMPTS:
+                            cls._refused(job, node, str(e))
+                            return
+                        raise
+                    refusals = 0
+                    if cls.jobs()[jobId].status == JobStatus.STOPPING:
+                        await cls._terminate_on_agent(
+                            jobId, node, time.monotonic()
+                        )
+                        return
+                    cls.jobs()[jobId].status = JobStatus.RUNNING
+                    cls.jobs()[jobId].startTime = datetime.now()
+                    cls._record(job)
+                adopted = None
+                cls._start_sampler()
+                finished = await cls._wait_on_agent(
+                    pool, node, lost, jobId, cls._remaining(job, timeout)
+                )
+            except AGENT_ERRORS:
+                # The agent is unreachable or refused the job: the job
+                # goes back to the queue and is placed again, up to
+                # LAUNCH_ATTEMPTS refusals
+                pass
+            finally:
+                adopted = None
+                cls._account()
+                pool.release(node, jobId, slots, memory)
+                cls.PLACEMENTS.pop(jobId, None)
+            if finished or cls.jobs()[jobId].status == JobStatus.STOPPING:
+                return
+            cls.jobs()[jobId].status = JobStatus.START_REQUESTED
+            cls._record(job)
+            await asyncio.sleep(cls.POLL_INTERVAL)
+
+    @classmethod
+    async def _task(
+        cls,
+        job: Job,
+        adoptedProcess: Optional[AdoptedProcess] = None,
+        adoptedNode: Optional[AgentNode] = None,
+    ) -> None:
+        if not job.workingDirectory:
+            raise ValueError("Working directory is not set.")
+        if not job.reservedSlots:
+            raise ValueError("Reserved slots is not set.")
+        if not job.jobId:
+            raise ValueError("Job ID is not set.")
+        if not job.scriptFile:
+            raise ValueError("Script file is not set.")
+        timeout = cls.walltime(job)
+        pool = cls.agents()
+        if adoptedProcess is None and adoptedNode is None:
+            if not await cls._wait_dependencies(job):
+                return
+            if job.dependencies:
+                # The time waiting for other jobs is not queue time
+                cls.SUBMISSIONS[str(job.jobId)] = datetime.now()
+        if adoptedProcess is not None:
+            await cls._wait_local(job, adoptedProcess, timeout)
+            await cls._released(str(job.jobId))
+            if not cls._requeue(job):
+                return
+        if pool is None:
+            await cls._run_local(job, timeout)
+        else:
+            await cls._run_on_agents(pool, job, timeout, adoptedNode)
+
+    @classmethod
+    def _spawn(cls, job: Job, **kwargs) -> None:
+        taskid = str(job.jobId)
+        ref: asyncio.Task = asyncio.create_task(
+            cls._task(job, **kwargs), name=taskid
+        )
+        cls.tasks()[taskid] = ref
+        ref.add_done_callback(cls._remove_from_dict_by_value)
 
+    @classmethod
+    def schedule_task(cls, job: Job):
         taskids = [int(i) for i in list(cls.jobs().keys())]
         if len(taskids) == 0:
             job.jobId = "1"
         else:
             job.jobId = str(max(taskids) + 1)
         taskid = job.jobId
+        job.status = JobStatus.START_REQUESTED
+        job.queue = cls.route(job)
         cls.jobs()[taskid] = job
-        ref: asyncio.Task = asyncio.create_task(task(job), name=taskid)
-        cls.tasks()[taskid] = ref
-        ref.add_done_callback(cls._remove_from_dict_by_value)
+        cls.SUBMISSIONS[taskid] = datetime.now()
+        cls._record(job)
+        cls._spawn(job)
+
+    @classmethod
+    def schedule_array(cls, array: JobArray) -> str:
+        """
+        Schedules a job for each task of an array, returning the id of
+        the array, which is the id of its first task.
+        """
+        jobIds: List[str] = []
+        for job in expand(array):
+            cls.schedule_task(job)
+            jobIds.append(str(job.jobId))
+        cls.ARRAYS[jobIds[0]] = jobIds
+        return jobIds[0]
+
+    @classmethod
+    def array_status(cls, arrayId: str) -> Optional[JobArrayStatus]:
+        jobIds = cls.ARRAYS.get(arrayId)
+        if jobIds is None:
+            return None
+        indexes: Dict[str, List[int]] = {}
+        for i, jobId in enumerate(jobIds):
+            status = cls.jobs()[jobId].status
+            name = status.value if status else ""
+            indexes.setdefault(name, []).append(i + 1)
+        return JobArrayStatus(
+            arrayId=arrayId,
+            tasks=len(jobIds),
+            status={k: compact_ranges(v) for k, v in indexes.items()},
+        )
+
+    @classmethod
+    async def restore(cls) -> None:
+        """
+        Rebuilds the queue from the journal after a restart. Queued
+        jobs are scheduled again, while running jobs whose process is
+        still alive, either in this host or in an agent, are adopted.
+        Adopted jobs that were being stopped are terminated again, and
+        preempted jobs go back to the queue once they have exited.
+        """
+        journal = cls.journal()
+        if journal is None:
+            return
+        pool = cls.agents()
+        nodes = {n.address: n for n in pool.nodes} if pool else {}
+        for entry in journal.load():
+            job = entry.job
+            jobId = str(job.jobId)
+            cls.jobs()[jobId] = job
+            if job.status == JobStatus.STOPPED:
+                continue
+            if entry.preempted:
+                cls.PREEMPTED.add(jobId)
+            stopping = job.status == JobStatus.STOPPING
+            if entry.agent is not None and entry.agent in nodes:
+                node = nodes[entry.agent]
+                pool.reserve(
+                    node,
+                    jobId,
+                    int(job.reservedSlots or 0),
+                    float(job.reservedMemory or 0.0),
+                )
+                cls._spawn(job, adoptedNode=node)
+                if stopping:
+                    cls.TERMINATIONS[jobId] = asyncio.create_task(
+                        cls._terminate_on_agent(jobId, node, time.monotonic())
+                    )
+                continue
+            if entry.pid is not None and entry.startTicks is not None:
+                proc = AdoptedProcess(entry.pid, entry.startTicks)
+                if proc.alive():
+                    cls._spawn(job, adoptedProcess=proc)
+                    if stopping:
+                        cls.TERMINATIONS[jobId] = asyncio.create_task(
+                            cls._terminate(jobId, proc, time.monotonic())
+                        )
+                    continue
+            # A preempted job whose processes are gone is queued again
+            cls._requeue(job)
+            if job.status == JobStatus.START_REQUESTED:
+                cls.SUBMISSIONS[jobId] = datetime.now()
+                cls._spawn(job)
+                continue
+            job.status = JobStatus.STOPPED
+            job.endTime = datetime.now()
+            job.lastStatusUpdateTime = job.endTime
+            cls._record(job)
+
+    @classmethod
+    def close(cls) -> None:
+        """
+        Flushes the journal on shutdown. Running jobs are left alive,
+        to be adopted by the next run of the API.
+        """
+        if cls.JOURNAL is not None:
+            cls.JOURNAL.close()
+            cls.JOURNAL = None
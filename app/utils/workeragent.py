@@ -0,0 +1,277 @@
+import asyncio
+import hmac
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+from app.internal.terminal import start_terminal, terminate_process_group
+from app.utils.resourcesampler import ResourceSampler, host_memory
+from app.utils.coremap import CoreMap
+
+
+async def open_address(
+    address: str,
+) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """
+    Opens a connection to an agent address, either in the form
+    `unix:/path/to/socket` or `host:port`.
+
+    :param address: The agent address
+    :return: The stream reader and writer of the connection
+    :rtype: Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+    """
+    if address.startswith("unix:"):
+        return await asyncio.open_unix_connection(address[len("unix:") :])
+    host, port = address.rsplit(":", 1)
+    return await asyncio.open_connection(host, int(port))
+
+
+async def call(
+    address: str,
+    method: str,
+    params: Optional[Dict[str, Any]] = None,
+    timeout: Optional[float] = None,
+    token: str = "",
+) -> Any:
+    """
+    Calls a method on a worker agent. Each call is a single JSON line
+    sent over a new connection, answered by another JSON line.
+
+    :param address: The agent address
+    :param method: The name of the called method
+    :param params: The keyword arguments of the method
+    :param timeout: Timeout for giving up on the call
+    :param token: The token shared with the agent
+    :return: The result of the method
+    """
+    reader, writer = await asyncio.wait_for(open_address(address), timeout)
+    try:
+        request = {"method": method, "params": params or {}, "token": token}
+        writer.write(json.dumps(request).encode("utf-8") + b"\n")
+        await writer.drain()
+        line = await asyncio.wait_for(reader.readline(), timeout)
+    finally:
+        writer.close()
+    if not line:
+        raise ConnectionError(f"agent {address} closed the connection")
+    response = json.loads(line)
+    if "error" in response:
+        raise RuntimeError(response["error"])
+    return response["result"]
+
+
+class WorkerAgent:
+    """
+    Lightweight agent that runs internal scheduler jobs in a node,
+    advertising its slots to the API host over a JSON line RPC.
+    Every call must carry the token shared with the API host, which
+    is mandatory when listening on TCP. The resource usage of the jobs
+    is sampled at most once per sampling interval, however often the
+    API host asks for it.
+    """
+
+    METHODS = ["info", "launch", "wait", "stop"]
+
+    def __init__(
+        self,
+        address: str,
+        slots: int,
+        memory: float = 0.0,
+        affinity: bool = False,
+        token: str = "",
+        sampling_interval: float = 10.0,
+    ):
+        self.address = address
+        self.token = token
+        self.sampling_interval = sampling_interval
+        self.slots = slots
+        self.memory = memory if memory > 0 else host_memory()
+        self.cores = CoreMap.from_sys() if affinity else None
+        self.jobs: Dict[str, int] = {}
+        self.memories: Dict[str, float] = {}
+        self.processes: Dict[str, asyncio.subprocess.Process] = {}
+        self.reapers: Dict[str, asyncio.Task] = {}
+        self.returncodes: Dict[str, Optional[int]] = {}
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.connections: Set[asyncio.StreamWriter] = set()
+        self.sampler = ResourceSampler()
+        self.usage: Dict[str, Any] = {}
+        self.sampledAt: Optional[float] = None
+
+    def used_slots(self) -> int:
+        return sum(self.jobs.values())
+
+    def used_memory(self) -> float:
+        return sum(self.memories.values())
+
+    async def start(self):
+        if not self.address.startswith("unix:") and not self.token:
+            raise ValueError("AGENT_TOKEN is required to listen on TCP")
+        if self.address.startswith("unix:"):
+            self.server = await asyncio.start_unix_server(
+                self._handle, self.address[len("unix:") :]
+            )
+        else:
+            host, port = self.address.rsplit(":", 1)
+            self.server = await asyncio.start_server(
+                self._handle, host, int(port)
+            )
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self, grace_period: float = 0.0):
+        """
+        Stops serving and kills the running jobs, as a node
+        going down would do.
+        """
+        if self.server is not None:
+            self.server.close()
+        for writer in list(self.connections):
+            writer.transport.abort()
+        for proc in list(self.processes.values()):
+            await terminate_process_group(proc, grace_period)
+        if self.server is not None:
+            await self.server.wait_closed()
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        self.connections.add(writer)
+        try:
+            line = await reader.readline()
+            if not line:
+                return
+            try:
+                request = json.loads(line)
+                if not self._authorized(request.get("token")):
+                    raise PermissionError("invalid agent token")
+                method = request.get("method")
+                if method not in self.METHODS:
+                    raise ValueError(f"unknown method {method}")
+                result = await getattr(self, method)(
+                    **request.get("params", {})
+                )
+                response: Dict[str, Any] = {"result": result}
+            except Exception as e:
+                response = {"error": str(e)}
+            writer.write(json.dumps(response).encode("utf-8") + b"\n")
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+
+    def _authorized(self, token: Any) -> bool:
+        if not isinstance(token, str):
+            return False
+        return hmac.compare_digest(
+            token.encode("utf-8"), self.token.encode("utf-8")
+        )
+
+    async def _sample(self) -> Dict[str, Any]:
+        if self.sampling_interval <= 0:
+            return {}
+        now = time.monotonic()
+        if (
+            self.sampledAt is None
+            or now - self.sampledAt >= self.sampling_interval
+        ):
+            roots = {k: p.pid for k, p in self.processes.items()}
+            usages = await asyncio.get_running_loop().run_in_executor(
+                None, self.sampler.sample, roots
+            )
+            self.usage = {k: json.loads(u.json()) for k, u in usages.items()}
+            self.sampledAt = now
+        return {k: u for k, u in self.usage.items() if k in self.processes}
+
+    async def info(self) -> Dict[str, Any]:
+        usage = await self._sample()
+        return {
+            "slots": self.slots,
+            "usedSlots": self.used_slots(),
+            "memory": self.memory,
+            "usedMemory": self.used_memory(),
+            "jobs": list(self.jobs.keys()),
+            "usage": usage,
+        }
+
+    async def launch(
+        self,
+        jobId: str,
+        command: List[str],
+        workingDirectory: str,
+        reservedSlots: int,
+        environment: Optional[Dict[str, str]] = None,
+        outputFile: Optional[str] = None,
+        reservedMemory: float = 0.0,
+    ) -> Dict[str, Any]:
+        if jobId in self.processes:
+            raise ValueError(f"job {jobId} is already running")
+        if self.used_slots() + reservedSlots > self.slots:
+            raise ValueError(f"not enough free slots for job {jobId}")
+        if self.used_memory() + reservedMemory > self.memory:
+            raise ValueError(f"not enough free memory for job {jobId}")
+        self.jobs[jobId] = reservedSlots
+        self.memories[jobId] = reservedMemory
+        self.returncodes.pop(jobId, None)
+        cpus = None
+        if self.cores is not None:
+            cpus = self.cores.allocate(jobId, reservedSlots)
+        try:
+            output = (
+                open(outputFile, "ab")
+                if outputFile is not None
+                else open(os.devnull, "wb")
+            )
+            with output:
+                proc = await start_terminal(
+                    command,
+                    cwd=workingDirectory,
+                    stdout=output,
+                    stderr=asyncio.subprocess.STDOUT,
+                    env={**os.environ, **(environment or {})},
+                    cpus=cpus,
+                )
+        except Exception:
+            self.jobs.pop(jobId, None)
+            self.memories.pop(jobId, None)
+            if self.cores is not None:
+                self.cores.release(jobId)
+            raise
+        self.processes[jobId] = proc
+        self.reapers[jobId] = asyncio.create_task(self._reap(jobId, proc))
+        return {"pid": proc.pid}
+
+    async def _reap(self, jobId: str, proc: asyncio.subprocess.Process):
+        try:
+            await proc.wait()
+        finally:
+            self.returncodes[jobId] = proc.returncode
+            self.jobs.pop(jobId, None)
+            self.memories.pop(jobId, None)
+            self.processes.pop(jobId, None)
+            if self.cores is not None:
+                self.cores.release(jobId)
+
+    async def wait(self, jobId: str) -> Dict[str, Any]:
+        # The return code is kept, so that a wait retried after a
+        # dropped connection gets the same answer
+        reaper = self.reapers.get(jobId)
+        if reaper is None and jobId not in self.returncodes:
+            raise ValueError(f"job {jobId} not found")
+        if reaper is not None:
+            await asyncio.shield(reaper)
+            self.reapers.pop(jobId, None)
+        return {"returncode": self.returncodes.get(jobId)}
+
+    async def stop(self, jobId: str, gracePeriod: float) -> Dict[str, Any]:
+        proc = self.processes.get(jobId)
+        if proc is None:
+            return {"stopped": False}
+        await terminate_process_group(proc, gracePeriod)
+        return {"stopped": True}
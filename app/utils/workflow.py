@@ -0,0 +1,33 @@
+from typing import Dict, List, Optional
+from app.models.workflow import Workflow, WorkflowStage
+
+
+def stage_order(workflow: Workflow) -> Optional[List[WorkflowStage]]:
+    """
+    Orders the stages of a workflow so that each stage comes after
+    the ones it depends on, keeping the given order otherwise.
+    Returns None if the names are repeated, if a stage depends on a
+    stage that does not exist or if the dependencies have a cycle.
+    """
+    stages: Dict[str, WorkflowStage] = {}
+    for stage in workflow.stages:
+        if stage.name in stages:
+            return None
+        stages[stage.name] = stage
+    for stage in workflow.stages:
+        if any([a not in stages for a in stage.after or []]):
+            return None
+    ordered: List[WorkflowStage] = []
+    done: Dict[str, bool] = {}
+    while len(ordered) < len(stages):
+        ready = [
+            s
+            for s in workflow.stages
+            if s.name not in done and all([a in done for a in s.after or []])
+        ]
+        if len(ready) == 0:
+            return None
+        for stage in ready:
+            done[stage.name] = True
+            ordered.append(stage)
+    return ordered
@@ -0,0 +1,433 @@
+"""
+Stand-ins for the commands of the SGE and Torque schedulers (qsub,
+qstat, qdel, qacct and tracejob), backed by a state file instead of a
+cluster, so that the scheduler repositories can be run end to end, and
+under load, on any Linux machine.
+
+The commands are the executables of benchmarks/bin, which must come
+first in the PATH of the API:
+
+    $ export PATH=$PWD/benchmarks/bin:$PATH
+    $ export FAKE_SCHEDULER=SGE FAKE_SCHEDULER_RUN_TIME=60
+    $ SCHEDULER=SGE uvicorn main:app
+
+Only submissions and deletions are written to the state. The state of
+each job is derived from the time: it waits in the queue for
+FAKE_SCHEDULER_QUEUE_TIME seconds after its submission and after the
+end of its dependencies, runs for FAKE_SCHEDULER_RUN_TIME seconds and
+then leaves qstat for qacct or tracejob. Each command takes
+FAKE_SCHEDULER_LATENCY seconds (a `min,max` range draws a uniform
+delay) and fails, as an unreachable server does, with probability
+FAKE_SCHEDULER_FAILURE_RATE.
+"""
+
+import fcntl
+import json
+import os
+import random
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from benchmarks.scheduleroutput import (
+    TORQUE_SERVER,
+    SyntheticJob,
+    job_number,
+    sge_accounting_records,
+    sge_detail,
+    sge_job_list,
+    torque_status,
+    torque_trace_of,
+)
+
+FLAVORS = ["SGE", "TORQUE"]
+COMMANDS = ["qsub", "qstat", "qdel", "qacct", "tracejob"]
+# Slots of each node, for the number of hosts of the SGE jobs
+SGE_SLOTS_PER_NODE = 32
+TRACE_EVENTS = 10
+
+# Options of qsub that take values, by flavor
+SGE_OPTIONS = {"-N": 1, "-pe": 2, "-l": 1, "-p": 1, "-hold_jid": 1, "-t": 1}
+SGE_OPTIONS.update({"-o": 1, "-e": 1, "-q": 1, "-S": 1})
+TORQUE_OPTIONS = {"-N": 1, "-l": 1, "-p": 1, "-W": 1, "-t": 1}
+TORQUE_OPTIONS.update({"-o": 1, "-e": 1, "-q": 1, "-S": 1})
+
+Record = Dict[str, Any]
+Output = Tuple[int, str, str]
+
+
+class Config:
+    """
+    The behavior of the fake scheduler, read from the environment
+    on each command.
+    """
+
+    def __init__(self, environ: Dict[str, str]):
+        self.flavor = environ.get("FAKE_SCHEDULER", "SGE").upper()
+        if self.flavor not in FLAVORS:
+            raise ValueError(f"FAKE_SCHEDULER must be one of {FLAVORS}")
+        self.state = Path(
+            environ.get(
+                "FAKE_SCHEDULER_STATE",
+                f"/tmp/fake-scheduler-{self.flavor.lower()}.json",
+            )
+        )
+        self.queueTime = float(environ.get("FAKE_SCHEDULER_QUEUE_TIME", "2"))
+        self.runTime = float(environ.get("FAKE_SCHEDULER_RUN_TIME", "30"))
+        latency = environ.get("FAKE_SCHEDULER_LATENCY", "0").split(",")
+        self.latency = (float(latency[0]), float(latency[-1]))
+        self.failureRate = float(
+            environ.get("FAKE_SCHEDULER_FAILURE_RATE", "0")
+        )
+
+
+@contextmanager
+def state(config: Config, write: bool) -> Iterator[Dict[str, Any]]:
+    """
+    The jobs known by the scheduler, locked for the duration of the
+    command. Reads share the lock, so that only submissions and
+    deletions wait for each other.
+    """
+    config.state.parent.mkdir(parents=True, exist_ok=True)
+    with open(config.state, "a+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX if write else fcntl.LOCK_SH)
+        try:
+            f.seek(0)
+            content = f.read()
+            data = json.loads(content) if content else {}
+            data.setdefault("next", job_number(0))
+            data.setdefault("jobs", {})
+            yield data
+            if write:
+                f.seek(0)
+                f.truncate()
+                json.dump(data, f)
+                # Written before the lock is released, not when closed
+                f.flush()
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def lifecycle(
+    jobId: str, jobs: Dict[str, Record], config: Config
+) -> Tuple[Optional[float], Optional[float], bool]:
+    """
+    The start and the end of a job, as timestamps, and whether it
+    still waits for a dependency. A job deleted before it started
+    ends without a start.
+    """
+    record = jobs[jobId]
+    ready = record["submitted"]
+    held = False
+    for dependency in record["dependencies"]:
+        if dependency not in jobs:
+            continue
+        _, end, _ = lifecycle(dependency, jobs, config)
+        if end is None or end > time.time():
+            held = True
+        ready = max(ready, end if end is not None else float("inf"))
+    start: Optional[float] = ready + config.queueTime
+    end: Optional[float] = start + config.runTime  # type: ignore
+    deleted = record.get("deleted")
+    if deleted is not None:
+        if start is None or deleted < start:
+            return None, deleted, False
+        end = min(end, deleted)  # type: ignore
+    if start == float("inf"):
+        return None, None, held
+    return start, end, held
+
+
+def synthetic_job(
+    jobId: str, jobs: Dict[str, Record], config: Config
+) -> Tuple[SyntheticJob, Optional[float]]:
+    """
+    The job as written in the outputs, with the state of the moment,
+    and the timestamp of its end.
+    """
+    record = jobs[jobId]
+    now = time.time()
+    start, end, held = lifecycle(jobId, jobs, config)
+    started = start is not None and start <= now
+    if config.flavor == "SGE":
+        state = "r" if started else ("hqw" if held else "qw")
+    else:
+        state = "R" if started else ("H" if held else "Q")
+    job = SyntheticJob(
+        jobId=int(jobId),
+        name=record["name"],
+        state=state,
+        submitted=datetime.fromtimestamp(record["submitted"]),
+        start=datetime.fromtimestamp(start) if started else None,
+        end=datetime.fromtimestamp(end) if end and end <= now else None,
+        slots=record["slots"],
+        ppn=record["ppn"],
+        cwd=record["cwd"],
+        script=record["script"],
+        args=record["args"],
+    )
+    return job, end
+
+
+def active_jobs(jobs: Dict[str, Record], config: Config) -> List[SyntheticJob]:
+    active: List[SyntheticJob] = []
+    for jobId in jobs:
+        job, end = synthetic_job(jobId, jobs, config)
+        if end is None or end > time.time():
+            active.append(job)
+    return active
+
+
+def parse_qsub(args: List[str], config: Config) -> Record:
+    """
+    Reads the options of qsub that the repositories use, the others
+    are accepted and ignored. SGE stops reading options at the script,
+    while Torque reads them anywhere.
+    """
+    options = SGE_OPTIONS if config.flavor == "SGE" else TORQUE_OPTIONS
+    record: Record = {
+        "name": None,
+        "slots": 1,
+        "ppn": 1,
+        "dependencies": [],
+        "tasks": None,
+        "script": None,
+        "args": [],
+    }
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if record["script"] is not None and config.flavor == "SGE":
+            record["args"].append(arg)
+        elif arg in options:
+            values = args[i + 1 : i + 1 + options[arg]]
+            if len(values) < options[arg]:
+                raise ValueError(f"option {arg} requires a value")
+            parse_option(record, arg, values)
+            i += options[arg]
+        elif arg.startswith("-"):
+            pass
+        elif record["script"] is None:
+            record["script"] = arg
+        else:
+            record["args"].append(arg)
+        i += 1
+    if record["script"] is None:
+        raise ValueError("no script file given")
+    return record
+
+
+def parse_option(record: Record, option: str, values: List[str]):
+    if option == "-N":
+        record["name"] = values[0]
+    elif option == "-pe":
+        record["slots"] = int(values[1])
+        record["ppn"] = min(int(values[1]), SGE_SLOTS_PER_NODE)
+    elif option == "-hold_jid":
+        record["dependencies"] += [d for d in values[0].split(",") if d]
+    elif option == "-W" and values[0].startswith("depend=afterok:"):
+        ids = values[0].split(":")[1:]
+        record["dependencies"] += [d.split(".")[0] for d in ids if d]
+    elif option == "-t":
+        first, last = values[0].split(":")[0].split("-")
+        record["tasks"] = int(last) - int(first) + 1
+    elif option == "-l":
+        for resource in values[0].split(","):
+            key, _, value = resource.partition("=")
+            if key != "nodes":
+                continue
+            # The repository asks for the slots as nodes, which
+            # Torque reads as that many nodes of one processor
+            nodes, _, ppn = value.partition(":ppn=")
+            record["ppn"] = int(ppn) if ppn else 1
+            record["slots"] = int(nodes) * record["ppn"]
+
+
+def job_ids(args: List[str]) -> List[str]:
+    """
+    The jobs given to a command, without the server of the Torque
+    ids nor the brackets of the arrays.
+    """
+    return [
+        a.split(".")[0].replace("[]", "")
+        for a in args
+        if not a.startswith("-")
+    ]
+
+
+def qsub(args: List[str], config: Config) -> Output:
+    try:
+        record = parse_qsub(args, config)
+    except ValueError as e:
+        return 2, "", f"qsub: {e}\n"
+    cwd = os.getcwd()
+    script = record["script"]
+    if not os.path.isfile(os.path.join(cwd, script)):
+        if config.flavor == "SGE":
+            return (
+                1,
+                "",
+                "Unable to read script file because of error: "
+                + f"error opening {script}: No such file or directory\n",
+            )
+        return 1, "", f"qsub: script file '{script}' cannot be loaded\n"
+    record["name"] = record["name"] or os.path.basename(script)
+    record["cwd"] = cwd
+    record["submitted"] = time.time()
+    record["deleted"] = None
+    with state(config, write=True) as data:
+        jobId = str(data["next"])
+        data["next"] += 1
+        data["jobs"][jobId] = record
+    tasks = record["tasks"]
+    if config.flavor == "TORQUE":
+        suffix = "[]" if tasks else ""
+        return 0, f"{jobId}{suffix}.{TORQUE_SERVER}\n", ""
+    if tasks:
+        return (
+            0,
+            f"Your job-array {jobId}.1-{tasks}:1 "
+            + f'("{record["name"]}") has been submitted\n',
+            "",
+        )
+    return 0, f'Your job {jobId} ("{record["name"]}") has been submitted\n', ""
+
+
+def unknown(jobId: str, config: Config, command: str) -> Output:
+    if config.flavor == "TORQUE":
+        return 153, "", f"{command}: Unknown Job Id {jobId}.{TORQUE_SERVER}\n"
+    if command == "qdel":
+        return 1, "", f'denied: job "{jobId}" does not exist\n'
+    if command == "qacct":
+        return 1, "", f"error: job id {jobId} not found\n"
+    return (
+        1,
+        "",
+        "Following jobs do not exist or permissions are not sufficient: \n"
+        + f"{jobId}\n",
+    )
+
+
+def qstat(args: List[str], config: Config) -> Output:
+    jobIds = job_ids(args)
+    with state(config, write=False) as data:
+        jobs: Dict[str, Record] = data["jobs"]
+        active = active_jobs(jobs, config)
+    if len(jobIds) == 0:
+        if config.flavor == "SGE":
+            return 0, sge_job_list(active), ""
+        return 0, torque_status(active, random.Random(0)), ""
+    found = [j for j in active if str(j.jobId) == jobIds[0]]
+    if len(found) == 0:
+        return unknown(jobIds[0], config, "qstat")
+    job = found[0]
+    rng = random.Random(job.jobId)
+    if config.flavor == "SGE":
+        hosts = -(-job.slots // job.ppn) if job.start is not None else 0
+        return 0, sge_detail(job, hosts, rng), ""
+    return 0, torque_status([job], rng), ""
+
+
+def qdel(args: List[str], config: Config) -> Output:
+    jobIds = job_ids(args)
+    lines: List[str] = []
+    with state(config, write=True) as data:
+        jobs: Dict[str, Record] = data["jobs"]
+        for jobId in jobIds:
+            if jobId not in jobs:
+                return unknown(jobId, config, "qdel")
+            _, end = synthetic_job(jobId, jobs, config)
+            if end is not None and end <= time.time():
+                return unknown(jobId, config, "qdel")
+            jobs[jobId]["deleted"] = time.time()
+            lines.append(f"pem has registered the job {jobId} for deletion")
+    # Torque deletes the jobs without any output
+    if config.flavor == "TORQUE":
+        return 0, "", ""
+    return 0, "".join([f"{line}\n" for line in lines]), ""
+
+
+def finished_job(args: List[str], config: Config) -> Optional[SyntheticJob]:
+    jobIds = job_ids(args)
+    if len(jobIds) == 0:
+        return None
+    with state(config, write=False) as data:
+        jobs: Dict[str, Record] = data["jobs"]
+        if jobIds[0] not in jobs:
+            return None
+        job, _ = synthetic_job(jobIds[0], jobs, config)
+    if job.start is None or job.end is None:
+        return None
+    return job
+
+
+def qacct(args: List[str], config: Config) -> Output:
+    job = finished_job(args, config)
+    if job is None:
+        return unknown(args[-1] if args else "", config, "qacct")
+    hosts = -(-job.slots // job.ppn)
+    return 0, sge_accounting_records(job, hosts, random.Random(job.jobId)), ""
+
+
+def tracejob(args: List[str], config: Config) -> Output:
+    job = finished_job(args, config)
+    if job is None:
+        return unknown(args[-1] if args else "", config, "tracejob")
+    rng = random.Random(job.jobId)
+    return 0, torque_trace_of(job, TRACE_EVENTS, rng), ""
+
+
+HANDLERS = {
+    "qsub": qsub,
+    "qstat": qstat,
+    "qdel": qdel,
+    "qacct": qacct,
+    "tracejob": tracejob,
+}
+
+
+def failure(config: Config, command: str) -> Output:
+    if config.flavor == "TORQUE":
+        return (
+            1,
+            "",
+            f"{command}: cannot connect to server {TORQUE_SERVER} "
+            + "(errno=111) Connection refused\n",
+        )
+    return (
+        1,
+        "",
+        "error: failed receiving gdi request response for mid=1 "
+        + "(got syncron message receive timeout error).\n",
+    )
+
+
+def run(command: str, args: List[str], config: Config) -> Output:
+    """
+    Runs a command of the fake scheduler, after the configured
+    latency, returning its exit code, output and error output.
+    """
+    delay = random.uniform(*config.latency)
+    if delay > 0:
+        time.sleep(delay)
+    if random.random() < config.failureRate:
+        return failure(config, command)
+    return HANDLERS[command](args, config)
+
+
+def main(command: str, args: List[str]) -> int:
+    command = os.path.basename(command)
+    if command not in COMMANDS:
+        sys.stderr.write(f"unknown command {command}, use one of {COMMANDS}\n")
+        return 2
+    code, output, error = run(command, args, Config(dict(os.environ)))
+    sys.stdout.write(output)
+    sys.stderr.write(error)
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1], sys.argv[2:]))
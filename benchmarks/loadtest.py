@@ -0,0 +1,415 @@
+"""
+Load test of the API built by make_app, with the SGE or Torque
+repositories running the commands of benchmarks.fakescheduler, so
+that every request goes through the real routers, parsers and
+subprocesses.
+
+Concurrent clients send a weighted mix of GET /jobs, GET /jobs/{id},
+POST /jobs, DELETE /jobs/{id} and GET /programs. For each endpoint it
+reports the p50, p95 and p99 latencies, the throughput and the
+scheduler commands run for each request, read from the Server-Timing
+header. The results are compared with the baselines stored in
+benchmarks/baselines/loadtest.json, and the load test exits with an
+error when an endpoint is slower, fails more often, runs more commands
+or serves fewer requests than its baseline, or misses the latency and
+error rate objectives given.
+
+    $ python -m benchmarks.loadtest
+    $ python -m benchmarks.loadtest --scheduler TORQUE --concurrency 64
+    $ python -m benchmarks.loadtest --mix list=1,get=1 --slo-p99 500
+    $ python -m benchmarks.loadtest --save
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from app.app import make_app
+from app.internal.metrics import COMMAND_DURATION
+from app.internal.settings import Settings
+from app.internal.terminal import SCHEDULER_COMMANDS
+from benchmarks.program_discovery import make_tree
+
+BASELINES = Path(__file__).parent / "baselines" / "loadtest.json"
+FAKE_COMMANDS = Path(__file__).parent / "bin"
+OPERATIONS = ["list", "get", "submit", "delete", "programs"]
+# Differences below this are noise in the timer and the scheduler
+MIN_SLOWDOWN = 0.005
+# Job that is never submitted, for reads when no job is known
+MISSING_JOB = "999999"
+
+
+def mix(value: str) -> Dict[str, float]:
+    weights: Dict[str, float] = {}
+    for pair in value.split(","):
+        name, _, weight = pair.partition("=")
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(
+                f"unknown operation {name}, use one of {OPERATIONS}"
+            )
+        weights[name] = float(weight or "1")
+    return weights
+
+
+def percentile(values: List[float], p: float) -> float:
+    """
+    The nearest-rank percentile of the values, which is always
+    one of the measured latencies.
+    """
+    if len(values) == 0:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def scheduler_commands(header: str) -> int:
+    """
+    The number of scheduler commands run by a request, from its
+    Server-Timing header.
+    """
+    count = 0
+    for metric in header.split(","):
+        fields = metric.strip().split(";")
+        if fields[0] not in SCHEDULER_COMMANDS:
+            continue
+        times = [f for f in fields[1:] if f.startswith("desc=")]
+        count += int(times[0][6:-2]) if times else 1
+    return count
+
+
+class Workload:
+    """
+    The state shared by the clients: the jobs that can be read
+    or deleted, and the measures of each operation.
+    """
+
+    def __init__(self, workdir: Path, seed: int):
+        self.workdir = workdir
+        self.rng = random.Random(seed)
+        self.jobs: List[str] = []
+        self.clear()
+
+    def clear(self):
+        self.latencies: Dict[str, List[float]] = {o: [] for o in OPERATIONS}
+        self.commands: Dict[str, int] = {o: 0 for o in OPERATIONS}
+        self.errors: Dict[str, int] = {o: 0 for o in OPERATIONS}
+
+    def job_body(self) -> Dict[str, Any]:
+        return {
+            "name": "NEWAVE-loadtest",
+            "clusterId": "1",
+            "reservedSlots": 64,
+            "scriptFile": "job.sh",
+            "workingDirectory": str(self.workdir),
+            "args": ["28.16.4"],
+        }
+
+    def pick_job(self, remove: bool = False) -> str:
+        """
+        A known job, at random for reads, which also reach finished
+        jobs, and the newest one for deletions, which is still running.
+        """
+        if len(self.jobs) == 0:
+            return MISSING_JOB
+        if remove:
+            return self.jobs.pop()
+        return self.jobs[self.rng.randrange(len(self.jobs))]
+
+    async def request(self, client: httpx.AsyncClient, operation: str):
+        if operation == "list":
+            call = client.get("/jobs/")
+        elif operation == "get":
+            call = client.get(f"/jobs/{self.pick_job()}")
+        elif operation == "submit":
+            call = client.post("/jobs/", json=self.job_body())
+        elif operation == "delete":
+            call = client.delete(f"/jobs/{self.pick_job(remove=True)}")
+        else:
+            call = client.get("/programs/")
+        start = time.perf_counter()
+        response = await call
+        self.latencies[operation].append(time.perf_counter() - start)
+        self.commands[operation] += scheduler_commands(
+            response.headers.get("server-timing", "")
+        )
+        if response.status_code >= 500:
+            self.errors[operation] += 1
+        elif operation == "submit":
+            self.jobs.append(response.json()["jobId"])
+
+
+def setup_environment(args: argparse.Namespace, workdir: Path):
+    """
+    Points the API to the fake scheduler and to a synthetic tree of
+    programs, before the settings are read.
+    """
+    make_tree(workdir / "programs", args.versions)
+    rules = workdir / "rules.json"
+    rules.write_text(
+        json.dumps(
+            {
+                "programs": [
+                    {
+                        "name": "NEWAVE",
+                        "idPrefix": "NW",
+                        "root": str(workdir / "programs" / "NEWAVE"),
+                        "version": "v(?P<tag>.+)",
+                        "command": "{path}/mpi_newave{tag}.job",
+                    },
+                    {
+                        "name": "DESSEM",
+                        "idPrefix": "DS",
+                        "root": str(workdir / "programs" / "dessem"),
+                        "entry": "dessem_{version}",
+                        "kind": "file",
+                    },
+                ]
+            }
+        )
+    )
+    (workdir / "job.sh").write_text("")
+    os.environ.update(
+        {
+            # As set by main.py, where the API returns after a qsub
+            "APP_INSTALLDIR": str(Path(__file__).parents[1]),
+            "PATH": f"{FAKE_COMMANDS}:{os.environ['PATH']}",
+            "SCHEDULER": args.scheduler,
+            "PROGRAM_PATH_RULE": "RULES",
+            "PROGRAM_RULES": str(rules),
+            "PROGRAM_CATALOG_WATCH": "",
+            "FAKE_SCHEDULER": args.scheduler,
+            "FAKE_SCHEDULER_STATE": str(workdir / "state.json"),
+            "FAKE_SCHEDULER_QUEUE_TIME": str(args.queue_time),
+            "FAKE_SCHEDULER_RUN_TIME": str(args.run_time),
+            "FAKE_SCHEDULER_LATENCY": args.latency,
+            "FAKE_SCHEDULER_FAILURE_RATE": str(args.failure_rate),
+        }
+    )
+
+
+async def load(
+    args: argparse.Namespace, workdir: Path
+) -> Tuple[Workload, float, int]:
+    """
+    Runs the load against the API, after submitting the jobs read
+    by the clients, returning the measures, the wall time of the load
+    and the number of commands counted by the metrics of the API.
+    """
+    Settings.read_environments()
+    app = make_app(root_path="")
+    workload = Workload(workdir, args.seed)
+    operations = list(args.mix.keys())
+    weights = list(args.mix.values())
+    # Errors of the API are answered with 500, as by uvicorn
+    transport = httpx.ASGITransport(
+        app=app, raise_app_exceptions=False  # type: ignore
+    )
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://loadtest", timeout=None
+        ) as client:
+            for _ in range(args.jobs):
+                await workload.request(client, "submit")
+            workload.clear()
+            before = sum(sum(c) for c in COMMAND_DURATION.counts.values())
+            remaining = [args.requests]
+
+            async def client_loop():
+                while remaining[0] > 0:
+                    remaining[0] -= 1
+                    operation = workload.rng.choices(operations, weights)[0]
+                    await workload.request(client, operation)
+
+            start = time.perf_counter()
+            await asyncio.gather(
+                *[client_loop() for _ in range(args.concurrency)]
+            )
+            elapsed = time.perf_counter() - start
+            after = sum(sum(c) for c in COMMAND_DURATION.counts.values())
+    return workload, elapsed, after - before
+
+
+def summarize(
+    workload: Workload, elapsed: float, commands: int
+) -> Dict[str, Dict[str, float]]:
+    """
+    The measures of each operation and of all of them. The commands of
+    a request that failed before its response are not in its
+    Server-Timing header, so the total is taken from the metrics.
+    """
+    results: Dict[str, Dict[str, float]] = {}
+    operations = [o for o in OPERATIONS if workload.latencies[o]]
+    groups = [(o, [o]) for o in operations] + [("all", operations)]
+    for name, members in groups:
+        latencies = [t for o in members for t in workload.latencies[o]]
+        requests = len(latencies)
+        results[name] = {
+            "requests": requests,
+            "errors": sum([workload.errors[o] for o in members]),
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "throughput": requests / elapsed,
+            "commandsPerRequest": sum([workload.commands[o] for o in members])
+            / requests,
+        }
+    results["all"]["commandsPerRequest"] = (
+        commands / results["all"]["requests"]
+    )
+    return results
+
+
+def error_rate(result: Dict[str, float]) -> float:
+    if result["requests"] == 0:
+        return 0.0
+    return result["errors"] / result["requests"]
+
+
+def regressions(
+    result: Dict[str, float],
+    baseline: Optional[Dict[str, float]],
+    args: argparse.Namespace,
+) -> List[str]:
+    found: List[str] = []
+    for p, slo in [("p95", args.slo_p95), ("p99", args.slo_p99)]:
+        if slo is not None and result[p] * 1000 > slo:
+            found.append(f"{p} slo")
+    if error_rate(result) > args.slo_error_rate:
+        found.append("error rate slo")
+    if baseline is None:
+        return found
+    if error_rate(result) > error_rate(baseline) + args.error_margin:
+        found.append("errors")
+    for p in ["p95", "p99"]:
+        slowdown = result[p] - baseline[p]
+        if slowdown > max(baseline[p] * args.tolerance, MIN_SLOWDOWN):
+            found.append(p)
+    if result["throughput"] * (1 + args.tolerance) < baseline["throughput"]:
+        found.append("throughput")
+    if result["commandsPerRequest"] > baseline["commandsPerRequest"] * (
+        1 + args.amplification
+    ):
+        found.append("commands")
+    return found
+
+
+def run(args: argparse.Namespace) -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        setup_environment(args, workdir)
+        workload, elapsed, counted = asyncio.run(load(args, workdir))
+    results = summarize(workload, elapsed, counted)
+    baselines: Dict[str, Dict[str, float]] = {}
+    if BASELINES.exists():
+        baselines = json.loads(BASELINES.read_text())
+    failed = False
+    print(
+        f"{'endpoint':<32}{'requests':>9}{'errors':>7}{'p50 (ms)':>10}"
+        + f"{'p95 (ms)':>10}{'p99 (ms)':>10}{'req/s':>9}{'cmd/req':>9}"
+        + "  baseline"
+    )
+    for name, result in results.items():
+        key = f"{args.scheduler.lower()}.{name}[{args.concurrency} clients]"
+        found = regressions(result, baselines.get(key), args)
+        failed = failed or len(found) > 0
+        status = ", ".join(found) if found else "ok"
+        if key not in baselines and len(found) == 0:
+            status = "new"
+        print(
+            f"{key:<32}{int(result['requests']):>9}"
+            + f"{int(result['errors']):>7}"
+            + "".join(
+                [f"{result[p] * 1000:>10.1f}" for p in ["p50", "p95", "p99"]]
+            )
+            + f"{result['throughput']:>9.1f}"
+            + f"{result['commandsPerRequest']:>9.2f}  {status}"
+        )
+        if args.save:
+            baselines[key] = result
+    if args.save:
+        BASELINES.parent.mkdir(exist_ok=True)
+        BASELINES.write_text(json.dumps(baselines, indent=4) + "\n")
+        return 0
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument(
+        "--scheduler", choices=["SGE", "TORQUE"], default="SGE"
+    )
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument(
+        "--mix",
+        type=mix,
+        default=mix("list=40,get=30,submit=15,delete=5,programs=10"),
+        help="weights of the operations, as list=40,get=30,...",
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=20, help="jobs submitted before the load"
+    )
+    parser.add_argument(
+        "--versions", type=int, default=100, help="versions of the programs"
+    )
+    parser.add_argument("--queue-time", type=float, default=1.0)
+    parser.add_argument("--run-time", type=float, default=10.0)
+    parser.add_argument(
+        "--latency",
+        default="0",
+        help="seconds taken by each fake command, or a min,max range",
+    )
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.5,
+        help="slowdown over the baseline latencies and throughput "
+        + "taken as a regression",
+    )
+    parser.add_argument(
+        "--amplification",
+        type=float,
+        default=0.1,
+        help="growth over the baseline commands per request "
+        + "taken as a regression",
+    )
+    parser.add_argument(
+        "--error-margin",
+        type=float,
+        default=0.005,
+        help="growth over the baseline error rate taken as a regression",
+    )
+    parser.add_argument(
+        "--slo-p95", type=float, help="p95 latency objective, in ms"
+    )
+    parser.add_argument(
+        "--slo-p99", type=float, help="p99 latency objective, in ms"
+    )
+    parser.add_argument(
+        "--slo-error-rate",
+        type=float,
+        default=0.01,
+        help="largest fraction of requests answered with errors",
+    )
+    parser.add_argument(
+        "--save", action="store_true", help="stores the results as baselines"
+    )
+    args = parser.parse_args()
+    sys.exit(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+Benchmark of the parsing of the scheduler outputs by each method of
+the SGE and Torque repositories, on synthetic outputs generated at
+several scales by benchmarks.scheduleroutput.
+
+For each method and scale it reports the parse throughput, in items
+(jobs, tasks, hosts or log events) per second, and the peak memory
+allocated while parsing. The results are compared with the baselines
+stored in benchmarks/baselines/parsers.json, and the benchmark exits
+with an error when a case is slower or uses more memory than its
+baseline by more than the tolerance.
+
+    $ python -m benchmarks.parsers
+    $ python -m benchmarks.parsers --jobs 10,1000,100000 --tasks 4096
+    $ python -m benchmarks.parsers --save
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from unittest.mock import patch
+
+from app.adapters.schedulerrepository import (
+    SGESchedulerRepository,
+    TorqueSchedulerRepository,
+)
+from app.internal.httpresponse import HTTPResponse
+from benchmarks.scheduleroutput import (
+    job_number,
+    sge_accounting,
+    sge_job_detail,
+    sge_list_jobs,
+    torque_job_detail,
+    torque_list_jobs,
+    torque_trace,
+)
+
+BASELINES = Path(__file__).parent / "baselines" / "parsers.json"
+JOB_ID = job_number(0)
+# Differences below this are noise in the timer and the scheduler
+MIN_SLOWDOWN = 0.001
+
+# Name of the case, the unit of its scale, the output generator
+# and the repository method that parses it
+Case = Tuple[str, str, Callable[[int], str], Callable]
+CASES: List[Tuple[str, Case]] = [
+    (
+        "jobs",
+        (
+            "sge.list_jobs",
+            "jobs",
+            sge_list_jobs,
+            SGESchedulerRepository.list_jobs,
+        ),
+    ),
+    (
+        "tasks",
+        (
+            "sge.get_job",
+            "tasks",
+            lambda n: sge_job_detail(JOB_ID, n),
+            lambda: SGESchedulerRepository.get_job(str(JOB_ID)),
+        ),
+    ),
+    (
+        "hosts",
+        (
+            "sge.get_finished_job",
+            "hosts",
+            lambda n: sge_accounting(JOB_ID, n),
+            lambda: SGESchedulerRepository.get_finished_job(str(JOB_ID)),
+        ),
+    ),
+    (
+        "jobs",
+        (
+            "torque.list_jobs",
+            "jobs",
+            torque_list_jobs,
+            TorqueSchedulerRepository.list_jobs,
+        ),
+    ),
+    (
+        "single",
+        (
+            "torque.get_job",
+            "jobs",
+            lambda n: torque_job_detail(JOB_ID),
+            lambda: TorqueSchedulerRepository.get_job(str(JOB_ID)),
+        ),
+    ),
+    (
+        "events",
+        (
+            "torque.get_finished_job",
+            "events",
+            lambda n: torque_trace(JOB_ID, n),
+            lambda: TorqueSchedulerRepository.get_finished_job(str(JOB_ID)),
+        ),
+    ),
+]
+
+
+async def parse(method: Callable, content: str) -> Any:
+    """
+    Calls a repository method with the command replaced by
+    an output generated beforehand.
+    """
+
+    async def output(*args, **kwargs):
+        return 0, content
+
+    with patch("app.adapters.schedulerrepository.run_terminal_retry", output):
+        result = await method()
+    if isinstance(result, HTTPResponse):
+        raise RuntimeError(f"{result.code}: {result.detail}")
+    return result
+
+
+async def measure(
+    method: Callable, content: str, repeat: int
+) -> Tuple[float, int]:
+    """
+    The best time of the repetitions, and the peak of the memory
+    allocated during a separate run, as tracemalloc slows down the
+    allocations.
+    """
+    times: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await parse(method, content)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        await parse(method, content)
+        peak = tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    return min(times), peak
+
+
+def regressions(
+    result: Dict[str, float],
+    baseline: Optional[Dict[str, float]],
+    tolerance: float,
+    memoryTolerance: float,
+) -> List[str]:
+    if baseline is None:
+        return []
+    found: List[str] = []
+    slowdown = result["seconds"] - baseline["seconds"]
+    if slowdown > max(baseline["seconds"] * tolerance, MIN_SLOWDOWN):
+        found.append("time")
+    if result["peakBytes"] > baseline["peakBytes"] * (1 + memoryTolerance):
+        found.append("memory")
+    return found
+
+
+async def run(args: argparse.Namespace) -> int:
+    scales = {
+        "jobs": args.jobs,
+        "tasks": args.tasks,
+        "hosts": args.hosts,
+        "events": args.events,
+        "single": [1],
+    }
+    baselines: Dict[str, Dict[str, float]] = {}
+    if BASELINES.exists():
+        baselines = json.loads(BASELINES.read_text())
+    results: Dict[str, Dict[str, float]] = {}
+    failed = False
+    print(
+        f"{'case':<40}{'time (s)':>10}{'items/s':>12}{'peak (MB)':>11}"
+        + f"{'baseline':>10}"
+    )
+    for scale, (name, unit, generate, method) in CASES:
+        for n in scales[scale]:
+            key = f"{name}[{n} {unit}]"
+            content = generate(n)
+            seconds, peak = await measure(method, content, args.repeat)
+            result = {"seconds": seconds, "peakBytes": peak}
+            results[key] = result
+            found = regressions(
+                result, baselines.get(key), args.tolerance, args.memory
+            )
+            failed = failed or len(found) > 0
+            status = ", ".join(found) if found else "ok"
+            if key not in baselines:
+                status = "new"
+            print(
+                f"{key:<40}{seconds:>10.4f}{n / seconds:>12.0f}"
+                + f"{peak / 2**20:>11.2f}{status:>10}"
+            )
+    if args.save:
+        BASELINES.parent.mkdir(exist_ok=True)
+        BASELINES.write_text(
+            json.dumps({**baselines, **results}, indent=4) + "\n"
+        )
+        return 0
+    return 1 if failed else 0
+
+
+def counts(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--jobs", type=counts, default=[10, 1000, 10000])
+    parser.add_argument("--tasks", type=counts, default=[64, 1024, 4096])
+    parser.add_argument("--hosts", type=counts, default=[1, 16, 128])
+    parser.add_argument("--events", type=counts, default=[10, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.5,
+        help="slowdown over the baseline time taken as a regression",
+    )
+    parser.add_argument(
+        "--memory",
+        type=float,
+        default=0.2,
+        help="growth over the baseline peak memory taken as a regression",
+    )
+    parser.add_argument(
+        "--save", action="store_true", help="stores the results as baselines"
+    )
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Benchmark of the program discovery on a synthetic tree of versions,
+with an artificial latency added to each filesystem call for
+emulating an NFS mount.
+
+Compares the repositories with a baseline that lists each root and
+stats each entry from the event loop, one root after the other, as
+the repositories did before. Besides the time of a full listing, it
+reports the longest the event loop was kept from running other tasks.
+
+    $ python -m benchmarks.program_discovery --versions 10000 --latency 0.2
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, List, Tuple, Type
+
+from app.adapters.programpathrepository import (
+    AbstractProgramPathRepository,
+    PEMAWSProgramPathRepository,
+    TuberProgramPathRepository,
+)
+from app.utils.programrules import compile_rules
+
+
+def make_tree(root: Path, versions: int):
+    """
+    Creates the NEWAVE and DECOMP roots, with a directory for each
+    version, and the DESSEM root, with a file for each version.
+    """
+    for i in range(versions):
+        kind = i % 5
+        if kind < 2:
+            path = root / "NEWAVE" / f"v{i}"
+            path.mkdir(parents=True)
+            (path / f"mpi_newave{i}.job").write_text("")
+        elif kind < 4:
+            path = root / "DECOMP" / f"v{i}"
+            path.mkdir(parents=True)
+            (path / f"mpi_decomp{i}.job").write_text("")
+        else:
+            (root / "dessem").mkdir(exist_ok=True)
+            (root / "dessem" / f"dessem_{i}").write_text("")
+
+
+@contextmanager
+def latency(seconds: float):
+    """
+    Adds a delay to every call that reaches the filesystem server
+    on NFS: directory listings and stats.
+    """
+    originals = {
+        "stat": os.stat,
+        "listdir": os.listdir,
+        "scandir": os.scandir,
+    }
+
+    def delayed(function: Callable) -> Callable:
+        def call(*args, **kwargs):
+            time.sleep(seconds)
+            return function(*args, **kwargs)
+
+        return call
+
+    for name, function in originals.items():
+        setattr(os, name, delayed(function))
+    try:
+        yield
+    finally:
+        for name, function in originals.items():
+            setattr(os, name, function)
+
+
+async def baseline(repository: Type[AbstractProgramPathRepository]) -> int:
+    count = 0
+    for root in repository.roots():
+        if not os.path.isdir(root):
+            continue
+        for v in os.listdir(root):
+            path = os.path.join(root, v)
+            if os.path.isdir(path):
+                if issubclass(repository, PEMAWSProgramPathRepository):
+                    os.listdir(path)
+                count += 1
+            elif os.path.isfile(path):
+                count += 1
+    return count
+
+
+async def current(repository: Type[AbstractProgramPathRepository]) -> int:
+    programs = await repository.list_programs()
+    return len(programs) if isinstance(programs, list) else 0
+
+
+async def measure(
+    listing: Callable, repository: Type[AbstractProgramPathRepository]
+) -> Tuple[float, float, int]:
+    """
+    Runs a listing while a ticker measures the longest delay of
+    the event loop.
+    """
+    interval = 0.005
+    lags: List[float] = [0.0]
+    done = asyncio.Event()
+
+    async def ticker():
+        loop = asyncio.get_running_loop()
+        while not done.is_set():
+            before = loop.time()
+            await asyncio.sleep(interval)
+            lags.append(loop.time() - before - interval)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    count = await listing(repository)
+    elapsed = time.perf_counter() - start
+    done.set()
+    await task
+    return elapsed, max(lags), count
+
+
+async def run(versions: int, latencyMs: float):
+    with tempfile.TemporaryDirectory() as directory:
+        root = Path(directory)
+        make_tree(root, versions)
+        print(f"{versions} versions, {latencyMs} ms per filesystem call")
+        print(f"{'rule':<8}{'listing':<10}{'time (s)':>10}{'lag (s)':>10}")
+        for repository in [
+            PEMAWSProgramPathRepository,
+            TuberProgramPathRepository,
+        ]:
+
+            rules = compile_rules(str(repository.RULES_FILE))
+            for r in rules:
+                r.root = root / r.root.name
+
+            class Synthetic(repository):  # type: ignore
+                RULES = rules
+
+            rule = repository.__name__.replace("ProgramPathRepository", "")
+            for name, listing in [
+                ("baseline", baseline),
+                ("scandir", current),
+            ]:
+                with latency(latencyMs / 1000):
+                    elapsed, lag, count = await measure(listing, Synthetic)
+                print(
+                    f"{rule:<8}{name:<10}{elapsed:>10.3f}{lag:>10.3f}"
+                    + f"  ({count} programs)"
+                )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--versions", type=int, default=10000)
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+    asyncio.run(run(args.versions, args.latency))
+
+
+if __name__ == "__main__":
+    main()
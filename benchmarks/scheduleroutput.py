@@ -0,0 +1,470 @@
+"""
+Generator of synthetic outputs of the SGE and Torque commands, in the
+formats read by the scheduler repositories, at any scale: from a few
+jobs to hundreds of thousands, and MPI jobs with thousands of tasks.
+
+The contents follow the outputs captured in tests/mocks/scheduler,
+with values drawn from a seeded generator, so that the same arguments
+always give the same output. The outputs can also be written for a
+given list of jobs, which is how benchmarks.fakescheduler answers the
+commands.
+
+    $ python -m benchmarks.scheduleroutput qstat-xml --jobs 1000
+    $ python -m benchmarks.scheduleroutput qstat-j-xml --tasks 4096
+"""
+
+import argparse
+import random
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+EPOCH = datetime(2024, 1, 17, 15, 0, 0)
+PROGRAMS = ["NEWAVE-v28.16.4", "DECOMP-v31.21", "DESSEM-19.0.24"]
+SGE_STATES = ["r", "r", "r", "qw", "t", "dr"]
+TORQUE_STATES = ["R", "R", "R", "Q", "E", "H"]
+USAGES = ["cpu", "mem", "io", "iow", "vmem", "maxvmem"]
+ACCOUNTING_SEPARATOR = "=" * 62
+TORQUE_SERVER = "prd-cluster-01.ons.org.br"
+TORQUE_LINE_LENGTH = 78
+
+
+def job_number(i: int) -> int:
+    return 1000 + i
+
+
+def timestamp(moment: datetime) -> str:
+    return moment.strftime("%a %b %d %H:%M:%S %Y")
+
+
+class SyntheticJob:
+    """
+    A job as seen by the scheduler, from which the outputs of the
+    commands are written. Jobs without a start time are still
+    waiting, and jobs with an end time are finished.
+    """
+
+    def __init__(
+        self,
+        jobId: int,
+        name: str,
+        state: str,
+        submitted: datetime,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        slots: int = 64,
+        ppn: int = 32,
+        cwd: str = "/home/pem/estudos/caso/newave",
+        script: str = "/home/pem/rotinas/jobs/mpi_newave.job",
+        args: Optional[List[str]] = None,
+    ):
+        self.jobId = jobId
+        self.name = name
+        self.state = state
+        self.submitted = submitted
+        self.start = start
+        self.end = end
+        self.slots = slots
+        self.ppn = ppn
+        self.cwd = cwd
+        self.script = script
+        self.args = args or []
+
+
+def random_job(i: int, states: List[str], rng: random.Random) -> SyntheticJob:
+    submitted = EPOCH + timedelta(seconds=rng.randint(0, 86400))
+    nodes = rng.randint(1, 8)
+    return SyntheticJob(
+        jobId=job_number(i),
+        name=f"{rng.choice(PROGRAMS)}_{i}",
+        state=rng.choice(states),
+        submitted=submitted,
+        start=submitted + timedelta(seconds=rng.randint(1, 60)),
+        slots=nodes * 32,
+        cwd=f"/home/pem/estudos/caso_{i}/newave",
+        args=["28.16.4", str(nodes * 32)],
+    )
+
+
+def sge_job_element(job: SyntheticJob) -> List[str]:
+    # Waiting jobs have a submission time instead of a start time
+    # and no queue yet
+    if job.start is not None:
+        state = "running"
+        time = f"<JAT_start_time>{job.start.isoformat()}</JAT_start_time>"
+        queue = f"all.q@node{job.jobId % 64:03d}"
+    else:
+        state = "pending"
+        time = (
+            "<JB_submission_time>"
+            + f"{job.submitted.isoformat()}</JB_submission_time>"
+        )
+        queue = ""
+    return [
+        f'    <job_list state="{state}">',
+        f"      <JB_job_number>{job.jobId}</JB_job_number>",
+        "      <JAT_prio>0.55500</JAT_prio>",
+        f"      <JB_name>{job.name}</JB_name>",
+        "      <JB_owner>pem</JB_owner>",
+        f"      <state>{job.state}</state>",
+        f"      {time}",
+        f"      <queue_name>{queue}</queue_name>",
+        f"      <slots>{job.slots}</slots>",
+        "    </job_list>",
+    ]
+
+
+def sge_job_list(jobs: List[SyntheticJob]) -> str:
+    """
+    Output of `qstat -xml` with the given jobs, the running ones in
+    the queues and the waiting ones in the pending list.
+    """
+    lines = [
+        "<?xml version='1.0'?>",
+        '<job_info  xmlns:xsd="http://gridscheduler.svn.sourceforge.net/'
+        + "viewvc/gridscheduler/trunk/source/dist/util/resources/schemas/"
+        + 'qstat/qstat.xsd?revision=11">',
+        "  <queue_info>",
+    ]
+    for job in jobs:
+        if job.start is not None:
+            lines += sge_job_element(job)
+    lines += ["  </queue_info>", "  <job_info>"]
+    for job in jobs:
+        if job.start is None:
+            lines += sge_job_element(job)
+    lines += ["  </job_info>", "</job_info>"]
+    return "\n".join(lines) + "\n"
+
+
+def sge_list_jobs(jobs: int, seed: int = 0) -> str:
+    """
+    Output of `qstat -xml`, with the given number of jobs.
+    """
+    rng = random.Random(seed)
+    return sge_job_list([random_job(i, SGE_STATES, rng) for i in range(jobs)])
+
+
+def sge_usage(tag: str, rng: random.Random, indent: str) -> List[str]:
+    lines: List[str] = []
+    for name in USAGES:
+        lines += [
+            f"{indent}<{tag}>",
+            f"{indent}  <UA_name>{name}</UA_name>",
+            f"{indent}  <UA_value>{rng.uniform(0, 1e9):.6f}</UA_value>",
+            f"{indent}</{tag}>",
+        ]
+    return lines
+
+
+def sge_detail(job: SyntheticJob, tasks: int, rng: random.Random) -> str:
+    """
+    Output of `qstat -j <jobId> -xml` for a job, with the given
+    number of parallel environment tasks.
+    """
+    lines = [
+        "<?xml version='1.0'?>",
+        '<detailed_job_info  xmlns:xsd="http://gridscheduler.svn.'
+        + "sourceforge.net/viewvc/gridscheduler/trunk/source/dist/util/"
+        + 'resources/schemas/qstat/qstat.xsd?revision=11">',
+        "  <djob_info>",
+        "    <element>",
+        f"      <JB_job_number>{job.jobId}</JB_job_number>",
+        f"      <JB_exec_file>job_scripts/{job.jobId}</JB_exec_file>",
+        "      <JB_submission_time>"
+        + f"{int(job.submitted.timestamp())}</JB_submission_time>",
+        "      <JB_owner>pem</JB_owner>",
+        f"      <JB_job_name>{job.name}</JB_job_name>",
+        "      <JB_env_list>",
+    ]
+    for name, value in [("O_HOME", "/home/pem"), ("O_WORKDIR", job.cwd)]:
+        lines += [
+            "        <job_sublist>",
+            f"          <VA_variable>__SGE_PREFIX__{name}</VA_variable>",
+            f"          <VA_value>{value}</VA_value>",
+            "        </job_sublist>",
+        ]
+    lines += ["      </JB_env_list>", "      <JB_job_args>"]
+    for arg in job.args:
+        lines += [
+            "        <element>",
+            f"          <ST_name>{arg}</ST_name>",
+            "        </element>",
+        ]
+    lines += [
+        "      </JB_job_args>",
+        f"      <JB_script_file>{job.script}</JB_script_file>",
+        "      <JB_ja_tasks>",
+        "        <ulong_sublist>",
+        "          <JAT_status>128</JAT_status>",
+        "          <JAT_task_number>1</JAT_task_number>",
+        "          <JAT_scaled_usage_list>",
+        *sge_usage("scaled", rng, "            "),
+        "          </JAT_scaled_usage_list>",
+        "          <JAT_task_list>",
+    ]
+    for t in range(tasks):
+        lines += [
+            "            <element>",
+            f"              <PET_id>{t + 1}.node{t % 64:03d}</PET_id>",
+            "              <PET_status>0</PET_status>",
+            f"              <PET_pid>{10000 + t}</PET_pid>",
+            "              <PET_scaled_usage>",
+            *sge_usage("reported_usage", rng, "                "),
+            "              </PET_scaled_usage>",
+            "            </element>",
+        ]
+    lines += [
+        "          </JAT_task_list>",
+        "        </ulong_sublist>",
+        "      </JB_ja_tasks>",
+        f"      <JB_cwd>{job.cwd}</JB_cwd>",
+        "      <JB_pe>orte</JB_pe>",
+        "      <JB_pe_range>",
+        "        <ranges>",
+        f"          <RN_min>{job.slots}</RN_min>",
+        f"          <RN_max>{job.slots}</RN_max>",
+        "          <RN_step>1</RN_step>",
+        "        </ranges>",
+        "      </JB_pe_range>",
+        "    </element>",
+        "  </djob_info>",
+        "</detailed_job_info>",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def sge_job_detail(jobId: int, tasks: int, seed: int = 0) -> str:
+    """
+    Output of `qstat -j <jobId> -xml` for a running MPI job, with
+    the given number of parallel environment tasks.
+    """
+    rng = random.Random(seed)
+    job = random_job(jobId - job_number(0), ["r"], rng)
+    job.slots = tasks
+    return sge_detail(job, tasks, rng)
+
+
+def sge_accounting_records(
+    job: SyntheticJob, hosts: int, rng: random.Random
+) -> str:
+    """
+    Output of `qacct -j <jobId>` for a finished job, with one
+    record for each host it ran on.
+    """
+    start = job.start or job.submitted
+    end = job.end or start
+    lines: List[str] = []
+    for h in range(hosts):
+        fields = [
+            ("qname", "all.q"),
+            ("hostname", f"node{h:03d}"),
+            ("group", "pem"),
+            ("owner", "pem"),
+            ("jobname", job.name),
+            ("jobnumber", str(job.jobId)),
+            ("qsub_time", timestamp(job.submitted)),
+            ("start_time", timestamp(start)),
+            ("end_time", timestamp(end)),
+            ("granted_pe", "orte"),
+            ("slots", str(job.slots)),
+            ("failed", "0"),
+            ("exit_status", "0"),
+            ("ru_wallclock", str(int((end - start).total_seconds()))),
+            ("ru_utime", f"{rng.uniform(0, 1e5):.3f}"),
+            ("ru_maxrss", str(rng.randint(1, 10**7))),
+            ("cpu", f"{rng.uniform(0, 1e5):.3f}"),
+            ("mem", f"{rng.uniform(0, 1e6):.3f}"),
+            ("io", f"{rng.uniform(0, 1e4):.3f}"),
+            ("iow", "0.000"),
+            ("maxvmem", f"{rng.uniform(1, 64):.3f}G"),
+            ("arid", "undefined"),
+        ]
+        lines.append(ACCOUNTING_SEPARATOR)
+        lines += [f"{k:<13}{v}" for k, v in fields]
+    return "\n".join(lines) + "\n"
+
+
+def sge_accounting(jobId: int, hosts: int, seed: int = 0) -> str:
+    """
+    Output of `qacct -j <jobId>` for a finished MPI job, with one
+    record for each host it ran on.
+    """
+    rng = random.Random(seed)
+    job = random_job(jobId - job_number(0), ["r"], rng)
+    job.slots = hosts * 32
+    job.end = job.start + timedelta(seconds=rng.randint(600, 36000))
+    return sge_accounting_records(job, hosts, rng)
+
+
+def torque_attribute(key: str, value: str) -> List[str]:
+    """
+    An attribute of `qstat -f`, wrapped as Torque does when
+    it is longer than a line.
+    """
+    line = f"    {key} = {value}"
+    lines = [line[:TORQUE_LINE_LENGTH]]
+    rest = line[TORQUE_LINE_LENGTH:]
+    while rest:
+        lines.append("\t" + rest[: TORQUE_LINE_LENGTH - 1])
+        rest = rest[TORQUE_LINE_LENGTH - 1 :]
+    return lines
+
+
+def torque_job(job: SyntheticJob, rng: random.Random) -> List[str]:
+    nodes = max(1, job.slots // job.ppn)
+    cput = rng.randint(0, 500 * 3600)
+    stem = f"{job.cwd}/{job.name}"
+    attributes = [
+        ("Job_Name", job.name),
+        ("Job_Owner", f"gpo2@{TORQUE_SERVER}"),
+        (
+            "resources_used.cput",
+            f"{cput // 3600:02d}:{cput // 60 % 60:02d}:{cput % 60:02d}",
+        ),
+        ("resources_used.mem", f"{rng.randint(1, 10**8)}kb"),
+        ("resources_used.vmem", f"{rng.randint(1, 10**8)}kb"),
+        ("resources_used.walltime", "03:27:19"),
+        ("job_state", job.state),
+        ("queue", "batch"),
+        ("server", TORQUE_SERVER),
+        ("ctime", timestamp(job.submitted)),
+        ("Error_Path", f"{TORQUE_SERVER}:{stem}.e{job.jobId}"),
+        (
+            "exec_host",
+            "+".join(
+                [f"n1-{n}.cluster.local/0-{job.ppn - 1}" for n in range(nodes)]
+            ),
+        ),
+        ("Output_Path", f"{TORQUE_SERVER}:{stem}.o{job.jobId}"),
+        ("Priority", "0"),
+        ("Resource_List.nodect", str(nodes)),
+        ("Resource_List.nodes", f"{nodes}:ppn={job.ppn}"),
+        ("Resource_List.walltime", "50:00:00"),
+        (
+            "submit_args",
+            " ".join(
+                [job.script, f"-l nodes={nodes}:ppn={job.ppn}", *job.args]
+            ),
+        ),
+    ]
+    if job.start is not None:
+        attributes.append(("start_time", timestamp(job.start)))
+    attributes += [("start_count", "1"), ("submit_host", TORQUE_SERVER)]
+    lines = [f"Job Id: {job.jobId}.{TORQUE_SERVER}"]
+    for key, value in attributes:
+        lines += torque_attribute(key, value)
+    return lines + [""]
+
+
+def torque_status(jobs: List[SyntheticJob], rng: random.Random) -> str:
+    """
+    Output of `qstat -f` with the given jobs.
+    """
+    lines: List[str] = []
+    for job in jobs:
+        lines += torque_job(job, rng)
+    return "\n".join(lines) + "\n"
+
+
+def torque_list_jobs(jobs: int, seed: int = 0) -> str:
+    """
+    Output of `qstat -f`, with the given number of jobs.
+    """
+    rng = random.Random(seed)
+    return torque_status(
+        [random_job(i, TORQUE_STATES, rng) for i in range(jobs)], rng
+    )
+
+
+def torque_job_detail(jobId: int, seed: int = 0) -> str:
+    """
+    Output of `qstat -f <jobId>`.
+    """
+    rng = random.Random(seed)
+    return torque_status(
+        [random_job(jobId - job_number(0), TORQUE_STATES, rng)], rng
+    )
+
+
+def torque_trace_of(job: SyntheticJob, events: int, rng: random.Random) -> str:
+    """
+    Output of `tracejob <jobId>` for a finished job, with the given
+    number of log events between its start and its end.
+    """
+    start = job.start or job.submitted
+    end = job.end or start
+    step = (end - start) / (events + 1)
+
+    def event(moment: datetime, source: str, message: str) -> str:
+        stamp = moment.strftime("%m/%d/%Y %H:%M:%S")
+        return f"{stamp}.{rng.randint(0, 999):03d} {source}    {message}"
+
+    name = f"{job.jobId}.{TORQUE_SERVER}"
+    lines = [
+        "",
+        f"Job: {name}",
+        "",
+        event(job.submitted, "S", "enqueuing into batch, state 1 hop 1"),
+        event(start, "L", "Job Run"),
+        event(start, "S", f"Job Run at request of root@{TORQUE_SERVER}"),
+    ]
+    for e in range(events):
+        lines.append(
+            event(
+                start + step * (e + 1),
+                "S",
+                "Not sending email: User does not want mail.",
+            )
+        )
+    lines += [
+        event(end, "S", f"on_job_exit valid pjob: {name} (substate=50)"),
+        event(
+            end,
+            "S",
+            "Exit_status=0 "
+            + f"resources_used.cput={rng.randint(0, 10**6)} "
+            + "resources_used.energy_used=0 "
+            + f"resources_used.mem={rng.randint(1, 10**8)}kb "
+            + f"resources_used.vmem={rng.randint(1, 10**8)}kb "
+            + "resources_used.walltime=00:11:15",
+        ),
+        event(end, "S", "dequeuing from batch, state COMPLETE"),
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def torque_trace(jobId: int, events: int, seed: int = 0) -> str:
+    """
+    Output of `tracejob <jobId>` for a finished job, with the given
+    number of log events between its start and its end.
+    """
+    rng = random.Random(seed)
+    job = random_job(jobId - job_number(0), ["C"], rng)
+    job.end = job.start + timedelta(seconds=rng.randint(600, 36000))
+    return torque_trace_of(job, events, rng)
+
+
+GENERATORS: Dict[str, Callable[[argparse.Namespace], str]] = {
+    "qstat-xml": lambda a: sge_list_jobs(a.jobs, a.seed),
+    "qstat-j-xml": lambda a: sge_job_detail(job_number(0), a.tasks, a.seed),
+    "qacct": lambda a: sge_accounting(job_number(0), a.hosts, a.seed),
+    "qstat-f": lambda a: torque_list_jobs(a.jobs, a.seed),
+    "qstat-f-job": lambda a: torque_job_detail(job_number(0), a.seed),
+    "tracejob": lambda a: torque_trace(job_number(0), a.events, a.seed),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("output", choices=list(GENERATORS.keys()))
+    parser.add_argument("--jobs", type=int, default=100)
+    parser.add_argument("--tasks", type=int, default=64)
+    parser.add_argument("--hosts", type=int, default=4)
+    parser.add_argument("--events", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(GENERATORS[args.output](args), end="")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,119 +1,183 @@
 from app.adapters.programpathrepository import factory
+from app.internal.settings import Settings
 from app.models.program import Program
-from unittest.mock import MagicMock
+from tests.utils.conftest import rooted_rules
+import json
+import os
 import pytest
 
-KB_TO_GB = 1048576
-B_TO_GB = 1073741824
+NEWAVE_FILES = [
+    "converteexph29",
+    "ConverteNomesArquivos",
+    "gerenciamento_PLs29",
+    "newave29_L",
+    "newdesp29_L",
+    "nwlistcf29_L",
+    "nwlistop29_L",
+    "mpi_newave29.job",
+]
+DECOMP_FILES = [
+    "convertenomesdecomp_31.21",
+    "decomp_31.21",
+    "decomp.lic",
+    "mpi_decomp31.21.job",
+]
+TUBER_JOBS = "/home/pem/rotinas/hpc-model-utils/jobs"
+DESSEM_JOBS = "/home/ESTUDO/PEM/git/hpc-model-utils/jobs"
+
+
+def make_tree(root, repo, monkeypatch):
+    monkeypatch.setattr(repo, "RULES", rooted_rules(repo, root))
+    for path, files in [
+        (root / "NEWAVE" / "v29", NEWAVE_FILES),
+        (root / "DECOMP" / "v31.21", DECOMP_FILES),
+    ]:
+        path.mkdir(parents=True)
+        for f in files:
+            (path / f).write_text("")
+    # Files in the roots are not versions
+    (root / "NEWAVE" / "README").write_text("")
+    # Nor, for TUBER, the directories without the v prefix
+    (root / "NEWAVE" / "old").mkdir()
 
 
 @pytest.mark.asyncio
-async def test_pemaws_list_programs(mocker):
+async def test_pemaws_list_programs(tmp_path, monkeypatch):
     repo = factory("PEMAWS")
-    mock = MagicMock(return_value=True)
-    mocker.patch("os.path.isdir", side_effect=mock)
-
-    def mock_listdir(path):
-        if path == repo.NEWAVE_PATH:
-            return ["v29"]
-        elif path == repo.NEWAVE_PATH.joinpath("v29"):
-            return [
-                "converteexph29",
-                "ConverteNomesArquivos",
-                "gerenciamento_PLs29",
-                "newave29_L",
-                "newdesp29_L",
-                "nwlistcf29_L",
-                "nwlistop29_L",
-                "mpi_newave29.job",
-            ]
-        elif path == repo.DECOMP_PATH:
-            return ["v31.21"]
-        elif path == repo.DECOMP_PATH.joinpath("v31.21"):
-            return [
-                "convertenomesdecomp_31.21",
-                "decomp_31.21",
-                "decomp.lic",
-                "mpi_decomp31.21.job",
-            ]
-
-    mocker.patch("os.listdir", side_effect=mock_listdir)
+    make_tree(tmp_path, repo, monkeypatch)
+    # The job file must be a regular file
+    (tmp_path / "NEWAVE" / "v30" / "mpi_newave30.job").mkdir(parents=True)
     r = await repo.list_programs()
     assert r == [
         Program(
-            programId="NW0",
+            programId="NW-v29",
             name="NEWAVE",
             clusterId="0",
             version="v29",
-            installationDirectory="/home/pem/versoes/NEWAVE/v29",
+            installationDirectory=str(tmp_path / "NEWAVE" / "v29"),
             isManaged=True,
-            executablePath="/home/pem/versoes/NEWAVE/v29/mpi_newave29.job",
+            executablePath=str(tmp_path / "NEWAVE/v29/mpi_newave29.job"),
             args=["N_PROC"],
         ),
         Program(
-            programId="DC0",
+            programId="DC-v31.21",
             name="DECOMP",
             clusterId="0",
             version="v31.21",
-            installationDirectory="/home/pem/versoes/DECOMP/v31.21",
+            installationDirectory=str(tmp_path / "DECOMP" / "v31.21"),
             isManaged=True,
-            executablePath="/home/pem/versoes/DECOMP/v31.21/mpi_decomp31.21.job",
+            executablePath=str(tmp_path / "DECOMP/v31.21/mpi_decomp31.21.job"),
             args=["N_PROC"],
         ),
     ]
 
 
 @pytest.mark.asyncio
-async def test_tuber_list_programs(mocker):
+async def test_pemaws_list_programs_not_found(tmp_path, monkeypatch):
+    repo = factory("PEMAWS")
+    monkeypatch.setattr(repo, "RULES", rooted_rules(repo, tmp_path))
+    r = await repo.list_programs()
+    assert r.code == 500
+
+
+@pytest.mark.asyncio
+async def test_tuber_list_programs(tmp_path, monkeypatch):
     repo = factory("TUBER")
-    mock = MagicMock(return_value=True)
-    mocker.patch("os.path.isdir", side_effect=mock)
-
-    def mock_listdir(path):
-        if path == repo.NEWAVE_PATH:
-            return ["v29"]
-        elif path == repo.NEWAVE_PATH.joinpath("v29"):
-            return [
-                "converteexph29",
-                "ConverteNomesArquivos",
-                "gerenciamento_PLs29",
-                "newave29_L",
-                "newdesp29_L",
-                "nwlistcf29_L",
-                "nwlistop29_L",
-                "mpi_newave29.job",
-            ]
-        elif path == repo.DECOMP_PATH:
-            return ["v31.21"]
-        elif path == repo.DECOMP_PATH.joinpath("v31.21"):
-            return [
-                "convertenomesdecomp_31.21",
-                "decomp_31.21",
-                "decomp.lic",
-                "mpi_decomp31.21.job",
-            ]
-
-    mocker.patch("os.listdir", side_effect=mock_listdir)
+    make_tree(tmp_path, repo, monkeypatch)
+    (tmp_path / "dessem").mkdir()
+    (tmp_path / "dessem" / "dessem_19.0.24").write_text("")
+    (tmp_path / "dessem" / "libs").mkdir()
     r = await repo.list_programs()
     assert r == [
         Program(
-            programId="NW0",
+            programId="NW-v29",
             name="NEWAVE",
             clusterId="0",
             version="v29",
-            installationDirectory="/home/pem/versoes/NEWAVE/v29",
+            installationDirectory=str(tmp_path / "NEWAVE" / "v29"),
             isManaged=True,
-            executablePath=repo.NEWAVE_TUBER_JOB + " " + "29",
+            executablePath=f"{TUBER_JOBS}/mpi_newave.job 29",
             args=["N_PROC"],
         ),
         Program(
-            programId="DC0",
+            programId="DC-v31.21",
             name="DECOMP",
             clusterId="0",
             version="v31.21",
-            installationDirectory="/home/pem/versoes/DECOMP/v31.21",
+            installationDirectory=str(tmp_path / "DECOMP" / "v31.21"),
             isManaged=True,
-            executablePath=repo.DECOMP_TUBER_JOB + " " + "31.21",
+            executablePath=f"{TUBER_JOBS}/mpi_decomp.job 31.21",
             args=["N_PROC"],
         ),
+        Program(
+            programId="DS-19.0.24",
+            name="DESSEM",
+            clusterId="0",
+            version="19.0.24",
+            installationDirectory=str(tmp_path / "dessem" / "dessem_19.0.24"),
+            isManaged=True,
+            executablePath=f"{DESSEM_JOBS}/dessem.sh 19.0.24",
+            args=[],
+        ),
     ]
+
+
+@pytest.mark.asyncio
+async def test_tuber_list_programs_filters(tmp_path, monkeypatch):
+    repo = factory("TUBER")
+    make_tree(tmp_path, repo, monkeypatch)
+    (tmp_path / "dessem").mkdir()
+    (tmp_path / "dessem" / "dessem_19.0.24").write_text("")
+    scanned = []
+    scandir = os.scandir
+
+    def counting_scandir(path):
+        scanned.append(str(path))
+        return scandir(path)
+
+    monkeypatch.setattr(os, "scandir", counting_scandir)
+    r = await repo.list_programs(name="DESSEM")
+    assert [p.programId for p in r] == ["DS-19.0.24"]
+    assert scanned == [str(tmp_path / "dessem")]
+    # A version is looked up directly, without listing the roots
+    scanned.clear()
+    r = await repo.list_programs(version="v31.21")
+    assert [p.programId for p in r] == ["DC-v31.21"]
+    r = await repo.list_programs(name="DESSEM", version="19.0.24")
+    assert [p.programId for p in r] == ["DS-19.0.24"]
+    r = await repo.list_programs(name="NEWAVE", version="../DECOMP/v31.21")
+    assert r == []
+    assert scanned == []
+
+
+@pytest.mark.asyncio
+async def test_pemaws_list_programs_filters(tmp_path, monkeypatch):
+    repo = factory("PEMAWS")
+    make_tree(tmp_path, repo, monkeypatch)
+    r = await repo.list_programs(name="NEWAVE", version="v29")
+    assert [p.programId for p in r] == ["NW-v29"]
+    assert (await repo.list_programs(version="v30")) == []
+    repo.rules()[1].root = tmp_path / "missing"
+    assert len(await repo.list_programs(name="NEWAVE")) == 1
+    assert (await repo.list_programs(version="v29")).code == 500
+
+
+@pytest.mark.asyncio
+async def test_rules_list_programs(tmp_path, monkeypatch):
+    pemaws = factory("PEMAWS")
+    make_tree(tmp_path, pemaws, monkeypatch)
+    rules = json.loads(open("rules/pemaws.json").read())
+    for spec in rules["programs"]:
+        spec["root"] = str(tmp_path / spec["name"])
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(rules))
+    repo = factory("RULES")
+    monkeypatch.setattr(repo, "RULES", None)
+    monkeypatch.setattr(Settings, "program_rules", str(path))
+    assert (await repo.list_programs()) == (await pemaws.list_programs())
+    assert repo.roots() == pemaws.roots()
+    r = await repo.list_programs(version="v31.21")
+    assert [p.programId for p in r] == ["DC-v31.21"]
+    assert (await repo.list_programs(name="DESSEM")) == []
+    repo.rules()[1].root = tmp_path / "missing"
+    assert (await repo.list_programs()).code == 500
@@ -1,6 +1,10 @@
 from app.adapters.schedulerrepository import factory
+from app.internal.httpresponse import HTTPResponse
+from benchmarks import scheduleroutput
 from app.models.job import Job
+from app.models.jobarray import JobArray
 from app.models.jobstatus import JobStatus
+from app.models.workflow import Workflow, WorkflowStage
 from tests.mocks.scheduler.torque import (
     MockTORQUEListJobs,
     MockTORQUEGetJobRunning,
@@ -14,9 +18,14 @@ from tests.mocks.scheduler.sge import (
     MockSGEGetJobDone,
     MockSGEDeleteJob,
     MockSGESubmitJob,
+    MockSGESubmitJobArray,
 )
 from unittest.mock import AsyncMock
+from pathlib import Path
 from datetime import datetime, timedelta
+import asyncio
+import contextlib
+import os
 import pytest
 
 KB_TO_GB = 1048576
@@ -200,6 +209,38 @@ async def test_torque_list_jobs(mocker):
     assert r[0].resourceUsage.maxTotalMemory == maxMem
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "method,output,size,args",
+    [
+        ("list_jobs", MockTORQUEListJobs, 3, "nodes=3:ppn=32 -q gpo"),
+        ("get_job", MockTORQUEGetJobRunning, 1, "nodes=1:ppn=32 -q gmc"),
+    ],
+)
+async def test_torque_queued_jobs(mocker, method, output, size, args):
+    # Jobs still in the queue have no start_time after the submit_args
+    lines = [
+        line.replace("job_state = R", "job_state = Q")
+        for line in output
+        if "start_time =" not in line
+    ]
+    repo = factory("TORQUE")
+    mock = AsyncMock(return_value=(0, "".join(lines)))
+    mocker.patch(
+        "app.adapters.schedulerrepository.run_terminal_retry", side_effect=mock
+    )
+    if method == "list_jobs":
+        jobs = await repo.list_jobs()
+    else:
+        jobs = [await repo.get_job("87849")]
+    assert len(jobs) == size
+    for job in jobs:
+        assert job.status == JobStatus.START_REQUESTED
+        assert job.startTime is None
+        assert job.scriptFile.endswith(".job")
+    assert jobs[0].args == ["-l", *args.split(" ")]
+
+
 @pytest.mark.asyncio
 async def test_torque_get_running_job(mocker):
     repo = factory("TORQUE")
@@ -315,3 +356,328 @@ async def test_torque_stop_job(mocker):
     mock.assert_called_once()
     assert isinstance(r, Job)
     assert r.jobId == jobId
+
+
+@pytest.mark.asyncio
+async def test_sge_submit_job_limits(mocker):
+    repo = factory("SGE")
+    mock = AsyncMock(return_value=(0, "".join(MockSGESubmitJob)))
+    mocker.patch(
+        "app.adapters.schedulerrepository.run_terminal_retry", side_effect=mock
+    )
+    await repo.submit_job(
+        Job(
+            jobId=None,
+            name="NEWAVE-v28.16.4_micropen",
+            status=JobStatus.START_REQUESTED,
+            startTime=None,
+            lastStatusUpdateTime=None,
+            endTime=None,
+            reservedSlots=16,
+            scriptFile="test.job",
+            workingDirectory="/home",
+            clusterId="1",
+            args=[],
+            resourceUsage=None,
+            walltime=3600,
+            priority=-10,
+        )
+    )
+    command = mock.call_args[0][0]
+    assert command[-5:] == ["-l", "h_rt=3600", "-p", "-10", "test.job"]
+    mock.reset_mock()
+    r = await repo.submit_job(
+        Job(
+            jobId=None,
+            name="NEWAVE-v28.16.4_micropen",
+            status=JobStatus.START_REQUESTED,
+            startTime=None,
+            lastStatusUpdateTime=None,
+            endTime=None,
+            reservedSlots=16,
+            scriptFile="test.job",
+            workingDirectory="/home",
+            clusterId="1",
+            args=[],
+            resourceUsage=None,
+            priority=10,
+        )
+    )
+    assert r.code == 400
+    mock.assert_not_called()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("kind", ["SGE", "TORQUE"])
+async def test_submit_job_invalid_dependency(mocker, kind):
+    repo = factory(kind)
+    mock = AsyncMock(return_value=(0, ""))
+    mocker.patch(
+        "app.adapters.schedulerrepository.run_terminal_retry", side_effect=mock
+    )
+    r = await repo.submit_job(
+        Job(
+            jobId=None,
+            name="NEWAVE-v28.16.4_micropen",
+            status=JobStatus.START_REQUESTED,
+            startTime=None,
+            lastStatusUpdateTime=None,
+            endTime=None,
+            reservedSlots=16,
+            scriptFile="test.job",
+            workingDirectory="/home",
+            clusterId="1",
+            args=[],
+            resourceUsage=None,
+            dependencies=["1480", "1;rm -rf ~"],
+        )
+    )
+    assert r.code == 400
+    mock.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_sge_submit_job_array(mocker, tmp_path):
+    repo = factory("SGE")
+    mock = AsyncMock(return_value=(0, "".join(MockSGESubmitJobArray)))
+    mocker.patch(
+        "app.adapters.schedulerrepository.run_terminal_retry", side_effect=mock
+    )
+    template = Job(
+        jobId=None,
+        name="NEWAVE-v28.16.4_micropen",
+        status=None,
+        startTime=None,
+        lastStatusUpdateTime=None,
+        endTime=None,
+        reservedSlots=16,
+        scriptFile="test.job",
+        workingDirectory=str(tmp_path),
+        clusterId="1",
+        args=[],
+        resourceUsage=None,
+    )
+    directories = [str(tmp_path / d) for d in ["a", "b", "c"]]
+    r = await repo.submit_job_array(
+        JobArray(template=template, workingDirectories=directories)
+    )
+    assert r.code == 400
+    mock.assert_not_called()
+    for d in directories:
+        os.mkdir(d)
+    r = await repo.submit_job_array(
+        JobArray(template=template, workingDirectories=directories)
+    )
+    mock.assert_called_once()
+    command = mock.call_args[0][0]
+    assert command[-3:-1] == ["-t", "1-3"]
+    assert command[-1].startswith(
+        str(tmp_path / "NEWAVE-v28.16.4_micropen.array.")
+    )
+    tasks = command[-1][: -len(".sh")] + ".tasks"
+    lines = open(tasks).read().splitlines()
+    assert lines[1] == f"cd {directories[1]} && test.job"
+    assert r.arrayId == "1489"
+    assert r.tasks == 3
+    assert r.status == {"START_REQUESTED": "1-3"}
+    # Another array with the same name keeps the tasks of the first
+    await repo.submit_job_array(
+        JobArray(template=template, workingDirectories=directories[:1])
+    )
+    assert mock.call_args[0][0][-1] != command[-1]
+    assert len(open(tasks).read().splitlines()) == 3
+    # A line break would split the command of a task in two lines
+    mock.reset_mock()
+    r = await repo.submit_job_array(
+        JobArray(
+            template=template,
+            workingDirectories=directories[:2],
+            args=[["a"], ["b\nrm -rf ~"]],
+        )
+    )
+    assert r.code == 400
+    mock.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_torque_submit_job_array(mocker, tmp_path):
+    repo = factory("TORQUE")
+    mock = AsyncMock(return_value=(0, "90170[].prd-cluster-01.ons.org.br\n"))
+    mocker.patch(
+        "app.adapters.schedulerrepository.run_terminal_retry", side_effect=mock
+    )
+    template = Job(
+        jobId=None,
+        name="NEWAVE-v28.16.4_micropen",
+        status=None,
+        startTime=None,
+        lastStatusUpdateTime=None,
+        endTime=None,
+        reservedSlots=16,
+        scriptFile="test.job",
+        workingDirectory=str(tmp_path),
+        clusterId="1",
+        args=[],
+        resourceUsage=None,
+    )
+    r = await repo.submit_job_array(
+        JobArray(template=template, args=[["1"], ["2"]])
+    )
+    command = mock.call_args[0][0]
+    assert command[1:3] == ["-t", "1-2"]
+    assert r.arrayId == "90170"
+    assert r.tasks == 2
+
+
+@pytest.mark.asyncio
+async def test_sge_submit_workflow(mocker):
+    repo = factory("SGE")
+    mock = AsyncMock(return_value=(0, "".join(MockSGESubmitJob)))
+    mocker.patch(
+        "app.adapters.schedulerrepository.run_terminal_retry", side_effect=mock
+    )
+
+    def stage(name, after=None):
+        job = Job(
+            jobId=None,
+            name=name,
+            status=None,
+            startTime=None,
+            lastStatusUpdateTime=None,
+            endTime=None,
+            reservedSlots=16,
+            scriptFile="test.job",
+            workingDirectory="/home",
+            clusterId="1",
+            args=[],
+            resourceUsage=None,
+        )
+        return WorkflowStage(name=name, job=job, after=after)
+
+    r = await repo.submit_workflow(
+        Workflow(stages=[stage("decomp", ["newave"]), stage("newave")])
+    )
+    assert r.jobs == {"newave": "1488", "decomp": "1488"}
+    first, second = [c[0][0] for c in mock.call_args_list]
+    assert "-hold_jid" not in first
+    assert second[-3:] == ["-hold_jid", "1488", "test.job"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "kind,method,output,size",
+    [
+        ("SGE", "list_jobs", scheduleroutput.sge_list_jobs(50), 50),
+        ("SGE", "get_job", scheduleroutput.sge_job_detail(1000, 256), 256),
+        (
+            "SGE",
+            "get_finished_job",
+            scheduleroutput.sge_accounting(1000, 4),
+            128,
+        ),
+        ("TORQUE", "list_jobs", scheduleroutput.torque_list_jobs(50), 50),
+        ("TORQUE", "get_job", scheduleroutput.torque_job_detail(1000), None),
+        (
+            "TORQUE",
+            "get_finished_job",
+            scheduleroutput.torque_trace(1000, 20),
+            0,
+        ),
+    ],
+)
+async def test_parse_synthetic_outputs(mocker, kind, method, output, size):
+    repo = factory(kind)
+    mock = AsyncMock(return_value=(0, output))
+    mocker.patch(
+        "app.adapters.schedulerrepository.run_terminal_retry", side_effect=mock
+    )
+    if method == "list_jobs":
+        assert len(await repo.list_jobs()) == size
+        return
+    r = await getattr(repo, method)("1000")
+    assert isinstance(r, Job)
+    assert r.jobId == "1000"
+    if size is not None:
+        assert r.reservedSlots == size
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("kind", ["SGE", "TORQUE"])
+@pytest.mark.parametrize(
+    "method,output",
+    [
+        ("list_jobs", MockSGEListJobs),
+        ("get_job", MockSGEGetJobRunning),
+        ("get_finished_job", MockSGEGetJobDone),
+    ],
+)
+async def test_parse_and_model_spans(mocker, kind, method, output):
+    if kind == "TORQUE":
+        output = {
+            "list_jobs": MockTORQUEListJobs,
+            "get_job": MockTORQUEGetJobRunning,
+            "get_finished_job": MockTORQUEGetJobDone,
+        }[method]
+    repo = factory(kind)
+    mock = AsyncMock(return_value=(0, "".join(output)))
+    mocker.patch(
+        "app.adapters.schedulerrepository.run_terminal_retry", side_effect=mock
+    )
+    events = []
+
+    @contextlib.contextmanager
+    def recording_span(name):
+        events.append(f"enter {name}")
+        yield
+        events.append(f"exit {name}")
+
+    mocker.patch("app.adapters.schedulerrepository.span", recording_span)
+    args = [] if method == "list_jobs" else ["1000"]
+    await getattr(repo, method)(*args)
+    # The models are built after the parsing, not timed inside of it
+    assert events == ["enter parse", "exit parse", "enter model", "exit model"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("kind", ["SGE", "TORQUE"])
+async def test_fake_scheduler_lifecycle(monkeypatch, tmp_path, kind):
+    commands = Path(__file__).parents[2] / "benchmarks" / "bin"
+    monkeypatch.setenv("PATH", f"{commands}:{os.environ['PATH']}")
+    monkeypatch.setenv("FAKE_SCHEDULER", kind)
+    monkeypatch.setenv("FAKE_SCHEDULER_STATE", str(tmp_path / "state.json"))
+    monkeypatch.setenv("FAKE_SCHEDULER_QUEUE_TIME", "0")
+    monkeypatch.setenv("FAKE_SCHEDULER_RUN_TIME", "1")
+    (tmp_path / "test.job").write_text("")
+    repo = factory(kind)
+    job = await repo.submit_job(
+        Job(
+            jobId=None,
+            name="NEWAVE",
+            status=JobStatus.START_REQUESTED,
+            startTime=None,
+            lastStatusUpdateTime=None,
+            endTime=None,
+            reservedSlots=16,
+            scriptFile="test.job",
+            workingDirectory=str(tmp_path),
+            clusterId="1",
+            args=["28.16.4"],
+            resourceUsage=None,
+        )
+    )
+    assert isinstance(job, Job)
+    jobs = await repo.list_jobs()
+    assert [j.jobId for j in jobs] == [job.jobId]
+    assert jobs[0].status == JobStatus.RUNNING
+    running = await repo.get_job(job.jobId)
+    assert isinstance(running, Job)
+    assert running.reservedSlots == 16
+    await asyncio.sleep(1.0)
+    assert await repo.list_jobs() == []
+    finished = await repo.get_finished_job(job.jobId)
+    assert isinstance(finished, Job)
+    assert finished.status == JobStatus.STOPPED
+    monkeypatch.setenv("FAKE_SCHEDULER_FAILURE_RATE", "1")
+    r = await repo.list_jobs()
+    assert isinstance(r, HTTPResponse)
+    assert r.code == 500
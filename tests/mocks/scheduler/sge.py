@@ -1016,4 +1016,8 @@ MockSGESubmitJob = [
     "Your job 1488 (NEWAVE-v28.16.4_micropen) has been submitted\n"
 ]
 
+MockSGESubmitJobArray = [
+    'Your job-array 1489.1-3:1 ("NEWAVE-v28.16.4_micropen") has been submitted\n'
+]
+
 MockSGEDeleteJob = ["Job 1488 registered for deletion\n"]
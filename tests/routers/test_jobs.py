@@ -1,7 +1,16 @@
+from app.app import make_app
+from app.internal.settings import Settings
+from app.internal.timing import SPANS, span
 from app.routers.jobs import router
+from app.utils.taskscheduler import TaskScheduler
 from fastapi.testclient import TestClient
 from fastapi import HTTPException
+from tests.mocks.scheduler.sge import MockSGEGetJobDone, MockSGEListJobs
+from unittest.mock import AsyncMock
+import json
+import logging
 import pytest
+import time
 
 client = TestClient(router)
 
@@ -78,3 +87,176 @@ def test_stop_job():
     assert response.status_code == 202
     res = response.json()
     assert res["detail"] == "jobId: 3"
+
+
+def test_get_job_output():
+    response = client.get("/jobs/1/output?tail=10")
+    assert response.status_code == 200
+    res = response.json()
+    assert res["jobId"] == "1"
+    assert res["offset"] == 0
+    assert res["size"] == 6
+    assert res["content"] == "teste\n"
+
+
+def test_post_job_array():
+    template = {
+        "jobId": None,
+        "status": None,
+        "name": "teste",
+        "startTime": None,
+        "lastStatusUpdateTime": None,
+        "endTime": None,
+        "clusterId": "0",
+        "workingDirectory": "/tmp",
+        "reservedSlots": 64,
+        "scriptFile": "/tmp/job.sh",
+        "args": None,
+        "resourceUsage": None,
+    }
+    response = client.post(
+        "/jobs/arrays",
+        json={
+            "template": template,
+            "workingDirectories": ["/tmp/1", "/tmp/2", "/tmp/3"],
+        },
+    )
+    assert response.status_code == 201
+    assert response.json() == {"arrayId": "4", "tasks": 3}
+
+
+def test_get_job_array():
+    response = client.get("/jobs/arrays/4")
+    assert response.status_code == 200
+    res = response.json()
+    assert res["tasks"] == 10
+    assert res["status"] == {"RUNNING": "1-3,5", "START_REQUESTED": "4,6-10"}
+
+
+def test_post_workflow():
+    def stage(name, after):
+        return {
+            "name": name,
+            "after": after,
+            "job": {
+                "clusterId": "0",
+                "workingDirectory": f"/tmp/{name}",
+                "reservedSlots": 64,
+                "scriptFile": "/tmp/job.sh",
+            },
+        }
+
+    response = client.post(
+        "/jobs/workflows",
+        json={"stages": [stage("newave", None), stage("decomp", ["newave"])]},
+    )
+    assert response.status_code == 201
+    assert response.json() == {"jobs": {"newave": "3", "decomp": "3"}}
+    with pytest.raises(HTTPException):
+        response = client.post(
+            "/jobs/workflows", json={"stages": [stage("decomp", ["newave"])]}
+        )
+        assert response.status_code == 400
+
+
+def test_post_job_by_program():
+    job = {
+        "clusterId": "0",
+        "workingDirectory": "/tmp",
+        "reservedSlots": 64,
+        "programId": "NW-29",
+    }
+    response = client.post("/jobs/", json=job)
+    assert response.status_code == 201
+    assert response.json() == {"jobId": "3"}
+    with pytest.raises(HTTPException):
+        response = client.post("/jobs/", json={**job, "programId": "NW-9"})
+        assert response.status_code == 404
+
+
+def test_get_job_server_timing(mocker, monkeypatch, caplog):
+    monkeypatch.setattr(Settings, "scheduler", "SGE")
+    mock = AsyncMock(
+        side_effect=[
+            (0, "".join(MockSGEListJobs)),
+            (0, "".join(MockSGEGetJobDone)),
+        ]
+    )
+    mocker.patch(
+        "app.adapters.schedulerrepository.run_terminal_retry", side_effect=mock
+    )
+    caplog.set_level(logging.INFO, logger="uvicorn.timing")
+    response = TestClient(make_app(root_path="")).get("/jobs/9999")
+    assert response.status_code == 200
+    metrics = [
+        m.split(";")[0] for m in response.headers["Server-Timing"].split(", ")
+    ]
+    assert metrics == [
+        "parse",
+        "model",
+        "list_jobs",
+        "get_finished_job",
+        "total",
+    ]
+    assert "model;dur=" in response.headers["Server-Timing"]
+    durations = [
+        float(m.split(";")[1][len("dur=") :])
+        for m in response.headers["Server-Timing"].split(", ")
+    ]
+    # The phases are not counted twice, up to the rounding of each one
+    assert sum(durations[:-1]) <= durations[-1] + 0.05 * len(durations)
+    line = json.loads(caplog.records[-1].getMessage())
+    assert line["route"] == "/jobs/{jobId}"
+    assert line["spans"]["model"]["count"] == 2
+    assert line["spans"]["parse"]["count"] == 2
+
+
+def test_nested_spans_counted_once():
+    spans = {}
+    token = SPANS.set(spans)
+    try:
+        with span("list_jobs"):
+            with span("qstat"):
+                time.sleep(0.05)
+    finally:
+        SPANS.reset(token)
+    # The time of qstat is not counted again in list_jobs
+    assert spans["qstat"][0] >= 0.05
+    assert spans["list_jobs"][0] < 0.05
+
+
+def test_get_job_finished_after_listed(mocker, monkeypatch):
+    monkeypatch.setattr(Settings, "scheduler", "SGE")
+    mock = AsyncMock(
+        side_effect=[
+            (0, "".join(MockSGEListJobs)),
+            (-1, ""),
+            (0, "".join(MockSGEGetJobDone)),
+        ]
+    )
+    mocker.patch(
+        "app.adapters.schedulerrepository.run_terminal_retry", side_effect=mock
+    )
+    response = TestClient(make_app(root_path="")).get("/jobs/1481")
+    assert response.status_code == 200
+    assert response.json()["status"] == "STOPPED"
+    assert mock.call_args_list[-1].args[0] == ["qacct -j 1481"]
+
+
+def test_queues_rejected_with_agents(monkeypatch):
+    monkeypatch.setattr(Settings, "scheduler", "INTERNAL")
+    monkeypatch.setattr(Settings, "agents", "unix:/tmp/agent.sock")
+    monkeypatch.setattr(Settings, "queues", "newave:8")
+    with pytest.raises(ValueError):
+        with TestClient(make_app(root_path="")):
+            pass
+
+
+@pytest.mark.parametrize("queues", ["newave:x", "newave:-1", "newave"])
+def test_invalid_queues_rejected_at_startup(monkeypatch, queues):
+    monkeypatch.setattr(Settings, "scheduler", "INTERNAL")
+    monkeypatch.setattr(Settings, "queues", queues)
+    monkeypatch.setattr(TaskScheduler, "QUEUES", None)
+    with pytest.raises(ValueError, match="INTERNAL_SCHEDULER_QUEUES"):
+        with TestClient(make_app(root_path="")):
+            pass
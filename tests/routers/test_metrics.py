@@ -0,0 +1,62 @@
+from app.app import make_app
+from app.internal.metrics import Histogram
+from app.internal.terminal import run_terminal
+from app.internal.settings import Settings
+from fastapi.testclient import TestClient
+import pytest
+
+client = TestClient(make_app(root_path=""))
+
+
+def test_histogram():
+    h = Histogram("latency_seconds", "Latency", ("route",), [0.1, 1.0])
+    h.observe(0.05, "/jobs")
+    h.observe(0.5, "/jobs")
+    h.observe(5.0, "/jobs")
+    assert h.count("/jobs") == 3
+    assert h.samples() == [
+        'latency_seconds_bucket{route="/jobs",le="0.1"} 1',
+        'latency_seconds_bucket{route="/jobs",le="1"} 2',
+        'latency_seconds_bucket{route="/jobs",le="+Inf"} 3',
+        'latency_seconds_sum{route="/jobs"} 5.55',
+        'latency_seconds_count{route="/jobs"} 3',
+    ]
+
+
+def test_get_metrics():
+    client.get("/programs/NW-29")
+    response = client.get("/metrics/")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert (
+        'http_request_duration_seconds_count{method="GET",'
+        + 'route="/programs/{programId}",status="200"} 1'
+    ) in response.text
+    assert 'program_catalog_requests_total{result="miss"}' in response.text
+
+
+def test_get_internal_metrics(monkeypatch):
+    monkeypatch.setattr(Settings, "scheduler", "INTERNAL")
+    response = client.get("/metrics/")
+    assert 'internal_scheduler_slots{state="total"}' in response.text
+    assert (
+        'internal_scheduler_utilization{resource="slots",window="average"}'
+        in response.text
+    )
+    assert "internal_scheduler_queued_jobs 0" in response.text
+    assert 'internal_queue_jobs{queue="default",state="queued"}' in (
+        response.text
+    )
+
+
+@pytest.mark.asyncio
+async def test_command_metrics():
+    await run_terminal(["echo", "qstat"])
+    response = client.get("/metrics/")
+    assert (
+        'scheduler_command_duration_seconds_count{command="other",'
+        + 'outcome="ok"}'
+    ) in response.text
+    assert "scheduler_command_subprocesses 0" in response.text
+    # Commands that succeed without output, as the qdel of Torque
+    assert await run_terminal(["true"]) == (0, "")
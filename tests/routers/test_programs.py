@@ -1,5 +1,7 @@
 from app.routers.programs import router
 from fastapi.testclient import TestClient
+from fastapi import HTTPException
+import pytest
 
 client = TestClient(router)
 
@@ -8,3 +10,42 @@ def test_get_programs():
     response = client.get("/programs/")
     assert response.status_code == 200
     assert len(response.json()) == 2
+
+
+def test_get_programs_not_modified():
+    response = client.get("/programs/")
+    etag = response.headers["ETag"]
+    response = client.get("/programs/?name=NEWAVE")
+    assert response.headers["ETag"] != etag
+    assert len(response.json()) == 1
+    response = client.get(
+        "/programs/?name=NEWAVE",
+        headers={"If-None-Match": response.headers["ETag"]},
+    )
+    assert response.status_code == 304
+    response = client.get("/programs/", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+
+def test_rescan_programs():
+    etag = client.get("/programs/").headers["ETag"]
+    response = client.post("/programs/rescan")
+    assert response.status_code == 200
+    assert response.json() == {"version": etag.strip('"'), "programs": 2}
+
+
+def test_get_program():
+    response = client.get("/programs/NW-29")
+    assert response.status_code == 200
+    assert response.json()["name"] == "NEWAVE"
+    with pytest.raises(HTTPException):
+        response = client.get("/programs/NW-0")
+        assert response.status_code == 404
+
+
+def test_get_latest_programs():
+    response = client.get("/programs/?version=latest")
+    assert [p["programId"] for p in response.json()] == ["NW-29", "DC-29"]
+    response = client.get("/programs/?name=NEWAVE&minVersion=30")
+    assert response.json() == []
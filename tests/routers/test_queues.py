@@ -0,0 +1,27 @@
+from app.routers.queues import router
+from fastapi.testclient import TestClient
+from fastapi import HTTPException
+import pytest
+
+client = TestClient(router)
+
+
+def test_get_queues():
+    response = client.get("/queues/")
+    assert response.status_code == 200
+    queues = response.json()
+    assert len(queues) == 1
+    assert queues[0]["name"] == "default"
+    assert queues[0]["queuedJobs"] == 1
+
+
+def test_get_queue():
+    response = client.get("/queues/default")
+    assert response.status_code == 200
+    assert response.json()["slots"] == 64
+
+
+def test_get_queue_not_found():
+    with pytest.raises(HTTPException):
+        response = client.get("/queues/missing")
+        assert response.status_code == 404
@@ -0,0 +1,70 @@
+from app.utils.taskscheduler import TaskScheduler
+from app.utils.programrules import ProgramRule, compile_rules
+from app.internal.terminal import signal_process_group
+from app.models.job import Job
+from app.models.jobstatus import JobStatus
+import asyncio
+import signal
+from typing import List
+import pytest
+
+
+def make_job(workingDirectory: str, scriptFile: str, slots: int = 4) -> Job:
+    return Job(
+        jobId=None,
+        status=None,
+        name="teste",
+        startTime=None,
+        lastStatusUpdateTime=None,
+        endTime=None,
+        clusterId="0",
+        workingDirectory=workingDirectory,
+        reservedSlots=slots,
+        scriptFile=scriptFile,
+        args=None,
+        resourceUsage=None,
+    )
+
+
+def rooted_rules(repo, root) -> List[ProgramRule]:
+    # The bundled rules, with each program root moved under root
+    rules = compile_rules(str(repo.RULES_FILE))
+    for r in rules:
+        r.root = root / r.root.name
+    return rules
+
+
+def make_script(path, content: str) -> str:
+    path.write_text("#!/bin/bash\n" + content)
+    path.chmod(0o755)
+    return str(path)
+
+
+async def wait_for_status(jobId: str, status: JobStatus, timeout=5.0):
+    for _ in range(int(timeout / 0.05)):
+        if TaskScheduler.jobs()[jobId].status == status:
+            return
+        await asyncio.sleep(0.05)
+    raise TimeoutError(f"job {jobId} did not reach {status}")
+
+
+@pytest.fixture
+def clean_scheduler(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(TaskScheduler, "MAX_SLOTS", 8)
+    monkeypatch.setattr(TaskScheduler, "MAX_MEMORY", 16.0)
+    monkeypatch.setattr(TaskScheduler, "REJECTED", 0)
+    TaskScheduler.TASKS.clear()
+    TaskScheduler.WAITING.clear()
+    TaskScheduler.PREEMPTED.clear()
+    TaskScheduler.SUBMISSIONS.clear()
+    TaskScheduler.ARRAYS.clear()
+    monkeypatch.setattr(TaskScheduler, "QUEUES", None)
+    TaskScheduler.JOBS.clear()
+    TaskScheduler.PROCESSES.clear()
+    TaskScheduler.STOP_LATENCIES.clear()
+    yield
+    for p in TaskScheduler.PROCESSES.values():
+        signal_process_group(p, signal.SIGKILL)
+    for t in TaskScheduler.TASKS.values():
+        t.cancel()
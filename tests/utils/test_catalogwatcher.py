@@ -0,0 +1,108 @@
+from app.adapters.programpathrepository import PEMAWSProgramPathRepository
+from app.utils.catalogwatcher import CatalogWatcher
+from app.utils.programcatalog import ProgramCatalog
+from tests.utils.conftest import rooted_rules
+import asyncio
+import shutil
+import pytest
+
+
+def install(root, version: str):
+    path = root / version
+    path.mkdir(parents=True)
+    (path / f"mpi_newave{version}.job").write_text("")
+
+
+def make_catalog(tmp_path) -> ProgramCatalog:
+    class LocalProgramPathRepository(PEMAWSProgramPathRepository):
+        RULES = rooted_rules(PEMAWSProgramPathRepository, tmp_path)
+
+    install(tmp_path / "NEWAVE", "v29")
+    (tmp_path / "DECOMP").mkdir()
+    return ProgramCatalog(LocalProgramPathRepository)
+
+
+async def wait_for_versions(catalog: ProgramCatalog, versions, timeout=5.0):
+    for _ in range(int(timeout / 0.05)):
+        programs = await catalog.list_programs()
+        if sorted([p.version for p in programs]) == versions:
+            return
+        await asyncio.sleep(0.05)
+    raise TimeoutError(f"catalog did not reach {versions}")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode", ["inotify", "poll"])
+async def test_watch_catalog(tmp_path, mode):
+    catalog = make_catalog(tmp_path)
+    watcher = CatalogWatcher(catalog, mode, pollInterval=0.1, debounce=0.3)
+    await watcher.start()
+    try:
+        assert (watcher._inotify is not None) == (mode == "inotify")
+        assert catalog.scans == 1
+        # Listing is a memory read, not even the mtimes are checked
+        await catalog.list_programs()
+        assert catalog.scans == 1
+        # A bulk install is listed again once
+        for i in range(30, 35):
+            install(tmp_path / "NEWAVE", f"v{i}")
+        await wait_for_versions(
+            catalog, ["v29", "v30", "v31", "v32", "v33", "v34"]
+        )
+        scans = catalog.scans
+        if mode == "inotify":
+            assert scans == 2
+        # Files of a version changed in place are seen too
+        (tmp_path / "NEWAVE" / "v30" / "mpi_newavev30.job").unlink()
+        await wait_for_versions(catalog, ["v29", "v31", "v32", "v33", "v34"])
+        # A version directory removed and created again is still watched
+        shutil.rmtree(tmp_path / "NEWAVE" / "v31")
+        await wait_for_versions(catalog, ["v29", "v32", "v33", "v34"])
+        install(tmp_path / "NEWAVE", "v31")
+        await wait_for_versions(catalog, ["v29", "v31", "v32", "v33", "v34"])
+        (tmp_path / "NEWAVE" / "v31" / "mpi_newavev31.job").unlink()
+        await wait_for_versions(catalog, ["v29", "v32", "v33", "v34"])
+        if mode == "inotify":
+            assert (
+                sorted(watcher._inotify.watches.values()).count(
+                    str(tmp_path / "NEWAVE" / "v31")
+                )
+                == 1
+            )
+    finally:
+        await watcher.close()
+    assert catalog.watcher is None
+
+
+@pytest.mark.asyncio
+async def test_watch_missing_root(tmp_path):
+    catalog = make_catalog(tmp_path)
+    (tmp_path / "DECOMP").rmdir()
+    watcher = CatalogWatcher(catalog, "inotify", pollInterval=0.1)
+    await watcher.start()
+    try:
+        assert watcher._inotify is None
+        assert watcher._poller is not None
+    finally:
+        await watcher.close()
+
+
+@pytest.mark.asyncio
+async def test_watch_removed_root(tmp_path):
+    catalog = make_catalog(tmp_path)
+    watcher = CatalogWatcher(
+        catalog, "inotify", pollInterval=0.1, debounce=0.1
+    )
+    await watcher.start()
+    try:
+        shutil.rmtree(tmp_path / "NEWAVE")
+        # The removed root can no longer be watched with inotify
+        for _ in range(100):
+            if watcher._inotify is None:
+                break
+            await asyncio.sleep(0.05)
+        assert watcher._poller is not None
+        install(tmp_path / "NEWAVE", "v30")
+        await wait_for_versions(catalog, ["v30"])
+    finally:
+        await watcher.close()
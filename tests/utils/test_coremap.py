@@ -0,0 +1,77 @@
+from app.utils.coremap import CoreMap, parse_cpulist
+from app.utils.taskscheduler import TaskScheduler
+from app.adapters.schedulerrepository import factory
+from app.models.jobstatus import JobStatus
+from app.internal.terminal import start_terminal
+from tests.utils.conftest import make_job, make_script, wait_for_status
+import os
+import pytest
+
+pytestmark = pytest.mark.usefixtures("clean_scheduler")
+
+
+def test_parse_cpulist():
+    assert parse_cpulist("0-3,8,10-11\n") == [0, 1, 2, 3, 8, 10, 11]
+    assert parse_cpulist("") == []
+
+
+def test_allocate_numa_local():
+    cores = CoreMap([list(range(0, 8)), list(range(8, 16))])
+    assert cores.allocate("1", 4) == [0, 1, 2, 3]
+    # The partially used node is filled first
+    assert cores.allocate("2", 2) == [4, 5]
+    assert cores.allocate("3", 6) == [8, 9, 10, 11, 12, 13]
+    cores.release("1")
+    assert cores.allocate("4", 3) == [0, 1, 2]
+    # Not contiguous, but still inside a single node
+    cores.release("2")
+    assert cores.allocate("5", 4) == [3, 4, 5, 6]
+    assert cores.free_cores() == [7, 14, 15]
+    # Spread over nodes when no single node fits
+    assert cores.allocate("6", 3) == [14, 15, 7]
+    assert cores.allocate("7", 1) is None
+    cores.release("3")
+    assert cores.free_cores() == list(range(8, 14))
+
+
+def test_from_sys(tmp_path):
+    allowed = sorted(os.sched_getaffinity(0))
+    node = tmp_path / "node0"
+    node.mkdir()
+    (node / "cpulist").write_text(f"{allowed[0]}-{allowed[-1]}\n")
+    (tmp_path / "possible").write_text("0\n")
+    cores = CoreMap.from_sys(str(tmp_path))
+    assert cores.nodes == [allowed]
+    cores = CoreMap.from_sys(str(tmp_path / "missing"))
+    assert cores.nodes == [allowed]
+
+
+@pytest.mark.asyncio
+async def test_job_pinned_to_cores(tmp_path, monkeypatch):
+    cpu = sorted(os.sched_getaffinity(0))[0]
+    monkeypatch.setattr(TaskScheduler, "CORES", CoreMap([[cpu]]))
+    repo = factory("INTERNAL")
+    script = make_script(
+        tmp_path / "job.sh", "grep Cpus_allowed_list /proc/self/status\n"
+    )
+    job = await repo.submit_job(make_job(str(tmp_path), script, 1))
+    await wait_for_status(job.jobId, JobStatus.STOPPED)
+    output = (tmp_path / f"teste.o{job.jobId}").read_text()
+    assert output.split()[-1] == str(cpu)
+    assert TaskScheduler.cores().free_cores() == [cpu]
+
+
+@pytest.mark.asyncio
+async def test_grandchild_pinned_before_start(tmp_path):
+    cpu = sorted(os.sched_getaffinity(0))[-1]
+    output = tmp_path / "out.txt"
+    # The grandchild is forked as soon as the shell starts
+    proc = await start_terminal(
+        [
+            "/bin/sh -c 'grep Cpus_allowed_list /proc/self/status & wait'",
+            f"> {output}",
+        ],
+        cpus=[cpu],
+    )
+    assert await proc.wait() == 0
+    assert output.read_text().split()[-1] == str(cpu)
@@ -0,0 +1,81 @@
+from app.models.jobarray import JobArray
+from app.utils.jobarray import (
+    array_size,
+    compact_ranges,
+    expand,
+    write_array_script,
+)
+from app.models.job import Job
+import os
+import subprocess
+
+
+def make_job(workingDirectory: str, scriptFile: str) -> Job:
+    return Job(
+        jobId=None,
+        status=None,
+        name="teste",
+        startTime=None,
+        lastStatusUpdateTime=None,
+        endTime=None,
+        clusterId="0",
+        workingDirectory=workingDirectory,
+        reservedSlots=1,
+        scriptFile=scriptFile,
+        args=None,
+        resourceUsage=None,
+    )
+
+
+def make_script(path, content: str) -> str:
+    path.write_text("#!/bin/bash\n" + content)
+    path.chmod(0o755)
+    return str(path)
+
+
+def test_compact_ranges():
+    assert compact_ranges([]) == ""
+    assert compact_ranges([3]) == "3"
+    assert compact_ranges([5, 1, 2, 3, 7, 8]) == "1-3,5,7-8"
+
+
+def test_expand(tmp_path):
+    template = make_job(str(tmp_path), "job.sh")
+    array = JobArray(
+        template=template,
+        workingDirectories=["/a", "/b"],
+        args=[["1"], ["2"]],
+    )
+    assert array_size(array) == 2
+    jobs = expand(array)
+    assert [(j.workingDirectory, j.args) for j in jobs] == [
+        ("/a", ["1"]),
+        ("/b", ["2"]),
+    ]
+    assert template.workingDirectory == str(tmp_path)
+    array.args = [["1"]]
+    assert array_size(array) is None
+    array.workingDirectories = None
+    array.args = None
+    assert array_size(array) is None
+
+
+def test_array_script(tmp_path):
+    script = make_script(tmp_path / "job.sh", 'echo "$PWD $1" > out.txt\n')
+    directories = []
+    for i in range(3):
+        (tmp_path / f"case {i}").mkdir()
+        directories.append(str(tmp_path / f"case {i}"))
+    array = JobArray(
+        template=make_job(str(tmp_path), script),
+        workingDirectories=directories,
+        args=[[f"arg {i}"] for i in range(3)],
+    )
+    wrapper = write_array_script(array, "teste.array")
+    for i, variable in [(1, "SGE_TASK_ID"), (3, "PBS_ARRAYID")]:
+        env = {**os.environ, variable: str(i)}
+        env.pop("SGE_TASK_ID" if i == 3 else "PBS_ARRAYID", None)
+        subprocess.run([wrapper], cwd=str(tmp_path), env=env, check=True)
+        content = (tmp_path / f"case {i - 1}" / "out.txt").read_text()
+        assert content.strip() == f"{directories[i - 1]} arg {i - 1}"
+    assert not (tmp_path / "case 1" / "out.txt").exists()
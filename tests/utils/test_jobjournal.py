@@ -0,0 +1,192 @@
+from app.utils.jobjournal import JobJournal
+from app.utils.taskscheduler import TaskScheduler
+from app.adapters.schedulerrepository import factory
+from app.internal.settings import Settings
+from app.internal.terminal import process_start_ticks
+from app.models.jobstatus import JobStatus
+from tests.utils.conftest import make_job, make_script, wait_for_status
+import sqlite3
+import subprocess
+import pytest
+
+pytestmark = pytest.mark.usefixtures("clean_scheduler")
+
+
+def test_journal_batches_records(tmp_path):
+    journal = JobJournal(str(tmp_path / "journal.db"))
+    job = make_job(str(tmp_path), "job.sh")
+    job.jobId = "1"
+    job.status = JobStatus.START_REQUESTED
+    journal.record(job)
+    job.status = JobStatus.RUNNING
+    journal.record(job, pid=10, startTicks=20)
+    other = make_job(str(tmp_path), "job.sh")
+    other.jobId = "2"
+    other.status = JobStatus.START_REQUESTED
+    journal.record(other, agent="unix:/tmp/agent.sock")
+    assert journal.load() == []
+    journal.flush()
+    entries = journal.load()
+    assert [e.job.jobId for e in entries] == ["1", "2"]
+    assert entries[0].job.status == JobStatus.RUNNING
+    assert (entries[0].pid, entries[0].startTicks) == (10, 20)
+    assert entries[1].agent == "unix:/tmp/agent.sock"
+    transitions = journal._connection.execute(
+        "SELECT jobId, status FROM transitions ORDER BY seq"
+    ).fetchall()
+    assert transitions == [
+        (1, "START_REQUESTED"),
+        (1, "RUNNING"),
+        (2, "START_REQUESTED"),
+    ]
+    journal.close()
+    reopened = JobJournal(str(tmp_path / "journal.db"))
+    assert len(reopened.load()) == 2
+    reopened.close()
+
+
+def test_journal_prunes_transitions(tmp_path, mocker):
+    journal = JobJournal(str(tmp_path / "journal.db"), retention=60)
+    job = make_job(str(tmp_path), "job.sh")
+    job.jobId = "1"
+    job.status = JobStatus.START_REQUESTED
+    clock = mocker.patch("app.utils.jobjournal.time.time", return_value=0.0)
+    journal.record(job)
+    journal.flush()
+    clock.return_value = 100.0
+    job.status = JobStatus.RUNNING
+    journal.record(job)
+    journal.flush()
+    transitions = journal._connection.execute(
+        "SELECT jobId, status FROM transitions ORDER BY seq"
+    ).fetchall()
+    assert transitions == [(1, "RUNNING")]
+    assert journal.load()[0].job.status == JobStatus.RUNNING
+    journal.close()
+
+
+def test_journal_prunes_stopped_jobs(tmp_path, mocker):
+    journal = JobJournal(str(tmp_path / "journal.db"), retention=60)
+    clock = mocker.patch("app.utils.jobjournal.time.time", return_value=0.0)
+    for jobId, status in [
+        ("1", JobStatus.STOPPED),
+        ("2", JobStatus.RUNNING),
+        ("3", JobStatus.STOPPED),
+    ]:
+        job = make_job(str(tmp_path), "job.sh")
+        job.jobId = jobId
+        job.status = status
+        journal.record(job)
+    journal.flush()
+    clock.return_value = 100.0
+    journal.flush()
+    # The last job is kept, so that its id is not given again
+    assert [e.job.jobId for e in journal.load()] == ["1", "2", "3"]
+    job.jobId = "4"
+    job.status = JobStatus.START_REQUESTED
+    journal.record(job)
+    journal.flush()
+    assert [e.job.jobId for e in journal.load()] == ["2", "4"]
+    journal.close()
+
+
+def test_journal_adds_missing_columns(tmp_path):
+    path = str(tmp_path / "journal.db")
+    connection = sqlite3.connect(path)
+    connection.execute(
+        "CREATE TABLE jobs (jobId INTEGER PRIMARY KEY, job TEXT NOT NULL, "
+        + "pid INTEGER, startTicks INTEGER, agent TEXT)"
+    )
+    job = make_job(str(tmp_path), "job.sh")
+    job.jobId = "1"
+    connection.execute(
+        "INSERT INTO jobs VALUES (1, ?, NULL, NULL, NULL)", (job.json(),)
+    )
+    connection.commit()
+    connection.close()
+    journal = JobJournal(path)
+    entries = journal.load()
+    assert [e.job.jobId for e in entries] == ["1"]
+    assert not entries[0].preempted
+    journal.close()
+
+
+@pytest.fixture
+def journal(tmp_path, monkeypatch):
+    monkeypatch.setattr(Settings, "journal", str(tmp_path / "journal.db"))
+    monkeypatch.setattr(TaskScheduler, "JOURNAL", None)
+    yield TaskScheduler.journal()
+    TaskScheduler.close()
+
+
+@pytest.mark.asyncio
+async def test_restore_from_journal(tmp_path, journal):
+    script = make_script(tmp_path / "job.sh", "sleep 30\n")
+    alive = subprocess.Popen(["sleep", "30"], start_new_session=True)
+    entries = [
+        (JobStatus.STOPPED, None, None),
+        (JobStatus.RUNNING, alive.pid, process_start_ticks(alive.pid)),
+        (JobStatus.RUNNING, alive.pid, 0),
+        (JobStatus.START_REQUESTED, None, None),
+    ]
+    for i, (status, pid, ticks) in enumerate(entries):
+        job = make_job(str(tmp_path), script)
+        job.jobId = str(i + 1)
+        job.status = status
+        journal.record(job, pid=pid, startTicks=ticks)
+    journal.flush()
+
+    await TaskScheduler.restore()
+    assert sorted(TaskScheduler.jobs().keys()) == ["1", "2", "3", "4"]
+    assert sorted(TaskScheduler.tasks().keys()) == ["2", "4"]
+    assert TaskScheduler.jobs()["1"].status == JobStatus.STOPPED
+    assert TaskScheduler.jobs()["2"].status == JobStatus.RUNNING
+    assert TaskScheduler.jobs()["3"].status == JobStatus.STOPPED
+    await wait_for_status("4", JobStatus.RUNNING)
+    assert TaskScheduler.processes()["2"].pid == alive.pid
+
+    repo = factory("INTERNAL")
+    job = await repo.submit_job(make_job(str(tmp_path), script))
+    assert job.jobId == "5"
+    for jobId in ["2", "4", "5"]:
+        await repo.stop_job(jobId)
+        await wait_for_status(jobId, JobStatus.STOPPED)
+    assert alive.wait(timeout=5) != 0
+    journal.flush()
+    statuses = {e.job.jobId: e.job.status for e in journal.load()}
+    assert set(statuses.values()) == {JobStatus.STOPPED}
+
+
+@pytest.mark.asyncio
+async def test_restore_stopping_and_preempted(tmp_path, journal, monkeypatch):
+    script = make_script(tmp_path / "job.sh", "sleep 30\n")
+    # Ignores the first SIGTERM, so that only the escalation ends it
+    stubborn = subprocess.Popen(
+        ["bash", "-c", "trap '' TERM; sleep 30"], start_new_session=True
+    )
+    preempted = subprocess.Popen(["sleep", "30"], start_new_session=True)
+    entries = [
+        (JobStatus.STOPPING, stubborn.pid, False),
+        (JobStatus.STOPPING, preempted.pid, True),
+        (JobStatus.STOPPING, None, True),
+    ]
+    for i, (status, pid, wasPreempted) in enumerate(entries):
+        job = make_job(str(tmp_path), script)
+        job.jobId = str(i + 1)
+        job.status = status
+        ticks = process_start_ticks(pid) if pid is not None else None
+        journal.record(job, pid=pid, startTicks=ticks, preempted=wasPreempted)
+    journal.flush()
+
+    monkeypatch.setattr(Settings, "stop_grace_period", 0.2)
+    await TaskScheduler.restore()
+    await wait_for_status("1", JobStatus.STOPPED)
+    assert stubborn.wait(timeout=5) != 0
+    assert preempted.wait(timeout=5) != 0
+    # Preempted jobs are queued again, whether alive or not
+    await wait_for_status("2", JobStatus.RUNNING)
+    await wait_for_status("3", JobStatus.RUNNING)
+    repo = factory("INTERNAL")
+    for jobId in ["2", "3"]:
+        await repo.stop_job(jobId)
+        await wait_for_status(jobId, JobStatus.STOPPED)
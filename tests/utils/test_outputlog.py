@@ -0,0 +1,57 @@
+from app.utils.outputlog import OutputLog
+
+
+def write_lines(path, start: int, end: int):
+    with open(path, "a") as f:
+        for i in range(start, end):
+            f.write(f"line {i}\n")
+
+
+def test_tail_from_buffer(tmp_path):
+    path = tmp_path / "job.o1"
+    log = OutputLog(str(path), maxLines=10)
+    assert log.tail(5) == (0, 0, "")
+    write_lines(path, 0, 3)
+    assert log.tail(5) == (0, 21, "line 0\nline 1\nline 2\n")
+    with open(path, "a") as f:
+        f.write("partial")
+    offset, size, content = log.tail(2)
+    assert content == "line 2\npartial"
+    assert offset == 14
+    assert size == 28
+    with open(path, "a") as f:
+        f.write(" line\n")
+    write_lines(path, 3, 20)
+    offset, size, content = log.tail(3)
+    assert content == "line 17\nline 18\nline 19\n"
+    assert offset == size - 24
+    assert len(log.lines) == 10
+
+
+def test_tail_from_file(tmp_path, monkeypatch):
+    path = tmp_path / "job.o1"
+    log = OutputLog(str(path), maxLines=10)
+    monkeypatch.setattr(OutputLog, "BLOCK_SIZE", 16)
+    write_lines(path, 0, 100)
+    offset, size, content = log.tail(30)
+    assert content.split("\n")[:-1] == [f"line {i}" for i in range(70, 100)]
+    with open(path, "rb") as f:
+        f.seek(offset)
+        assert f.read().decode() == content
+    # Only the appended bytes are read into the buffer
+    monkeypatch.setattr(OutputLog, "MAX_READ", 100)
+    write_lines(path, 100, 200)
+    offset, size, content = log.tail(5)
+    assert content.split("\n")[:-1] == [f"line {i}" for i in range(195, 200)]
+    assert log.skipped
+    assert log.lines[0][1] == "line 190"
+
+
+def test_read_range(tmp_path, monkeypatch):
+    path = tmp_path / "job.o1"
+    write_lines(path, 0, 10)
+    log = OutputLog(str(path))
+    assert log.read_range(7, 14) == (7, 70, "line 1\nline 2\n")
+    assert log.read_range(100, 10) == (70, 70, "")
+    monkeypatch.setattr(OutputLog, "MAX_READ", 4)
+    assert log.read_range(0, 100) == (0, 70, "line")
@@ -0,0 +1,188 @@
+from app.adapters.programpathrepository import (
+    AbstractProgramPathRepository,
+    PEMAWSProgramPathRepository,
+)
+from app.models.job import Job
+from app.models.program import Program
+from app.utils.programcatalog import ProgramCatalog, version_key
+from tests.utils.conftest import rooted_rules
+import os
+import pytest
+import time
+
+
+def make_program(programId: str, version: str, executablePath: str):
+    return Program(
+        programId=programId,
+        name="NEWAVE",
+        clusterId="0",
+        version=version,
+        installationDirectory=f"/tmp/NEWAVE/{version}",
+        isManaged=True,
+        executablePath=executablePath,
+        args=["N_PROC"],
+    )
+
+
+class CountingProgramPathRepository(AbstractProgramPathRepository):
+    CALLS = 0
+    PROGRAMS = [make_program("NW0", "v29", "/jobs/mpi_newave.job 29")]
+
+    @classmethod
+    async def list_programs(cls):
+        cls.CALLS += 1
+        return list(cls.PROGRAMS)
+
+
+def make_job(programId: str, programVersion=None) -> Job:
+    return Job(
+        jobId=None,
+        status=None,
+        name=None,
+        startTime=None,
+        lastStatusUpdateTime=None,
+        endTime=None,
+        clusterId="0",
+        workingDirectory="/tmp",
+        reservedSlots=64,
+        programId=programId,
+        programVersion=programVersion,
+        scriptFile=None,
+        args=["--debug"],
+        resourceUsage=None,
+    )
+
+
+@pytest.mark.asyncio
+async def test_resolve_job():
+    catalog = ProgramCatalog(CountingProgramPathRepository)
+    job = make_job("NW0")
+    assert await catalog.resolve(job) is None
+    assert job.scriptFile == "/jobs/mpi_newave.job"
+    assert job.args == ["29", "64", "--debug"]
+    assert job.name == "NEWAVE-v29"
+    job = make_job("NEWAVE", "v29")
+    assert await catalog.resolve(job) is None
+    assert job.programId == "NW0"
+    assert CountingProgramPathRepository.CALLS == 1
+
+
+@pytest.mark.asyncio
+async def test_resolve_job_not_found():
+    catalog = ProgramCatalog(CountingProgramPathRepository)
+    CountingProgramPathRepository.PROGRAMS.append(
+        make_program("NW1", "v30", "/jobs/mpi_newave.job 30")
+    )
+    r = await catalog.resolve(make_job("NEWAVE"))
+    assert r.code == 400
+    r = await catalog.resolve(make_job("NEWAVE", "v31"))
+    assert r.code == 404
+    CountingProgramPathRepository.PROGRAMS.pop()
+
+
+def install(root, version: str, age: float = 10.0):
+    path = root / version
+    path.mkdir(parents=True)
+    (path / f"mpi_newave{version}.job").write_text("")
+    backdate(path, age)
+    backdate(root, age)
+
+
+def backdate(path, age: float):
+    # Directories changed in the last instants are not trusted
+    past = time.time() - age
+    os.utime(path, (past, past))
+
+
+@pytest.mark.asyncio
+async def test_catalog_revalidation(tmp_path):
+    class LocalProgramPathRepository(PEMAWSProgramPathRepository):
+        RULES = rooted_rules(PEMAWSProgramPathRepository, tmp_path)
+
+    install(tmp_path / "NEWAVE", "v29", 20.0)
+    (tmp_path / "DECOMP").mkdir()
+    backdate(tmp_path / "DECOMP", 20.0)
+    catalog = ProgramCatalog(LocalProgramPathRepository)
+    programs = await catalog.list_programs()
+    assert [p.version for p in programs] == ["v29"]
+    version = catalog.version
+    await catalog.list_programs()
+    assert catalog.scans == 1
+    install(tmp_path / "NEWAVE", "v30")
+    programs = await catalog.list_programs()
+    assert sorted([p.version for p in programs]) == ["v29", "v30"]
+    assert catalog.scans == 2
+    assert catalog.version != version
+    # A version fixed in place only changes its own directory
+    (tmp_path / "NEWAVE" / "v29" / "mpi_newavev29.job").unlink()
+    backdate(tmp_path / "NEWAVE" / "v29", 5.0)
+    programs = await catalog.list_programs()
+    assert [p.version for p in programs] == ["v30"]
+    assert catalog.scans == 3
+    # Recent changes are listed again until they settle
+    install(tmp_path / "NEWAVE", "v31", 0.0)
+    await catalog.list_programs()
+    await catalog.list_programs()
+    assert catalog.scans == 5
+
+
+@pytest.mark.asyncio
+async def test_stable_program_ids(tmp_path):
+    class LocalProgramPathRepository(PEMAWSProgramPathRepository):
+        RULES = rooted_rules(PEMAWSProgramPathRepository, tmp_path)
+
+    install(tmp_path / "NEWAVE", "v29")
+    (tmp_path / "DECOMP").mkdir()
+    catalog = ProgramCatalog(LocalProgramPathRepository)
+    program = await catalog.get("NW-v29")
+    for i in range(30, 40):
+        install(tmp_path / "NEWAVE", f"v{i}")
+    await catalog.list_programs(refresh=True)
+    assert await catalog.get("NW-v29") == program
+    assert (await catalog.find("NEWAVE", "v35")).programId == "NW-v35"
+    assert (await catalog.get("NW-v40")).code == 404
+
+
+def test_version_key():
+    versions = ["v28.16.4", "v29", "v28.6.2", "v28", "v28.16.4a", "v3"]
+    assert sorted(versions, key=version_key) == [
+        "v3",
+        "v28",
+        "v28.6.2",
+        "v28.16.4",
+        "v28.16.4a",
+        "v29",
+    ]
+    assert version_key("19.0.24") < version_key("19.0.100")
+    assert version_key("v31") == version_key("31")
+
+
+@pytest.mark.asyncio
+async def test_version_index(tmp_path):
+    class LocalProgramPathRepository(PEMAWSProgramPathRepository):
+        RULES = rooted_rules(PEMAWSProgramPathRepository, tmp_path)
+
+    for v in ["v30.1", "v28.16.4", "v31", "v28.6.2", "v31.0.1"]:
+        install(tmp_path / "NEWAVE", v)
+    (tmp_path / "DECOMP").mkdir()
+    backdate(tmp_path / "DECOMP", 10.0)
+    catalog = ProgramCatalog(LocalProgramPathRepository)
+    programs = await catalog.list_programs()
+    assert [p.version for p in programs] == [
+        "v28.6.2",
+        "v28.16.4",
+        "v30.1",
+        "v31",
+        "v31.0.1",
+    ]
+    assert catalog.latest("NEWAVE").version == "v31.0.1"
+    assert catalog.latest("DECOMP") is None
+    r = await catalog.query("NEWAVE", minVersion="30")
+    assert [p.version for p in r] == ["v30.1", "v31", "v31.0.1"]
+    r = await catalog.query("NEWAVE", minVersion="v28.10", belowVersion="31")
+    assert [p.version for p in r] == ["v28.16.4", "v30.1"]
+    r = await catalog.query(version="latest", belowVersion="31")
+    assert [p.version for p in r] == ["v30.1"]
+    assert (await catalog.find("NEWAVE", "latest")).version == "v31.0.1"
+    assert (await catalog.find("NW-v31", "latest")).version == "v31"
+    assert catalog.scans == 1
@@ -0,0 +1,67 @@
+import json
+import pytest
+from app.utils.programrules import ProgramRule, compile_rules
+
+
+def test_match():
+    rule = ProgramRule(
+        "DESSEM", "DS", "/tmp", entry="dessem_{version}", kind="file"
+    )
+    assert rule.match("dessem_19.0.24") == {"version": "19.0.24"}
+    assert rule.match("dessem.lic") is None
+    assert rule.match("xdessem_19") is None
+    assert rule.entry_of("19.0.24") == "dessem_19.0.24"
+    assert rule.command_of("/tmp/dessem_19", {"version": "19"}, None) == (
+        "/tmp/dessem_19"
+    )
+
+
+def test_named_groups():
+    rule = ProgramRule(
+        "NEWAVE",
+        "NW",
+        "/tmp",
+        version=r"v(?P<tag>\d+)",
+        command="/jobs/mpi_newave.job {tag}",
+    )
+    groups = rule.match("v29")
+    assert groups == {"version": "v29", "tag": "29"}
+    assert rule.command_of("/tmp/v29", groups, None) == (
+        "/jobs/mpi_newave.job 29"
+    )
+    assert rule.match("v29.1") is None
+    assert rule.entry_of("29") is None
+
+
+@pytest.mark.parametrize(
+    "spec",
+    [
+        {"entry": "newave"},
+        {"kind": "link"},
+        {"kind": "file", "executable": "mpi_newave"},
+        {"command": "{tag}"},
+        {"command": "{executable}"},
+        {"version": "v(29"},
+        {"unknown": True},
+    ],
+)
+def test_invalid_rules(tmp_path, spec):
+    path = tmp_path / "rules.json"
+    spec = {"name": "NEWAVE", "idPrefix": "NW", "root": "/tmp", **spec}
+    path.write_text(json.dumps({"programs": [spec]}))
+    with pytest.raises(ValueError):
+        compile_rules(str(path))
+
+
+def test_repeated_rules(tmp_path):
+    path = tmp_path / "rules.json"
+    spec = {"name": "NEWAVE", "idPrefix": "NW", "root": "/tmp"}
+    path.write_text(json.dumps({"programs": [spec, spec]}))
+    with pytest.raises(ValueError):
+        compile_rules(str(path))
+
+
+@pytest.mark.parametrize("name", ["pemaws", "tuber"])
+def test_example_rules(name):
+    rules = compile_rules(f"rules/{name}.json")
+    assert "NEWAVE" in [r.name for r in rules]
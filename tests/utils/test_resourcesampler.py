@@ -0,0 +1,75 @@
+from app.utils.resourcesampler import ResourceSampler, B_TO_GB
+from app.utils.taskscheduler import TaskScheduler
+from app.adapters.schedulerrepository import factory
+from app.internal.settings import Settings
+from app.models.jobstatus import JobStatus
+from tests.utils.conftest import make_job, make_script, wait_for_status
+import asyncio
+import pytest
+
+pytestmark = pytest.mark.usefixtures("clean_scheduler")
+
+
+def write_process(root, pid, ppid, ticks, rss, io):
+    # utime, stime, cutime and cstime are fields 14 to 17, rss is
+    # field 24 and delayacct_blkio_ticks is field 42
+    fields = ["S", str(ppid)] + ["0"] * 50
+    fields[11] = str(ticks)
+    fields[21] = str(rss)
+    fields[39] = "10"
+    (root / str(pid)).mkdir()
+    (root / str(pid) / "stat").write_text(
+        f"{pid} (some (name)) " + " ".join(fields)
+    )
+    (root / str(pid) / "io").write_text(
+        f"rchar: {io}\nwchar: {io}\nread_bytes: 0\n"
+    )
+
+
+def test_sample_process_trees(tmp_path):
+    write_process(tmp_path, 1, 0, 100, 10, 0)
+    write_process(tmp_path, 10, 1, 100, 1000, B_TO_GB)
+    write_process(tmp_path, 11, 10, 200, 3000, B_TO_GB)
+    write_process(tmp_path, 12, 11, 300, 4000, 0)
+    write_process(tmp_path, 20, 1, 500, 2000, 0)
+    (tmp_path / "self").mkdir()
+    sampler = ResourceSampler(procRoot=str(tmp_path))
+    sampler.clockTicks = 100
+    sampler.pageSize = B_TO_GB // 1000
+    usages = sampler.sample({"1": 10, "2": 20, "3": 30})
+    assert set(usages.keys()) == {"1", "2"}
+    assert usages["1"].cpuSeconds == 6.0
+    assert usages["1"].instantTotalMemory == pytest.approx(8.0, 1e-3)
+    assert usages["1"].maxTotalMemory == usages["1"].instantTotalMemory
+    assert usages["1"].processIO == 4.0
+    assert usages["1"].processIOWaiting == 0.3
+    assert usages["2"].cpuSeconds == 5.0
+    # The memory usage is integrated over the CPU time
+    write_process(tmp_path, 21, 20, 500, 2000, 0)
+    usages = sampler.sample({"2": 20})
+    assert usages["2"].cpuSeconds == 10.0
+    assert usages["2"].memoryCpuSeconds == pytest.approx(
+        5.0 * 2.0 + 5.0 * 4.0, 1e-3
+    )
+    assert list(sampler.states.keys()) == ["2"]
+
+
+@pytest.mark.asyncio
+async def test_internal_jobs_are_sampled(tmp_path, monkeypatch):
+    monkeypatch.setattr(Settings, "sampling_interval", 0.1)
+    repo = factory("INTERNAL")
+    script = make_script(
+        tmp_path / "job.sh", "(while true; do :; done) &\nwait\n"
+    )
+    job = await repo.submit_job(make_job(str(tmp_path), script))
+    await wait_for_status(job.jobId, JobStatus.RUNNING)
+    for _ in range(50):
+        usage = TaskScheduler.jobs()[job.jobId].resourceUsage
+        if usage is not None and usage.cpuSeconds > 0.1:
+            break
+        await asyncio.sleep(0.1)
+    assert usage is not None
+    assert usage.cpuSeconds > 0.1
+    assert usage.maxTotalMemory > 0.0
+    await repo.stop_job(job.jobId)
+    await wait_for_status(job.jobId, JobStatus.STOPPED)
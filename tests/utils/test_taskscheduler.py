@@ -0,0 +1,440 @@
+from app.utils.taskscheduler import TaskScheduler
+from app.adapters.schedulerrepository import factory
+from app.internal.settings import Settings
+from app.models.job import Job
+from app.models.jobarray import JobArray
+from app.models.jobstatus import JobStatus
+from app.models.workflow import Workflow, WorkflowStage
+from tests.utils.conftest import make_job, make_script, wait_for_status
+from datetime import timedelta
+import asyncio
+import os
+import pytest
+
+
+async def wait_for_stop_latency(jobId: str, timeout=5.0) -> float:
+    for _ in range(int(timeout / 0.05)):
+        latency = TaskScheduler.stop_latency(jobId)
+        if latency is not None:
+            return latency
+        await asyncio.sleep(0.05)
+    raise TimeoutError(f"job {jobId} was not stopped")
+
+
+pytestmark = pytest.mark.usefixtures("clean_scheduler")
+
+
+@pytest.mark.asyncio
+async def test_stop_running_job(tmp_path):
+    repo = factory("INTERNAL")
+    script = make_script(tmp_path / "job.sh", "sleep 30\n")
+    job = await repo.submit_job(make_job(str(tmp_path), script))
+    await wait_for_status(job.jobId, JobStatus.RUNNING)
+    assert TaskScheduler.free_slots() == 4
+    r = await repo.stop_job(job.jobId)
+    assert r.status == JobStatus.STOPPING
+    assert TaskScheduler.free_slots() == 8
+    await wait_for_status(job.jobId, JobStatus.STOPPED)
+    assert await wait_for_stop_latency(job.jobId) < 5.0
+    assert job.jobId not in TaskScheduler.tasks()
+    assert job.endTime is not None
+
+
+@pytest.mark.asyncio
+async def test_stop_running_job_escalates_to_sigkill(tmp_path, monkeypatch):
+    monkeypatch.setattr(Settings, "stop_grace_period", 0.2)
+    repo = factory("INTERNAL")
+    script = make_script(
+        tmp_path / "job.sh", "trap '' TERM\nwhile true; do sleep 0.1; done\n"
+    )
+    job = await repo.submit_job(make_job(str(tmp_path), script))
+    await wait_for_status(job.jobId, JobStatus.RUNNING)
+    await asyncio.sleep(0.2)
+    await repo.stop_job(job.jobId)
+    await wait_for_status(job.jobId, JobStatus.STOPPED)
+    assert await wait_for_stop_latency(job.jobId) >= 0.2
+
+
+@pytest.mark.asyncio
+async def test_stop_queued_job(tmp_path):
+    repo = factory("INTERNAL")
+    script = make_script(tmp_path / "job.sh", "sleep 30\n")
+    running = await repo.submit_job(make_job(str(tmp_path), script, 8))
+    await wait_for_status(running.jobId, JobStatus.RUNNING)
+    queued = await repo.submit_job(make_job(str(tmp_path), script, 8))
+    await wait_for_status(queued.jobId, JobStatus.START_REQUESTED)
+    await repo.stop_job(queued.jobId)
+    await wait_for_status(queued.jobId, JobStatus.STOPPED)
+    assert TaskScheduler.processes().get(queued.jobId) is None
+    await repo.stop_job(running.jobId)
+    await wait_for_status(running.jobId, JobStatus.STOPPED)
+
+
+@pytest.mark.asyncio
+async def test_stop_unknown_job():
+    repo = factory("INTERNAL")
+    r = await repo.stop_job("42")
+    assert r.code == 404
+
+
+@pytest.mark.asyncio
+async def test_concurrent_jobs_run_in_own_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(TaskScheduler, "MAX_SLOTS", 300)
+    repo = factory("INTERNAL")
+    script = make_script(
+        tmp_path / "job.sh", 'echo "$PWD $JOB_ID $NSLOTS $1" > out.txt\n'
+    )
+    cwd = os.getcwd()
+    jobs = []
+    for i in range(300):
+        wd = tmp_path / f"case {i}"
+        wd.mkdir()
+        job = make_job(str(wd), script, slots=1)
+        job.args = [f"arg {i}"]
+        jobs.append(await repo.submit_job(job))
+    await asyncio.wait_for(
+        asyncio.gather(*[t for t in TaskScheduler.tasks().values()]), 30.0
+    )
+    assert os.getcwd() == cwd
+    for i, job in enumerate(jobs):
+        wd = tmp_path / f"case {i}"
+        content = (wd / "out.txt").read_text().strip()
+        assert content == f"{wd} {job.jobId} 1 arg {i}"
+
+
+@pytest.mark.asyncio
+async def test_job_output_written_to_file(tmp_path):
+    repo = factory("INTERNAL")
+    script = make_script(
+        tmp_path / "job.sh",
+        "for i in $(seq 1 2000); do echo line $i; done\n" + "echo error >&2\n",
+    )
+    job = await repo.submit_job(make_job(str(tmp_path), script))
+    await wait_for_status(job.jobId, JobStatus.STOPPED)
+    path = tmp_path / f"teste.o{job.jobId}"
+    assert path.exists()
+    output = await repo.get_job_output(job.jobId, tail=2)
+    assert output.content == "line 2000\nerror\n"
+    assert output.size == path.stat().st_size
+    output = await repo.get_job_output(job.jobId, offset=0, length=14)
+    assert output.content == "line 1\nline 2\n"
+    output = await repo.get_job_output(job.jobId, offset=0, length=0)
+    assert output.content == ""
+    output = await repo.get_job_output("0")
+    assert output.code == 404
+    # The reader of a finished job is not kept
+    assert job.jobId not in TaskScheduler.OUTPUTS
+
+
+@pytest.mark.asyncio
+async def test_job_name_cannot_leave_output_directory(tmp_path):
+    repo = factory("INTERNAL")
+    job = make_job(str(tmp_path), make_script(tmp_path / "job.sh", ""))
+    job.name = "../../x"
+    response = await repo.submit_job(job)
+    assert response.code == 400
+    assert TaskScheduler.output_file(job) == str(tmp_path / "x.oNone")
+
+
+@pytest.mark.asyncio
+async def test_best_fit_packing(tmp_path):
+    repo = factory("INTERNAL")
+    script = make_script(tmp_path / "job.sh", "sleep 30\n")
+
+    def sized(slots: int, memory: float) -> Job:
+        job = make_job(str(tmp_path), script, slots)
+        job.reservedMemory = memory
+        return job
+
+    big = await repo.submit_job(sized(2, 12.0))
+    await wait_for_status(big.jobId, JobStatus.RUNNING)
+    # Does not fit in memory, while smaller jobs are started
+    hungry = await repo.submit_job(sized(2, 8.0))
+    small = await repo.submit_job(sized(2, 2.0))
+    await wait_for_status(small.jobId, JobStatus.RUNNING)
+    assert TaskScheduler.jobs()[hungry.jobId].status == (
+        JobStatus.START_REQUESTED
+    )
+    metrics = TaskScheduler.metrics()
+    assert metrics.usedSlots == 4
+    assert metrics.usedMemory == 14.0
+    assert metrics.slotUtilization == 0.5
+    assert metrics.queuedJobs == 1
+    # When the big job ends, the job that fills the free capacity
+    # best is started before the one submitted earlier
+    medium = await repo.submit_job(sized(6, 14.0))
+    r = await repo.submit_job(sized(2, 32.0))
+    assert r.code == 400
+    assert TaskScheduler.metrics().rejectedJobs == 1
+    await repo.stop_job(big.jobId)
+    await wait_for_status(medium.jobId, JobStatus.RUNNING)
+    assert TaskScheduler.jobs()[hungry.jobId].status == (
+        JobStatus.START_REQUESTED
+    )
+    assert TaskScheduler.free_slots() == 0
+    metrics = TaskScheduler.metrics()
+    assert 0.0 < metrics.averageSlotUtilization <= 1.0
+    for j in [hungry, small, medium]:
+        await repo.stop_job(j.jobId)
+        await wait_for_status(j.jobId, JobStatus.STOPPED)
+
+
+@pytest.mark.asyncio
+async def test_waiting_jobs_age(tmp_path, monkeypatch):
+    monkeypatch.setattr(Settings, "priority_aging", 10)
+    repo = factory("INTERNAL")
+    script = make_script(tmp_path / "job.sh", "sleep 30\n")
+    running = await repo.submit_job(make_job(str(tmp_path), script, 8))
+    await wait_for_status(running.jobId, JobStatus.RUNNING)
+    old = make_job(str(tmp_path), script, 8)
+    old.priority = -2
+    old = await repo.submit_job(old)
+    # Waited long enough to overtake a job with higher priority
+    TaskScheduler.SUBMISSIONS[old.jobId] -= timedelta(seconds=30)
+    recent = make_job(str(tmp_path), script, 8)
+    recent = await repo.submit_job(recent)
+    await repo.stop_job(running.jobId)
+    await wait_for_status(old.jobId, JobStatus.RUNNING)
+    assert TaskScheduler.jobs()[recent.jobId].status == (
+        JobStatus.START_REQUESTED
+    )
+    for j in [old, recent]:
+        await repo.stop_job(j.jobId)
+        await wait_for_status(j.jobId, JobStatus.STOPPED)
+
+
+@pytest.mark.asyncio
+async def test_walltime_limit(tmp_path):
+    repo = factory("INTERNAL")
+    script = make_script(tmp_path / "job.sh", "sleep 30\n")
+    job = make_job(str(tmp_path), script)
+    job.walltime = 0
+    r = await repo.submit_job(job)
+    assert r.code == 400
+    job.walltime = 1
+    job = await repo.submit_job(job)
+    await wait_for_status(job.jobId, JobStatus.RUNNING)
+    await wait_for_status(job.jobId, JobStatus.STOPPED)
+    assert (job.endTime - job.startTime).total_seconds() < 3.0
+
+
+@pytest.mark.asyncio
+async def test_preemption(tmp_path, monkeypatch):
+    monkeypatch.setattr(Settings, "preemption", True)
+    repo = factory("INTERNAL")
+    script = make_script(tmp_path / "job.sh", "sleep 30\n")
+    low = await repo.submit_job(make_job(str(tmp_path), script, 8))
+    await wait_for_status(low.jobId, JobStatus.RUNNING)
+    urgent = make_job(str(tmp_path), script)
+    urgent.priority = 10
+    urgent = await repo.submit_job(urgent)
+    await wait_for_status(urgent.jobId, JobStatus.RUNNING)
+    await wait_for_status(low.jobId, JobStatus.START_REQUESTED)
+    assert low.jobId in TaskScheduler.tasks()
+    await repo.stop_job(urgent.jobId)
+    await wait_for_status(low.jobId, JobStatus.RUNNING)
+    await repo.stop_job(low.jobId)
+    await wait_for_status(low.jobId, JobStatus.STOPPED)
+
+
+@pytest.mark.asyncio
+async def test_preempted_jobs_release_slots_on_exit(tmp_path, monkeypatch):
+    monkeypatch.setattr(Settings, "preemption", True)
+    monkeypatch.setattr(Settings, "stop_grace_period", 5)
+    repo = factory("INTERNAL")
+    script = make_script(tmp_path / "job.sh", "sleep 30\n")
+    slow = make_script(
+        tmp_path / "slow.sh",
+        "trap 'sleep 0.5; exit 0' TERM\nsleep 30 &\nwait\n",
+    )
+    low = await repo.submit_job(make_job(str(tmp_path), slow, 8))
+    await wait_for_status(low.jobId, JobStatus.RUNNING)
+    await asyncio.sleep(0.1)
+    urgent = make_job(str(tmp_path), script)
+    urgent.priority = 10
+    urgent = await repo.submit_job(urgent)
+    await wait_for_status(low.jobId, JobStatus.STOPPING)
+    # The urgent job waits for the preempted one to exit
+    assert TaskScheduler.jobs()[urgent.jobId].status == (
+        JobStatus.START_REQUESTED
+    )
+    assert TaskScheduler.free_slots() == 0
+    await wait_for_status(urgent.jobId, JobStatus.RUNNING)
+    assert TaskScheduler.jobs()[low.jobId].status == (
+        JobStatus.START_REQUESTED
+    )
+    for j in [urgent, low]:
+        await repo.stop_job(j.jobId)
+        await wait_for_status(j.jobId, JobStatus.STOPPED)
+
+
+@pytest.mark.asyncio
+async def test_backfill_with_walltimes(tmp_path):
+    repo = factory("INTERNAL")
+    script = make_script(tmp_path / "job.sh", "sleep 30\n")
+
+    def timed(slots: int, walltime: int) -> Job:
+        job = make_job(str(tmp_path), script, slots)
+        job.walltime = walltime
+        return job
+
+    running = await repo.submit_job(timed(6, 1000))
+    await wait_for_status(running.jobId, JobStatus.RUNNING)
+    blocked = await repo.submit_job(timed(8, 1000))
+    # Would delay the blocked job, whose reservation takes all slots
+    late = await repo.submit_job(timed(2, 5000))
+    # Ends before the blocked job is expected to start
+    early = await repo.submit_job(timed(2, 10))
+    await wait_for_status(early.jobId, JobStatus.RUNNING)
+    assert TaskScheduler.jobs()[late.jobId].status == (
+        JobStatus.START_REQUESTED
+    )
+    assert TaskScheduler.jobs()[blocked.jobId].status == (
+        JobStatus.START_REQUESTED
+    )
+    for j in [running, early]:
+        await repo.stop_job(j.jobId)
+    await wait_for_status(blocked.jobId, JobStatus.RUNNING)
+    for j in [blocked, late]:
+        await repo.stop_job(j.jobId)
+        await wait_for_status(j.jobId, JobStatus.STOPPED)
+
+
+@pytest.mark.asyncio
+async def test_queues(tmp_path, monkeypatch):
+    monkeypatch.setattr(Settings, "queues", "dessem:2:borrow,newave:4")
+    monkeypatch.setattr(
+        Settings, "queue_routes", "NEWAVE:newave,DESSEM:dessem"
+    )
+    repo = factory("INTERNAL")
+    (tmp_path / "DESSEM").mkdir()
+    dessem = make_script(tmp_path / "DESSEM" / "job.sh", "sleep 30\n")
+    script = make_script(tmp_path / "job.sh", "sleep 30\n")
+
+    def newave(slots: int) -> Job:
+        job = make_job(str(tmp_path), script, slots)
+        job.name = "NEWAVE-v28"
+        return job
+
+    a = await repo.submit_job(newave(4))
+    await wait_for_status(a.jobId, JobStatus.RUNNING)
+    # Over the budget of the queue, even with free slots
+    b = await repo.submit_job(newave(2))
+    c = await repo.submit_job(make_job(str(tmp_path), dessem, 2))
+    # Borrows the idle slots of the default queue
+    d = await repo.submit_job(make_job(str(tmp_path), dessem, 2))
+    await wait_for_status(d.jobId, JobStatus.RUNNING)
+    e = await repo.submit_job(make_job(str(tmp_path), script, 2))
+    await asyncio.sleep(0.1)
+    assert [TaskScheduler.jobs()[j.jobId].queue for j in [a, c, e]] == [
+        "newave",
+        "dessem",
+        "default",
+    ]
+    assert TaskScheduler.jobs()[b.jobId].status == JobStatus.START_REQUESTED
+    assert TaskScheduler.jobs()[e.jobId].status == JobStatus.START_REQUESTED
+    queues = {q.name: q for q in await repo.list_queues()}
+    assert queues["newave"].usedSlots == 4
+    assert queues["newave"].queuedJobs == 1
+    assert queues["dessem"].usedSlots == 4
+    assert queues["dessem"].runningJobs == 2
+    assert queues["default"].slots == 2
+    assert queues["default"].maxWaitSeconds > 0.0
+    await repo.stop_job(a.jobId)
+    await wait_for_status(b.jobId, JobStatus.RUNNING)
+    await wait_for_status(e.jobId, JobStatus.RUNNING)
+    job = make_job(str(tmp_path), script)
+    job.queue = "missing"
+    r = await repo.submit_job(job)
+    assert r.code == 400
+    # Would never fit in the budget of a queue that does not borrow
+    r = await repo.submit_job(newave(6))
+    assert r.code == 400
+    job = make_job(str(tmp_path), dessem, 6)
+    job.queue = "dessem"
+    f = await repo.submit_job(job)
+    assert f.jobId is not None
+    for j in [b, c, d, e, f]:
+        await repo.stop_job(j.jobId)
+        await wait_for_status(j.jobId, JobStatus.STOPPED)
+
+
+@pytest.mark.asyncio
+async def test_job_array(tmp_path):
+    repo = factory("INTERNAL")
+    script = make_script(
+        tmp_path / "job.sh", 'echo "$1" > out.txt\nsleep "$1"\n'
+    )
+    directories = []
+    for i in range(5):
+        (tmp_path / f"case{i}").mkdir()
+        directories.append(str(tmp_path / f"case{i}"))
+    array = JobArray(
+        template=make_job(str(tmp_path), script, 2),
+        workingDirectories=directories,
+        args=[["0"], ["0"], ["30"], ["0"], ["30"]],
+    )
+    status = await repo.submit_job_array(array)
+    assert status.tasks == 5
+    arrayId = status.arrayId
+    for _ in range(100):
+        status = await repo.get_job_array(arrayId)
+        if status.status.get("STOPPED") == "1-2,4":
+            break
+        await asyncio.sleep(0.05)
+    assert status.status == {"STOPPED": "1-2,4", "RUNNING": "3,5"}
+    assert (tmp_path / "case4" / "out.txt").read_text() == "30\n"
+    for jobId in TaskScheduler.ARRAYS[arrayId]:
+        await repo.stop_job(jobId)
+    r = await repo.get_job_array("0")
+    assert r.code == 404
+    array.args = [["0"]]
+    r = await repo.submit_job_array(array)
+    assert r.code == 400
+
+
+@pytest.mark.asyncio
+async def test_workflow(tmp_path):
+    repo = factory("INTERNAL")
+    for name in ["newave", "decomp", "dessem", "report"]:
+        (tmp_path / name).mkdir()
+    script = make_script(
+        tmp_path / "job.sh",
+        'test -z "$1" || test -f "../$1/done" || exit 1\n'
+        + 'test "$2" = fail && exit 2\n'
+        + "sleep 0.2\ntouch done\n",
+    )
+
+    def stage(name, args, after=None):
+        job = make_job(str(tmp_path / name), script, 1)
+        job.args = args
+        return WorkflowStage(name=name, job=job, after=after)
+
+    status = await repo.submit_workflow(
+        Workflow(
+            stages=[
+                stage("decomp", ["newave", ""], ["newave"]),
+                stage("newave", ["", ""]),
+                stage("dessem", ["decomp", "fail"], ["decomp"]),
+                stage("report", ["dessem", ""], ["dessem"]),
+            ]
+        )
+    )
+    jobIds = status.jobs
+    assert int(jobIds["newave"]) < int(jobIds["decomp"])
+    assert TaskScheduler.jobs()[jobIds["decomp"]].dependencies == [
+        jobIds["newave"]
+    ]
+    await asyncio.wait(list(TaskScheduler.tasks().values()), timeout=10)
+    assert TaskScheduler.jobs()[jobIds["newave"]].exitCode == 0
+    assert TaskScheduler.jobs()[jobIds["decomp"]].exitCode == 0
+    assert TaskScheduler.jobs()[jobIds["dessem"]].exitCode == 2
+    # Stages after a failed one are stopped without being started
+    report = TaskScheduler.jobs()[jobIds["report"]]
+    assert report.status == JobStatus.STOPPED
+    assert report.startTime is None
+    assert report.exitCode is None
+    job = make_job(str(tmp_path), script)
+    job.dependencies = ["1000"]
+    r = await repo.submit_job(job)
+    assert r.code == 400
@@ -0,0 +1,190 @@
+from app.utils.taskscheduler import TaskScheduler
+from app.utils.agentpool import AgentPool
+from app.utils.workeragent import WorkerAgent, call
+from app.adapters.schedulerrepository import factory
+from app.models.jobstatus import JobStatus
+from tests.utils.conftest import make_job, make_script, wait_for_status
+import asyncio
+import pytest
+import pytest_asyncio
+
+
+@pytest_asyncio.fixture
+async def agents(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    TaskScheduler.TASKS.clear()
+    TaskScheduler.JOBS.clear()
+    TaskScheduler.PLACEMENTS.clear()
+    workers = [
+        WorkerAgent(f"unix:{tmp_path}/agent{i}.sock", 8, sampling_interval=0.1)
+        for i in range(2)
+    ]
+    for w in workers:
+        await w.start()
+    pool = AgentPool([w.address for w in workers], 0.1, 0.3)
+    monkeypatch.setattr(TaskScheduler, "AGENTS", pool)
+    monkeypatch.setattr(TaskScheduler, "POLL_INTERVAL", 0.05)
+    yield workers
+    for t in TaskScheduler.TASKS.values():
+        t.cancel()
+    await pool.close()
+    for w in workers:
+        await w.close()
+
+
+@pytest.mark.asyncio
+async def test_agent_rpc(agents, tmp_path):
+    script = make_script(tmp_path / "job.sh", "pwd > out.txt\n")
+    info = await call(agents[0].address, "info")
+    assert info == {
+        "slots": 8,
+        "usedSlots": 0,
+        "memory": agents[0].memory,
+        "usedMemory": 0.0,
+        "jobs": [],
+        "usage": {},
+    }
+    await call(
+        agents[0].address,
+        "launch",
+        {
+            "jobId": "1",
+            "command": [script],
+            "workingDirectory": str(tmp_path),
+            "reservedSlots": 4,
+        },
+    )
+    r = await call(agents[0].address, "wait", {"jobId": "1"})
+    assert r == {"returncode": 0}
+    assert (tmp_path / "out.txt").read_text().strip() == str(tmp_path)
+    r = await call(agents[0].address, "wait", {"jobId": "1"})
+    assert r == {"returncode": 0}
+    with pytest.raises(RuntimeError):
+        await call(agents[0].address, "wait", {"jobId": "2"})
+
+
+@pytest.mark.asyncio
+async def test_agent_requires_token(tmp_path):
+    with pytest.raises(ValueError):
+        await WorkerAgent("127.0.0.1:0", 8).start()
+    agent = WorkerAgent(f"unix:{tmp_path}/agent.sock", 8, token="secret")
+    await agent.start()
+    try:
+        with pytest.raises(RuntimeError):
+            await call(agent.address, "info")
+        with pytest.raises(RuntimeError):
+            await call(agent.address, "info", token="wrong")
+        info = await call(agent.address, "info", token="secret")
+        assert info["slots"] == 8
+    finally:
+        await agent.close()
+
+
+@pytest.mark.asyncio
+async def test_wait_retried_on_dropped_connection(agents, tmp_path, mocker):
+    repo = factory("INTERNAL")
+    script = make_script(tmp_path / "job.sh", "sleep 1\n")
+    pool = TaskScheduler.AGENTS
+    original = pool.call
+    dropped = []
+
+    async def flaky(node, method, params=None, timeout=None):
+        if method == "wait" and len(dropped) < 2:
+            dropped.append(node.address)
+            raise ConnectionResetError("connection dropped")
+        return await original(node, method, params, timeout)
+
+    mocker.patch.object(pool, "call", side_effect=flaky)
+    launch = mocker.spy(WorkerAgent, "launch")
+    job = await repo.submit_job(make_job(str(tmp_path), script, 8))
+    await wait_for_status(job.jobId, JobStatus.STOPPED)
+    assert len(dropped) == 2
+    assert launch.call_count == 1
+    assert TaskScheduler.jobs()[job.jobId].exitCode == 0
+
+
+@pytest.mark.asyncio
+async def test_agent_samples_once_per_interval(tmp_path, mocker):
+    agent = WorkerAgent(f"unix:{tmp_path}/agent.sock", 8, sampling_interval=60)
+    sample = mocker.spy(agent.sampler, "sample")
+    await agent.start()
+    try:
+        for _ in range(3):
+            await call(agent.address, "info")
+        assert sample.call_count == 1
+        agent.sampledAt -= 60
+        await call(agent.address, "info")
+        assert sample.call_count == 2
+    finally:
+        await agent.close()
+
+
+@pytest.mark.asyncio
+async def test_jobs_spread_across_agents(agents, tmp_path):
+    repo = factory("INTERNAL")
+    script = make_script(tmp_path / "job.sh", "sleep 30\n")
+    jobs = [
+        await repo.submit_job(make_job(str(tmp_path), script, 8))
+        for _ in range(3)
+    ]
+    await wait_for_status(jobs[0].jobId, JobStatus.RUNNING)
+    await wait_for_status(jobs[1].jobId, JobStatus.RUNNING)
+    assert TaskScheduler.free_slots() == 0
+    assert TaskScheduler.jobs()[jobs[2].jobId].status == (
+        JobStatus.START_REQUESTED
+    )
+    assert {agents[0].used_slots(), agents[1].used_slots()} == {8}
+    await repo.stop_job(jobs[0].jobId)
+    await wait_for_status(jobs[0].jobId, JobStatus.STOPPED)
+    await wait_for_status(jobs[2].jobId, JobStatus.RUNNING)
+    for j in jobs[1:]:
+        await repo.stop_job(j.jobId)
+        await wait_for_status(j.jobId, JobStatus.STOPPED)
+
+
+@pytest.mark.asyncio
+async def test_job_rescheduled_when_agent_is_lost(agents, tmp_path):
+    repo = factory("INTERNAL")
+    script = make_script(tmp_path / "job.sh", "sleep 30\n")
+    job = await repo.submit_job(make_job(str(tmp_path), script, 8))
+    await wait_for_status(job.jobId, JobStatus.RUNNING)
+    node = TaskScheduler.PLACEMENTS[job.jobId]
+    lost = [w for w in agents if w.address == node.address][0]
+    other = [w for w in agents if w.address != node.address][0]
+    await lost.close()
+    for _ in range(100):
+        if job.jobId in other.jobs:
+            break
+        await asyncio.sleep(0.05)
+    assert job.jobId in other.jobs
+    await wait_for_status(job.jobId, JobStatus.RUNNING)
+    await asyncio.sleep(0.5)
+    assert not node.alive
+    assert TaskScheduler.free_slots() == 0
+    info = await call(other.address, "info")
+    assert job.jobId in info["usage"]
+    await repo.stop_job(job.jobId)
+    await wait_for_status(job.jobId, JobStatus.STOPPED)
+
+
+@pytest.mark.asyncio
+async def test_refused_job_not_retried_forever(agents, tmp_path, mocker):
+    script = make_script(tmp_path / "job.sh", "true\n")
+    launch = mocker.spy(WorkerAgent, "launch")
+    # The directory only exists in the API host, not in the agents
+    job = make_job(str(tmp_path / "missing"), script, 8)
+    TaskScheduler.schedule_task(job)
+    await wait_for_status(job.jobId, JobStatus.STOPPED)
+    assert launch.call_count == TaskScheduler.LAUNCH_ATTEMPTS
+    assert TaskScheduler.free_slots() == 16
+
+
+@pytest.mark.asyncio
+async def test_agent_never_seen_is_lost(tmp_path):
+    pool = AgentPool([f"unix:{tmp_path}/missing.sock"], 0.05, 0.2)
+    await pool.start()
+    try:
+        await asyncio.wait_for(pool.nodes[0].lost.wait(), 2.0)
+        assert not pool.nodes[0].alive
+    finally:
+        await pool.close()
@@ -0,0 +1,51 @@
+from app.models.job import Job
+from app.models.workflow import Workflow, WorkflowStage
+from app.utils.workflow import stage_order
+
+
+def make_stage(name: str, after=None) -> WorkflowStage:
+    return WorkflowStage(
+        name=name,
+        job=Job(
+            jobId=None,
+            status=None,
+            name=name,
+            startTime=None,
+            lastStatusUpdateTime=None,
+            endTime=None,
+            clusterId="0",
+            workingDirectory="/tmp",
+            reservedSlots=1,
+            scriptFile="/tmp/job.sh",
+            args=None,
+            resourceUsage=None,
+        ),
+        after=after,
+    )
+
+
+def test_stage_order():
+    workflow = Workflow(
+        stages=[
+            make_stage("dessem", ["decomp"]),
+            make_stage("decomp", ["newave"]),
+            make_stage("newave"),
+            make_stage("report", ["newave", "dessem"]),
+        ]
+    )
+    stages = stage_order(workflow)
+    assert [s.name for s in stages] == ["newave", "decomp", "dessem", "report"]
+
+
+def test_stage_order_invalid():
+    assert stage_order(Workflow(stages=[make_stage("a", ["b"])])) is None
+    assert (
+        stage_order(Workflow(stages=[make_stage("a"), make_stage("a")]))
+        is None
+    )
+    assert (
+        stage_order(
+            Workflow(stages=[make_stage("a", ["b"]), make_stage("b", ["a"])])
+        )
+        is None
+    )